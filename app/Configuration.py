@@ -1,7 +1,7 @@
 import json
-import sqlite3
 
 from app.codes.clock.global_time import get_corrected_time_ms
+from app.codes.storage import get_cursor, write_transaction
 from app.constants import NEWRL_DB
 from app.nvalues import *
 
@@ -97,34 +97,27 @@ class Configuration:
         Configuration.set("CUSTODIAN_WALLET_LIST", json.dumps(CUSTODIAN_WALLET_LIST))
         Configuration.set("FOUNDATION_TREASURY_ADDRESS",FOUNDATION_TREASURY_ADDRESS)
         Configuration.set("ASQI_TREASURY_ADDRESS",ASQI_TREASURY_ADDRESS)
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        Configuration.updateDataFromDB(cur)
-        con.close()
+        Configuration.updateDataFromDB(get_cursor())
         return True
 
     @staticmethod
     def init_values_in_db():
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        count = cur.execute(f'''select count (*) from configuration''').fetchone()
-        if count is None or count[0] == 0:
-            for i in Configuration.setters:
-                value = Configuration.config(i)
-                queryParam = {"address": CONFIG_DAO_ADDRESS,
-                              "property_key": i,
-                              "property_value": value,
-                              "is_editable": True,
-                              "last_updated": get_corrected_time_ms()
-                              }
-                keys = ','.join(queryParam.keys())
-                question_marks = ','.join(list('?' * len(queryParam)))
-                values = tuple(queryParam.values())
-                cur.execute('INSERT OR IGNORE INTO  configuration (' + keys + ') VALUES (' + question_marks + ')',
-                            values)
-        cur.close()
-        con.commit()
-        con.close()
+        with write_transaction() as cur:
+            count = cur.execute(f'''select count (*) from configuration''').fetchone()
+            if count is None or count[0] == 0:
+                for i in Configuration.setters:
+                    value = Configuration.config(i)
+                    queryParam = {"address": CONFIG_DAO_ADDRESS,
+                                  "property_key": i,
+                                  "property_value": value,
+                                  "is_editable": True,
+                                  "last_updated": get_corrected_time_ms()
+                                  }
+                    keys = ','.join(queryParam.keys())
+                    question_marks = ','.join(list('?' * len(queryParam)))
+                    values = tuple(queryParam.values())
+                    cur.execute('INSERT OR IGNORE INTO  configuration (' + keys + ') VALUES (' + question_marks + ')',
+                                values)
 
     @staticmethod
     def updateDataFromDB(cur):
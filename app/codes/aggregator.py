@@ -1,24 +1,67 @@
 import logging
+import sqlite3
+from app.codes.fs.mempool_manager import transaction_exists_in_mempool
+from app.codes.serialization import encode
+from app.codes.signatureverifier import verify_signatures
+from app.codes.storage import get_cursor
+from app.codes.transactionmanager import get_public_key_from_address
 from app.codes.validator import validate as validate_transaction
-from app.codes.p2p.outgoing import propogate_transaction_batch_to_peers
-from app.constants import MAX_TRANSACTION_BATCH_SIZE
+from app.codes.p2p.outgoing import queue_transaction_announcement
+from app.constants import MAX_TRANSACTION_BATCH_SIZE, NEWRL_DB
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+def get_signature_tasks(transaction_list):
+    """Returns the (message, public_key, signature) checks needed by a batch"""
+    tasks = []
+    cur = get_cursor()
+    for transaction_data in transaction_list:
+        try:
+            transaction_code = transaction_data['transaction']['trans_code']
+            if transaction_exists_in_mempool(transaction_code):
+                continue
+        except (KeyError, TypeError) as e:
+            logger.warning(f'Skipping signature checks of transaction without a trans_code: {e!r}')
+            continue
+        try:
+            message = encode(transaction_data['transaction'])
+            signatures = list(transaction_data['signatures'])
+        except (KeyError, TypeError) as e:
+            logger.warning(f'Skipping signature checks of malformed transaction {transaction_code}: {e!r}')
+            continue
+        for signature in signatures:
+            try:
+                public_key = get_public_key_from_address(signature['wallet_address'], cur=cur)
+                msgsign = signature['msgsign']
+            except (KeyError, TypeError, sqlite3.Error) as e:
+                logger.warning(f'Skipping malformed signature of transaction {transaction_code}: {e!r}')
+                continue
+            if public_key is not None:
+                tasks.append((message, public_key, msgsign))
+    return tasks
+
+
 def process_transaction_batch(transaction_list, exclude_nodes_broadcast=None):
     """
         Validate and save a batch of transactions to mempool
         Return the accepted transactions
+
+        Signatures of the whole batch are verified first across worker
+        processes. Economics are then checked one transaction at a time
+        since each admission changes the pending balances.
     """
     if len(transaction_list) > MAX_TRANSACTION_BATCH_SIZE:
         logger.warn(f'Exceeded maximum batch {len(transaction_list)}')
         return [[], []]
+    verified_signatures = verify_signatures(get_signature_tasks(transaction_list))
     new_transactions = []
     failed_transactions = []
     for transaction_data in transaction_list:
         print('Received transaction: ', transaction_data)
-        validity = validate_transaction(transaction_data, propagate=False, validate_economics=True)
+        validity = validate_transaction(
+            transaction_data, propagate=False, validate_economics=True,
+            verified_signatures=verified_signatures)
         if validity['valid'] and validity['new_transaction']:
             new_transactions.append(transaction_data)
         else:
@@ -27,5 +70,6 @@ def process_transaction_batch(transaction_list, exclude_nodes_broadcast=None):
                 'msg': validity['msg']
             })
     if len(new_transactions) > 0:
-        propogate_transaction_batch_to_peers(new_transactions, exclude_nodes=exclude_nodes_broadcast)
+        queue_transaction_announcement(
+            [t['transaction']['trans_code'] for t in new_transactions])
     return [new_transactions, failed_transactions]
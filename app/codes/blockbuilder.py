@@ -0,0 +1,196 @@
+"""Selects mempool transactions for the next block proposal"""
+
+import heapq
+import json
+import logging
+
+from app.ntypes import TRANSACTION_MINER_ADDITION, TRANSACTION_WALLET_CREATION
+from ..constants import DEFAULT_TRANSACTION_EXECUTION_COST, MAX_BLOCK_EXECUTION_COST, MAX_BLOCK_PAYLOAD_BYTES, TRANSACTION_EXECUTION_COST
+from .transactionmanager import get_transaction_debits
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+SKIP_REASON_DUPLICATE = 'Duplicate transaction code'
+SKIP_REASON_BLOCK_BYTES = 'Does not fit in remaining block bytes'
+SKIP_REASON_BLOCK_COST = 'Does not fit in remaining block execution cost'
+SKIP_REASON_CONFLICT = 'Conflicts with a transaction already in the block'
+SKIP_REASON_INSUFFICIENT_BALANCE = 'Balance does not cover transactions already in the block'
+
+
+class BlockTemplate:
+    def __init__(self):
+        self.transactions = []
+        self.skipped = {}
+        self.execution_costs = {}
+        self.payload_bytes = 0
+        self.estimated_cost = 0
+
+    def skip(self, transaction, reason):
+        self.skipped[transaction['transaction']['trans_code']] = reason
+
+    def to_dict(self):
+        return {
+            'transactions': [
+                t['transaction']['trans_code'] for t in self.transactions],
+            'skipped': self.skipped,
+            'payload_bytes': self.payload_bytes,
+            'estimated_cost': self.estimated_cost,
+            'execution_costs_ms': self.execution_costs,
+        }
+
+
+def get_transaction_sender(transaction):
+    """Returns the first signer of a transaction"""
+    for signature in transaction.get('signatures', []):
+        if 'wallet_address' in signature:
+            return signature['wallet_address']
+    return None
+
+
+def get_payload_size(payload):
+    return len(json.dumps(payload))
+
+
+def get_execution_cost(transaction):
+    """Estimated cost of applying a transaction"""
+    return TRANSACTION_EXECUTION_COST.get(
+        transaction['transaction']['type'], DEFAULT_TRANSACTION_EXECUTION_COST)
+
+
+def get_fee_rate(transaction, size):
+    """Fee paid per byte of serialized transaction
+
+    Miner additions are free protocol transactions and always go first.
+    """
+    if transaction['transaction']['type'] == TRANSACTION_MINER_ADDITION:
+        return float('inf')
+    return transaction['transaction'].get('fee', 0) / size
+
+
+def get_exclusive_claims(transaction):
+    """State a transaction creates which no other transaction in the block may create"""
+    transaction_type = transaction['transaction']['type']
+    specific_data = transaction['transaction']['specific_data']
+    if transaction_type == TRANSACTION_WALLET_CREATION:
+        return [('wallet', specific_data['wallet_address'])]
+    if transaction_type == TRANSACTION_MINER_ADDITION:
+        return [('miner', specific_data['wallet_address'])]
+    return []
+
+
+def build_block_template(transactions, get_balances=None, check_transaction=None,
+                         max_bytes=MAX_BLOCK_PAYLOAD_BYTES, max_cost=MAX_BLOCK_EXECUTION_COST):
+    """Builds a block template from mempool transactions
+
+    Transactions are picked by fee rate. The transactions of a sender are
+    kept in timestamp order, so the sender's next transaction only competes
+    once the earlier one is taken or skipped. A transaction which does not
+    fit in the remaining bytes or execution cost is skipped and smaller
+    ones are still tried. get_balances receives the set
+    of (wallet, token) pairs debited by the candidates and returns their
+    confirmed balances. check_transaction returns a skip reason or None and
+    is called only for transactions which would otherwise be picked.
+    """
+    template = BlockTemplate()
+
+    queues = {}
+    seen = set()
+    for transaction in transactions:
+        transaction_code = transaction['transaction']['trans_code']
+        if transaction_code in seen:
+            template.skip(transaction, SKIP_REASON_DUPLICATE)
+            continue
+        seen.add(transaction_code)
+        queues.setdefault(get_transaction_sender(transaction), []).append(transaction)
+
+    debits = {}
+    sizes = {}
+    for sender_transactions in queues.values():
+        sender_transactions.sort(key=lambda t: t['transaction']['timestamp'])
+        for transaction in sender_transactions:
+            transaction_code = transaction['transaction']['trans_code']
+            debits[transaction_code] = get_transaction_debits(transaction)
+            sizes[transaction_code] = get_payload_size(transaction)
+
+    balances = None
+    if get_balances is not None:
+        keys = set()
+        for transaction_debits in debits.values():
+            keys.update(transaction_debits.keys())
+        balances = get_balances(keys)
+
+    heap = []
+    for sender, sender_transactions in queues.items():
+        _push_sender_head(heap, sender, sender_transactions, 0, sizes)
+
+    claimed = set()
+    spent = {}
+    while heap:
+        _, _, _, sender, position = heapq.heappop(heap)
+        sender_transactions = queues[sender]
+        transaction = sender_transactions[position]
+        _push_sender_head(heap, sender, sender_transactions, position + 1, sizes)
+
+        size = sizes[transaction['transaction']['trans_code']]
+        if template.payload_bytes + size > max_bytes:
+            template.skip(transaction, SKIP_REASON_BLOCK_BYTES)
+            continue
+        cost = get_execution_cost(transaction)
+        if template.estimated_cost + cost > max_cost:
+            template.skip(transaction, SKIP_REASON_BLOCK_COST)
+            continue
+
+        claims = get_exclusive_claims(transaction)
+        if any(claim in claimed for claim in claims):
+            template.skip(transaction, SKIP_REASON_CONFLICT)
+            continue
+
+        transaction_debits = debits[transaction['transaction']['trans_code']]
+        if balances is not None and any(
+                spent.get(key, 0) + amount > balances.get(key, 0)
+                for key, amount in transaction_debits.items()):
+            template.skip(transaction, SKIP_REASON_INSUFFICIENT_BALANCE)
+            continue
+
+        if check_transaction is not None:
+            reason = check_transaction(transaction)
+            if reason is not None:
+                template.skip(transaction, reason)
+                continue
+
+        claimed.update(claims)
+        for key, amount in transaction_debits.items():
+            spent[key] = spent.get(key, 0) + amount
+        template.transactions.append(transaction)
+        template.payload_bytes += size
+        template.estimated_cost += cost
+
+    return template
+
+
+def fit_receipts_in_block(receipts, max_bytes):
+    """Returns the leading receipts which fit in the given number of bytes"""
+    included = []
+    for receipt in receipts:
+        size = get_payload_size(receipt)
+        if size > max_bytes:
+            break
+        included.append(receipt)
+        max_bytes -= size
+    return included
+
+
+def _push_sender_head(heap, sender, sender_transactions, position, sizes):
+    if position >= len(sender_transactions):
+        return
+    transaction = sender_transactions[position]
+    heapq.heappush(heap, (
+        -get_fee_rate(transaction, sizes[transaction['transaction']['trans_code']]),
+        transaction['transaction']['timestamp'],
+        transaction['transaction']['trans_code'],
+        sender,
+        position
+    ))
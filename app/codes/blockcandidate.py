@@ -0,0 +1,275 @@
+"""Next block candidate kept up to date as transactions and blocks arrive"""
+
+import copy
+import logging
+import threading
+
+from app.codes.clock.global_time import get_corrected_time_ms
+from app.ntypes import TRANSACTION_MINER_ADDITION
+from ..constants import NEWRL_DB, TIME_MINER_BROADCAST_INTERVAL_SECONDS
+from .blockbuilder import build_block_template, get_execution_cost, get_payload_size
+from .db_updater import get_included_transaction_codes, get_wallet_token_balances
+from .fs.mempool_manager import get_transaction_wallets, mempool, remove_transaction_from_mempool
+from .state_updater import dry_run_transactions
+from .statewriter import PRIORITY_CANDIDATE, state_writer
+from .storage import get_cursor, read_snapshot, write_transaction
+from .transactionmanager import get_transaction_debits
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+CANDIDATE_REFRESH_DELAY_SECONDS = 0.2
+
+
+def should_include_transaction(transaction, my_last_block_index=0):
+    try:
+        if transaction['type'] == TRANSACTION_MINER_ADDITION:
+            broadcast_timestamp = transaction['specific_data']['broadcast_timestamp']
+            if broadcast_timestamp < get_corrected_time_ms() - TIME_MINER_BROADCAST_INTERVAL_SECONDS * 1000:
+                return False
+            software_version = transaction['specific_data']['software_version']
+            last_block_index = transaction['specific_data']['last_block_index']
+            # if software_version < SOFTWARE_VERSION or last_block_index < my_last_block_index - 100:
+            if last_block_index < my_last_block_index - 300:
+                return False
+    except Exception as e:
+        logger.error(f'Invalid transaction format {str(transaction)}, {str(e)}')
+        return False
+    return True
+
+
+def get_last_block_index(cur):
+    last_block = cur.execute(
+        'SELECT block_index FROM blocks ORDER BY block_index DESC LIMIT 1').fetchone()
+    return last_block[0] if last_block is not None else 0
+
+
+def get_affected_wallets(transaction):
+    wallets = set(get_transaction_wallets(transaction))
+    for wallet, _ in get_transaction_debits(transaction).keys():
+        wallets.add(wallet)
+    return wallets
+
+
+class BlockCandidate:
+    """Transactions ready to go into the next block
+
+    Every mempool transaction is checked against committed state once, when
+    it is admitted. When a block commits, pending transactions of the
+    wallets it touched are checked again. The ordered template is rebuilt in
+    the background whenever something changed, reading from a snapshot of
+    committed state. Its dry run on a rolled back savepoint is a low
+    priority state writer command. Proposing a block only copies the last
+    template built.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.pending_lock = threading.Lock()
+        self.admitted = {}
+        self.affected_wallets = {}
+        self.dirty = True
+        self.refresh_timer = None
+        self.checked = {}
+        self.dropped = {}
+        self.excluded = {}
+        self.template = None
+        self.template_block_index = None
+
+    def on_transaction_admitted(self, transaction):
+        """Queues a transaction which passed validation against committed state"""
+        with self.pending_lock:
+            self.admitted[transaction['transaction']['trans_code']] = transaction
+        self.schedule_refresh()
+
+    def on_block_added(self, block):
+        """Marks the wallets touched by a block for another check once it commits"""
+        block_index = block['index'] if 'index' in block else block['block_index']
+        wallets = set()
+        for transaction in block['text']['transactions']:
+            try:
+                wallets.update(get_affected_wallets(transaction))
+            except Exception:
+                continue
+        with self.pending_lock:
+            self.affected_wallets.setdefault(block_index, set()).update(wallets)
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        with self.pending_lock:
+            self.dirty = True
+            if self.refresh_timer is not None and self.refresh_timer.is_alive():
+                return
+            self.refresh_timer = threading.Timer(
+                CANDIDATE_REFRESH_DELAY_SECONDS, self.refresh_in_background)
+            self.refresh_timer.daemon = True
+            self.refresh_timer.start()
+
+    def refresh_in_background(self):
+        with self.pending_lock:
+            self.refresh_timer = None
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f'Could not refresh block candidate: {e}')
+        if self.dirty:
+            # Waiting on a block which has not committed yet
+            self.schedule_refresh()
+
+    def refresh(self):
+        with self.lock:
+            dry_run = None
+            while dry_run is None:
+                with read_snapshot() as cur:
+                    template, last_block_index = self._build(cur)
+                # The dry run writes inside savepoints it rolls back, so it
+                # runs on the writer after any block commits already queued.
+                # If one of them moved the chain on, build again.
+                dry_run = state_writer.submit(
+                    'dry_run_candidate', self._dry_run, template, last_block_index, priority=PRIORITY_CANDIDATE)
+            self._apply_dry_run(template, *dry_run)
+            template.skipped.update(self.excluded)
+            template.skipped.update(self.dropped)
+            self.template = template
+            self.template_block_index = last_block_index
+
+    def _build(self, cur):
+        last_block_index = get_last_block_index(cur)
+
+        with self.pending_lock:
+            self.dirty = False
+            admitted = self.admitted
+            self.admitted = {}
+            affected_wallets = set()
+            for block_index in list(self.affected_wallets.keys()):
+                if block_index > last_block_index:
+                    # The block is not committed yet. Check again on the next refresh.
+                    self.dirty = True
+                    continue
+                affected_wallets.update(self.affected_wallets.pop(block_index))
+
+        mempool_codes = set(mempool.get_transaction_codes())
+        recheck_codes = set()
+        for transaction_code, transaction in list(self.checked.items()):
+            if transaction_code not in mempool_codes:
+                del self.checked[transaction_code]
+            elif not should_include_transaction(transaction['transaction'], last_block_index):
+                recheck_codes.add(transaction_code)
+        for wallet in affected_wallets:
+            for transaction in mempool.get_transactions_for_wallet(wallet):
+                recheck_codes.add(transaction['transaction']['trans_code'])
+        for transaction_code, transaction in admitted.items():
+            if transaction_code in mempool_codes and transaction_code not in recheck_codes:
+                if should_include_transaction(transaction['transaction'], last_block_index):
+                    self.checked[transaction_code] = transaction
+                else:
+                    recheck_codes.add(transaction_code)
+        for transaction_code in mempool_codes:
+            if transaction_code not in self.checked:
+                recheck_codes.add(transaction_code)
+
+        self.dropped = {}
+        self.excluded = {}
+        recheck = {}
+        for transaction_code in recheck_codes:
+            transaction = mempool.get(transaction_code)
+            if transaction is not None:
+                recheck[transaction_code] = transaction
+        included_codes = get_included_transaction_codes(cur, recheck.keys())
+        debits = {}
+        for transaction_code, transaction in recheck.items():
+            if transaction_code in included_codes:
+                self._drop(transaction_code, 'Already included in chain')
+            elif not should_include_transaction(transaction['transaction'], last_block_index):
+                self._drop(transaction_code, 'Stale miner addition')
+            else:
+                try:
+                    debits[transaction_code] = get_transaction_debits(transaction)
+                except Exception:
+                    self._drop(transaction_code, 'Invalid transaction format')
+
+        # Fees and transfers of every payer are checked against one batch of balances
+        balances = get_wallet_token_balances(
+            cur, {key for transaction_debits in debits.values() for key in transaction_debits})
+        for transaction_code, transaction_debits in debits.items():
+            if any(amount > balances.get(key, 0) for key, amount in transaction_debits.items()):
+                # A later block may fund the payer, so the transaction is kept
+                self.checked.pop(transaction_code, None)
+                self.excluded[transaction_code] = 'Balance does not cover its fee and transfers'
+            else:
+                self.checked[transaction_code] = recheck[transaction_code]
+
+        template = build_block_template(
+            list(self.checked.values()),
+            get_balances=lambda keys: get_wallet_token_balances(cur, keys))
+        return template, last_block_index
+
+    def _dry_run(self, template, last_block_index):
+        """Dry runs the template on the writer thread
+
+        Returns the failed transaction codes and the execution costs, or
+        None when a block committed after the template was built.
+        """
+        with write_transaction() as cur:
+            if get_last_block_index(cur) != last_block_index:
+                return None
+            try:
+                return dry_run_transactions(cur, template.transactions, last_block_index + 1)
+            except Exception as e:
+                logger.error(f'Could not dry run block candidate: {e}')
+                return [], {}
+
+    def _apply_dry_run(self, template, failed, costs):
+        """Leaves template transactions which did not apply cleanly out of this candidate
+
+        Whether a transaction applies depends on state, so it stays in the
+        mempool and is tried again in the next candidate.
+        """
+        template.execution_costs = costs
+        if len(failed) == 0:
+            return
+        template.transactions = [
+            t for t in template.transactions if t['transaction']['trans_code'] not in failed]
+        template.payload_bytes = sum(get_payload_size(t) for t in template.transactions)
+        template.estimated_cost = sum(get_execution_cost(t) for t in template.transactions)
+        for transaction_code in failed:
+            self.excluded[transaction_code] = 'Failed to apply in dry run'
+            logger.info(f'Leaving transaction {transaction_code} out of the block candidate. It failed to apply in dry run')
+
+    def _drop(self, transaction_code, reason):
+        """Removes a transaction which can never go into a block from the mempool"""
+        self.checked.pop(transaction_code, None)
+        self.dropped[transaction_code] = reason
+        remove_transaction_from_mempool(transaction_code)
+        logger.info(f'Dropping transaction {transaction_code} from mempool. {reason}')
+
+    def snapshot(self):
+        """Returns the transactions for the next block and the template they came from
+
+        Returns the last template built, leaving changes to the background
+        refresh. The template is built here when there is none yet or it was
+        built on an earlier chain tip, whose transactions the blocks since
+        may include. Transactions which left the mempool since the template
+        was built are left out.
+        """
+        template = self.template
+        if template is None or self.template_block_index != get_last_block_index(get_cursor()):
+            self.refresh()
+            template = self.template
+        return [
+            copy.deepcopy(t) for t in template.transactions
+            if mempool.exists(t['transaction']['trans_code'])
+        ], template
+
+    def to_dict(self):
+        template = self.template
+        if template is None:
+            return {'transactions': [], 'skipped': {}, 'block_index': None}
+        result = template.to_dict()
+        result['block_index'] = self.template_block_index
+        return result
+
+
+block_candidate = BlockCandidate()
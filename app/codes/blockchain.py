@@ -2,7 +2,6 @@
 import logging
 import time
 import datetime
-import hashlib
 import json
 
 import sqlite3
@@ -11,10 +10,11 @@ from app.codes.clock.global_time import get_corrected_time_ms
 from app.codes.committeemanager import get_committee_for_current_block, get_committee_wallet_list_for_current_block, get_miner_for_current_block
 from app.codes.fs.archivemanager import archive_block
 # from app.codes.minermanager import get_committee_wallet_addresses
-from app.codes.receiptmanager import get_receipts_included_in_block_from_db, update_receipts_in_state
+from app.codes.receiptmanager import get_receipts_included_in_block_from_db, update_receipts_in_state, verified_receipts
 from app.ntypes import BLOCK_STATUS_MINING_TIMEOUT, BLOCK_STATUS_VALID
 
 from .fs.temp_manager import remove_block_from_temp
+from .storage import get_cursor, write_transaction
 from ..constants import BLOCK_TIME_INTERVAL_SECONDS, NEWRL_DB, NO_BLOCK_TIMEOUT
 from .utils import get_time_ms
 from .crypto import calculate_hash
@@ -22,6 +22,7 @@ from .state_updater import state_cleanup, update_db_states, update_miners, updat
 from .utils import get_time_ms
 from .auth.auth import get_node_wallet_address
 from .fs.mempool_manager import remove_transaction_from_mempool
+from .blockcandidate import block_candidate
 
 
 logging.basicConfig(level=logging.INFO)
@@ -59,12 +60,8 @@ class Blockchain:
         return block
 
     def get_block(self, block_index, cur=None):
-        new_cursor = False
         if cur is None:
-            con = sqlite3.connect(NEWRL_DB)
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            new_cursor = True
+            cur = get_cursor(row_factory=sqlite3.Row)
         block_cursor = cur.execute(
             'SELECT * FROM blocks where block_index=?', (block_index,)).fetchone()
         
@@ -73,9 +70,6 @@ class Blockchain:
         
         block = dict(block_cursor)
 
-        if new_cursor:
-            con.close()
-
         return block
 
     def proof_of_work(self, block):
@@ -94,8 +88,7 @@ class Blockchain:
 
     def calculate_hash(self, block):
         """Calculate hash of a given block using sha256"""
-        encoded_block = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(encoded_block).hexdigest()
+        return calculate_hash(block)
 
     def chain_valid(self, chain):
         """Validate a chain using previous hash and starting bytes"""
@@ -152,12 +145,10 @@ class Blockchain:
     def mine_empty_block(self, new_block_timestamp=None, block_status=BLOCK_STATUS_MINING_TIMEOUT):
         """Mine an empty block"""
         print("Mining empty block")
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
+        cur = get_cursor()
         last_block_cursor = cur.execute(
             'SELECT block_index, hash, timestamp FROM blocks ORDER BY block_index DESC LIMIT 1')
         last_block = last_block_cursor.fetchone()
-        con.close()
         last_block_index = last_block[0] if last_block is not None else 0
         last_block_hash = last_block[1] if last_block is not None else 0
         last_block_timestamp = last_block[2] if last_block is not None else 0
@@ -186,11 +177,8 @@ class Blockchain:
 
     def get_latest_ts(self, cur=None):
         """Get the timestamp of latest block"""
-        should_close_db_conn = False
         if not cur:
-            con = sqlite3.connect(NEWRL_DB)
-            cur = con.cursor()
-            should_close_db_conn = True
+            cur = get_cursor()
         last_block_cursor = cur.execute(
             'SELECT block_index, timestamp FROM blocks ORDER BY block_index DESC LIMIT 1')
         last_block = last_block_cursor.fetchone()
@@ -198,8 +186,6 @@ class Blockchain:
             ts = None
         else:
             ts = last_block[1]
-        if should_close_db_conn:
-            con.close()
         return ts
 
 
@@ -250,14 +236,23 @@ def add_block(cur, block, hash=None, is_state_reconstruction=False):
         transaction = transaction['transaction']
         transaction_code = transaction['transaction_code'] if 'transaction_code' in transaction else transaction['trans_code']
         remove_transaction_from_mempool(transaction_code)
+    block_candidate.on_block_added(block)
+    verified_receipts.clear_committed(block_index)
     remove_block_from_temp(block_index)
     return True
 
 
+def commit_block(block, hash=None, is_state_reconstruction=False):
+    """Adds a block in its own write transaction. Run on the state writer"""
+    with write_transaction() as cur:
+        return add_block(cur, block, hash, is_state_reconstruction)
+
+
 def get_last_block_index(db_url=NEWRL_DB):
     """Get last block index from db"""
-    con = sqlite3.connect(db_url)
-    cur = con.cursor()
+    # Snapshots are read once and replaced, so they are not kept open
+    con = None if db_url == NEWRL_DB else sqlite3.connect(db_url)
+    cur = get_cursor() if con is None else con.cursor()
     try:
         last_block_cursor = cur.execute(
             'SELECT block_index FROM blocks ORDER BY block_index DESC LIMIT 1'
@@ -266,25 +261,20 @@ def get_last_block_index(db_url=NEWRL_DB):
         last_block_index = last_block[0]
     except Exception as e:
         last_block_index = 0
-    con.close()
+    if con is not None:
+        con.close()
     return last_block_index
 
 
 def get_last_block(cur=None):
     """Get last block hash from db"""
-    cursor_opened_inside = False
     try:
         if cur is None:
-            con = sqlite3.connect(NEWRL_DB)
-            cur = con.cursor()
-            cursor_opened_inside = True
+            cur = get_cursor()
         last_block_cursor = cur.execute(
             'SELECT block_index, hash, timestamp FROM blocks ORDER BY block_index DESC LIMIT 1'
         )
         last_block = last_block_cursor.fetchone()
-
-        if cursor_opened_inside:
-            con.close()
     except:
         logger.warn('Cannot get last block')
         return None
@@ -300,8 +290,7 @@ def get_last_block(cur=None):
 
 
 def block_exists(block_index):
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
+        cur = get_cursor()
         block_cursor = cur.execute(
             'SELECT * FROM blocks where block_index=?', (block_index,)).fetchone()
         
@@ -310,13 +299,11 @@ def block_exists(block_index):
         else:
             block_exists = False
         
-        con.close()
         return block_exists
 
 
 def get_blocks_in_range(start_index, end_index):
-    con = sqlite3.connect(NEWRL_DB)
-    cur = con.cursor()
+    cur = get_cursor()
     blocks_cursor = cur.execute(
         'SELECT * FROM blocks where block_index >= ? and block_index < ?'
         ,(start_index, end_index)).fetchall()
@@ -326,7 +313,6 @@ def get_blocks_in_range(start_index, end_index):
     receipt_cursor = cur.execute(
         'SELECT * FROM receipts where included_block_index >= ? and block_index < ?'
         ,(start_index, end_index)).fetchall()
-    con.close()
     return {
         'blocks': blocks_cursor,
         'transactions': transactions_cursor,
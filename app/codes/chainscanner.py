@@ -2,15 +2,14 @@
 import sqlite3
 
 
-from ..constants import NEWRL_DB
 from .blockchain import Blockchain
+from .storage import get_cursor
 from app.Configuration import Configuration
 
 class Chainscanner():
-    def __init__(self):
+    def __init__(self, cur=None):
         self.blockchain = Blockchain()
-        self.con = sqlite3.connect(NEWRL_DB)
-        self.cur = self.con.cursor()
+        self.cur = cur if cur is not None else get_cursor()
 
     def getbalancesbytoken(self, tokencode):
         """Get token balance across wallets"""
@@ -51,9 +50,7 @@ class Chainscanner():
 
 
 def download_state():
-    con = sqlite3.connect(NEWRL_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_cursor(row_factory=sqlite3.Row)
     wallets_cursor = cur.execute('SELECT * FROM wallets ORDER BY wallet_address').fetchall()
     wallets = [dict(ix) for ix in wallets_cursor]
 
@@ -75,7 +72,6 @@ def download_state():
     stake_ledger_cursor = cur.execute('SELECT * FROM stake_ledger ORDER BY address').fetchall()
     stake_ledger = [dict(ix) for ix in stake_ledger_cursor]
     
-    con.close()
     state = {
         'wallets': wallets,
         'tokens': tokens,
@@ -88,17 +84,15 @@ def download_state():
     return state
 
 
-def get_block(block_index):
+def get_block(block_index, cur=None):
     chain = Blockchain()
-    return chain.get_block(block_index)
+    return chain.get_block(block_index, cur)
 
-def get_transaction(transaction_code):
-    con = sqlite3.connect('file:' + NEWRL_DB + '?mode=ro')
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+def get_transaction(transaction_code, cur=None):
+    if cur is None:
+        cur = get_cursor(row_factory=sqlite3.Row)
     transaction_cursor = cur.execute(
         'SELECT * FROM transactions where transaction_code=?', (transaction_code,)).fetchone()
-    con.close()
     if transaction_cursor is None:
         return None
     return dict(transaction_cursor)
@@ -107,10 +101,9 @@ def get_config():
     config = Configuration().conf
     return config
 
-def get_wallet(wallet_address):
-    con = sqlite3.connect(NEWRL_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+def get_wallet(wallet_address, cur=None):
+    if cur is None:
+        cur = get_cursor(row_factory=sqlite3.Row)
     wallet_cursor = cur.execute(
         'SELECT * FROM wallets where wallet_address=?', (wallet_address,)).fetchone()
     if wallet_cursor is None:
@@ -121,37 +114,30 @@ def get_wallet(wallet_address):
     pid = pid_cursor.fetchone()
     person_id = pid['person_id'] if pid is not None else ''
     wallet['person_id'] = person_id
-    con.close()
     return wallet
 
 
-def get_token(token_code):
-    con = sqlite3.connect(NEWRL_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
-    cur = cur.execute(
-        'SELECT * FROM tokens where tokencode=?', (token_code,)).fetchone()
-    con.close()
+def get_token(token_code, cur=None):
     if cur is None:
+        cur = get_cursor(row_factory=sqlite3.Row)
+    token = cur.execute(
+        'SELECT * FROM tokens where tokencode=?', (token_code,)).fetchone()
+    if token is None:
         return None
-    return dict(cur)
+    return dict(token)
 
-def get_contract(contract_address):
-    con = sqlite3.connect(NEWRL_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
-    cur = cur.execute(
-        'SELECT * FROM contracts where address=?', (contract_address,)).fetchone()
-    con.close()
+def get_contract(contract_address, cur=None):
     if cur is None:
+        cur = get_cursor(row_factory=sqlite3.Row)
+    contract = cur.execute(
+        'SELECT * FROM contracts where address=?', (contract_address,)).fetchone()
+    if contract is None:
         return None
-    return dict(cur)
+    return dict(contract)
 
 
 def download_chain():
-    con = sqlite3.connect(NEWRL_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_cursor(row_factory=sqlite3.Row)
     blocks_cursor = cur.execute('SELECT * FROM blocks').fetchall()
     blocks = [dict(ix) for ix in blocks_cursor]
     for idx, block in enumerate(blocks):
@@ -6,6 +6,7 @@ import json
 from ..nvalues import MIN_STAKE_AMOUNT, SENTINEL_NODE_WALLET
 from ..constants import BLOCK_TIME_INTERVAL_SECONDS, COMMITTEE_SIZE, MINIMUM_ACCEPTANCE_VOTES, NEWRL_DB, TIME_MINER_BROADCAST_INTERVAL_SECONDS
 from .clock.global_time import get_corrected_time_ms
+from .storage import get_cursor
 from .utils import get_last_block_hash
 from app.codes.scoremanager import get_scores_for_wallets
 
@@ -108,9 +109,9 @@ def get_eligible_miners():
     # cutfoff_epoch = get_corrected_time_ms() - TIME_MINER_BROADCAST_INTERVAL_SECONDS * 2 * 1000
     cutfoff_block = last_block['index'] - 1000
 
-    con = sqlite3.connect(NEWRL_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_cursor(row_factory=sqlite3.Row)
+    # The + keeps sqlite from walking the wallet address index to avoid the
+    # sort, so it searches idx_miners_block_index for the recent miners
     miner_cursor = cur.execute(
         '''
         select distinct m.wallet_address, network_address, last_broadcast_timestamp, block_index
@@ -122,7 +123,7 @@ def get_eligible_miners():
         and m.wallet_address != ?
         and sl.amount >= ?
         where ts.score > 0
-        order by m.wallet_address asc
+        order by +m.wallet_address asc
         ''', (cutfoff_block, SENTINEL_NODE_WALLET, MIN_STAKE_AMOUNT, )).fetchall()
     # miner_cursor = cur.execute(
     #     '''SELECT wallet_address, network_address, last_broadcast_timestamp 
@@ -130,7 +131,6 @@ def get_eligible_miners():
     #     WHERE last_broadcast_timestamp > ?
     #     ORDER BY wallet_address ASC''', (cutfoff_epoch, )).fetchall()
     miners = [dict(m) for m in miner_cursor]
-    con.close()
     return miners
 
 def get_committee_for_current_block(last_block=None):
@@ -11,7 +11,6 @@ import abc
 import json
 import datetime
 import time
-import sqlite3
 
 from app.codes.helpers.TransactionCreator import TransactionCreator
 #import hashlib
@@ -19,6 +18,7 @@ from app.codes.helpers.TransactionCreator import TransactionCreator
 from ...constants import NEWRL_DB
 from ..db_updater import *
 from ..cache import DB_CACHE
+from ..storage import get_cursor
 
 
 class ContractMaster():
@@ -142,12 +142,10 @@ class ContractMaster():
         if contractaddress in DB_CACHE['contract_params']:
             self.contractparams = DB_CACHE['contract_params'][contractaddress]
         else:
-            con = sqlite3.connect(NEWRL_DB)
-            cur = con.cursor()
+            cur = get_cursor()
             contract_cursor = cur.execute('SELECT * FROM contracts WHERE address = :address', {
                         'address': contractaddress})
             contract_row = contract_cursor.fetchone()
-            con.close()
             if not contract_row:
                 self.new_contract = True
                 return False
@@ -1,24 +1,114 @@
 import base64
-import hashlib
-import json
-import ecdsa
+import threading
+from collections import OrderedDict
+
+from .secp256k1 import load_backend
+from .serialization import digest, encode
+from ..constants import CRYPTO_BACKEND, VERIFYING_KEY_CACHE_SIZE, VERIFYING_KEY_PRECOMPUTE_HITS
+
+
+# Selected once at startup. Every signature goes through this backend
+crypto_backend = load_backend(CRYPTO_BACKEND)
 
 
 def calculate_hash(block):
     """Calculate hash of a given block using sha256"""
-    encoded_block = json.dumps(block, sort_keys=True).encode()
-    return hashlib.sha256(encoded_block).hexdigest()
+    return digest(block)
 
 
 def sign_object(private_key, data):
     pvtkeybytes = bytes.fromhex(private_key)
-    msg = json.dumps(data).encode()
-    sk = ecdsa.SigningKey.from_string(pvtkeybytes, curve=ecdsa.SECP256k1)
-    msgsignbytes = sk.sign(msg)
+    msg = encode(data)
+    msgsignbytes = sign_message(pvtkeybytes, msg)
     msgsign = msgsignbytes.hex()
     return msgsign
 
 
+def derive_public_key(private_key_bytes):
+    """Returns the 64 byte public key of a 32 byte private key"""
+    return crypto_backend.derive_public_key(private_key_bytes)
+
+
+def sign_message(private_key_bytes, message):
+    """Returns the 64 byte signature of message bytes"""
+    return crypto_backend.sign(private_key_bytes, message)
+
+
+def verify_message(public_key, signature, message):
+    """Verifies a signature of message bytes against public key bytes or hex"""
+    if isinstance(public_key, str):
+        public_key = bytes.fromhex(public_key)
+    return crypto_backend.verify_loaded(verifying_key_cache.get(public_key), signature, message)
+
+
+class VerifyingKeyCache:
+    """Bounded LRU of parsed secp256k1 verifying keys keyed by raw public key bytes
+
+    Parsing decodes the curve point on every call, so keys which sign
+    repeatedly are kept parsed. A key used precompute_hits times, such as a
+    committee member or custodian key, also gets precomputed multiplication
+    tables which make each later verification faster.
+    """
+
+    def __init__(self, max_size=VERIFYING_KEY_CACHE_SIZE, precompute_hits=VERIFYING_KEY_PRECOMPUTE_HITS, backend=None):
+        self.backend = backend or crypto_backend
+        self.max_size = max_size
+        self.precompute_hits = precompute_hits
+        self.lock = threading.Lock()
+        self.keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.precomputed = 0
+
+    def get(self, public_key_bytes):
+        with self.lock:
+            entry = self.keys.get(public_key_bytes)
+            if entry is not None:
+                self.keys.move_to_end(public_key_bytes)
+                self.hits += 1
+                entry[1] += 1
+                if entry[1] != self.precompute_hits:
+                    return entry[0]
+                self.precomputed += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            verifying_key = self.backend.precompute_public_key(entry[0])
+            with self.lock:
+                entry[0] = verifying_key
+            return verifying_key
+
+        verifying_key = self.backend.load_public_key(public_key_bytes)
+        with self.lock:
+            self.keys[public_key_bytes] = [verifying_key, 0]
+            while len(self.keys) > self.max_size:
+                self.keys.popitem(last=False)
+        return verifying_key
+
+    def clear(self):
+        with self.lock:
+            self.keys = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.precomputed = 0
+
+    def get_stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.keys),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups > 0 else 0,
+                'precomputed': self.precomputed,
+                'backend': self.backend.name,
+            }
+
+
+verifying_key_cache = VerifyingKeyCache()
+
+
 #  TODO - Use till the nodes are identifiable. Random public-pvt combination
 _public = "4trPBhDwdxWat2I8tE4Mj+7R6tiTJ+44GWtTdf5QpXnh/Ia1i5x4ETDufrCn3mjYN8gJs/w3iiMlDEmAAs7kvg=="
 _private = "tW1Urj9jKj/i85R1P4HDSsaBi2WZDe74Ze6zxVxA1CI="
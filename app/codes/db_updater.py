@@ -2,7 +2,6 @@ import codecs
 import math
 from subprocess import call
 import uuid
-import ecdsa
 from Crypto.Hash import keccak
 import os
 import json
@@ -13,9 +12,10 @@ import hashlib
 
 from app.codes.clock.global_time import get_corrected_time_ms
 from app.nvalues import MIN_STAKE_AMOUNT
+from .crypto import derive_public_key
 from ..Configuration import Configuration
 
-from ..constants import INITIAL_NETWORK_TRUST_SCORE, NEWRL_DB
+from ..constants import INITIAL_NETWORK_TRUST_SCORE, NEWRL_DB, SQLITE_MAX_QUERY_PARAMETERS
 from .utils import get_person_id_for_wallet_address, get_time_ms
 from ..ntypes import NEWRL_TOKEN_CODE
 import logging
@@ -199,6 +199,35 @@ def get_wallet_token_balance(cur, wallet_address, token_code):
     return balance
 
 
+def get_wallet_token_balances(cur, keys):
+    """Balances for many (wallet, token) pairs with one query per chunk of wallets"""
+    keys = set(keys)
+    balances = {key: 0 for key in keys}
+    wallets = list({wallet for wallet, _ in keys})
+    for start in range(0, len(wallets), SQLITE_MAX_QUERY_PARAMETERS):
+        chunk = wallets[start:start + SQLITE_MAX_QUERY_PARAMETERS]
+        rows = cur.execute(
+            f'SELECT wallet_address, tokencode, balance FROM balances WHERE wallet_address IN ({",".join("?" * len(chunk))})',
+            chunk).fetchall()
+        for wallet_address, tokencode, balance in rows:
+            if (wallet_address, tokencode) in balances:
+                balances[(wallet_address, tokencode)] = balance
+    return balances
+
+
+def get_included_transaction_codes(cur, transaction_codes):
+    """Returns the subset of transaction codes which are already in the chain"""
+    transaction_codes = list(transaction_codes)
+    included = set()
+    for start in range(0, len(transaction_codes), SQLITE_MAX_QUERY_PARAMETERS):
+        chunk = transaction_codes[start:start + SQLITE_MAX_QUERY_PARAMETERS]
+        rows = cur.execute(
+            f'SELECT transaction_code FROM transactions WHERE transaction_code IN ({",".join("?" * len(chunk))})',
+            chunk).fetchall()
+        included.update(row[0] for row in rows)
+    return included
+
+
 def add_tx_to_block(cur, block_index, transactions):
     for transaction_signature in transactions:
         transaction = transaction_signature['transaction']
@@ -290,9 +319,7 @@ def get_block_from_cursor(cur, block_index):
 
 def create_contract_address():
     private_key_bytes = os.urandom(32)
-    key = ecdsa.SigningKey.from_string(
-        private_key_bytes, curve=ecdsa.SECP256k1).verifying_key
-    key_bytes = key.to_string()
+    key_bytes = derive_public_key(private_key_bytes)
     public_key = codecs.encode(key_bytes, 'hex')
     public_key_bytes = codecs.decode(public_key, 'hex')
     hash = keccak.new(digest_bits=256)
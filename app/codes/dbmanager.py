@@ -2,13 +2,16 @@ import random
 import sqlite3
 import os
 import glob
-import subprocess
 import threading
 import logging
+import time
+from contextlib import contextmanager
 
 from app.codes.blockchain import get_last_block_index
+from app.codes.statewriter import PRIORITY_MAINTENANCE, state_writer
+from app.codes.storage import connect, restore_database
 
-from ..constants import NEWRL_DB
+from ..constants import NEWRL_DB, SNAPSHOT_BACKUP_PAGES, SNAPSHOT_STEP_BUDGET_MS, SNAPSHOT_STEP_SLEEP_SECONDS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,24 +21,138 @@ snapshot_schedule = {
     'snapshot_creation_in_progress': False
 }
 
+snapshot_progress = {
+    'in_progress': False,
+    'block_index': None,
+    'pages_copied': 0,
+    'total_pages': 0,
+    'percent': 0,
+    'elapsed_ms': 0,
+    'max_step_ms': 0,
+    'slow_steps': 0,
+    'last_block_index': None,
+    'last_duration_ms': None,
+}
+
+snapshot_lock = threading.Lock()
+snapshot_cancel = threading.Event()
+snapshot_thread = None
+
+
+class SnapshotCancelled(Exception):
+    pass
+
+
 def create_db_snapshot(suffix='.snapshot'):
-    logger.info('Creating db snapshot')
+    """Copies the db to NEWRL_DB + suffix without stopping block commits
+
+    The copy reads from one read transaction, so it holds the state of the
+    last block committed when it started. It runs in backup steps of
+    SNAPSHOT_BACKUP_PAGES pages with a pause after each, and the writer keeps
+    committing meanwhile. The copy is written to a partial file which is
+    renamed over the snapshot once complete.
+    """
+    with snapshot_lock:
+        return _create_db_snapshot(suffix)
+
+
+def _create_db_snapshot(suffix):
     snapshot_file = NEWRL_DB + suffix
-    con = sqlite3.connect(NEWRL_DB)
-    bck = sqlite3.connect(snapshot_file)
-    with bck:
-        con.backup(bck)
-    bck.close()
-    con.close()
-    logger.info('Db snapshot complete')
+    partial_file = NEWRL_DB + '.partial' + suffix
+    for file in (partial_file, partial_file + '-wal', partial_file + '-shm'):
+        if os.path.exists(file):
+            os.remove(file)
+
+    source = connect(NEWRL_DB, read_only=True)
+    bck = sqlite3.connect(partial_file)
+    started = time.perf_counter()
+    try:
+        source.execute('BEGIN')
+        block_index = source.execute(
+            'SELECT block_index FROM blocks ORDER BY block_index DESC LIMIT 1').fetchone()
+        block_index = block_index[0] if block_index is not None else 0
+        logger.info('Creating db snapshot at block %d', block_index)
+        snapshot_progress.update({
+            'in_progress': True,
+            'block_index': block_index,
+            'pages_copied': 0,
+            'total_pages': 0,
+            'percent': 0,
+            'elapsed_ms': 0,
+            'max_step_ms': 0,
+            'slow_steps': 0,
+        })
+        step_started = time.perf_counter()
+
+        def on_step(status, remaining, total):
+            nonlocal step_started
+            now = time.perf_counter()
+            step_ms = (now - step_started) * 1000
+            snapshot_progress['pages_copied'] = total - remaining
+            snapshot_progress['total_pages'] = total
+            snapshot_progress['percent'] = round((total - remaining) * 100 / total, 1) if total else 100
+            snapshot_progress['elapsed_ms'] = (now - started) * 1000
+            snapshot_progress['max_step_ms'] = max(snapshot_progress['max_step_ms'], step_ms)
+            if snapshot_cancel.is_set():
+                raise SnapshotCancelled()
+            if remaining > 0:
+                # backup only sleeps between busy steps, so pause here. The
+                # read transaction stays open and commits meanwhile do not
+                # restart the backup
+                pause = SNAPSHOT_STEP_SLEEP_SECONDS
+                if step_ms > SNAPSHOT_STEP_BUDGET_MS:
+                    # The disk is busy. Leave it to the writer for as long again
+                    snapshot_progress['slow_steps'] += 1
+                    pause += step_ms / 1000
+                time.sleep(pause)
+            step_started = time.perf_counter()
+
+        source.backup(bck, pages=SNAPSHOT_BACKUP_PAGES, progress=on_step)
+        bck.close()
+        os.replace(partial_file, snapshot_file)
+    except Exception:
+        bck.close()
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        raise
+    finally:
+        source.close()
+        snapshot_progress['in_progress'] = False
+    snapshot_progress['last_block_index'] = block_index
+    snapshot_progress['last_duration_ms'] = (time.perf_counter() - started) * 1000
+    logger.info('Db snapshot complete in %d ms', snapshot_progress['last_duration_ms'])
     return snapshot_file
 
 
+def get_snapshot_progress():
+    return dict(snapshot_progress)
+
+
+@contextmanager
+def snapshots_paused():
+    """Cancels a running snapshot and holds off new ones
+
+    Use around restoring the db. A snapshot pinned to the state before the
+    restore would keep the rewritten pages in the write ahead log until it
+    finishes, only to write an outdated snapshot.
+    """
+    snapshot_cancel.set()
+    with snapshot_lock:
+        snapshot_cancel.clear()
+        yield
+
+
 def revert_to_last_snapshot():
-    snapshots = glob.glob(NEWRL_DB + '.snapshot*')
+    return state_writer.submit('restore', restore_last_snapshot, priority=PRIORITY_MAINTENANCE)
+
+
+def restore_last_snapshot():
+    """Restores the db from the last snapshot. Run on the state writer"""
+    snapshots = [s for s in glob.glob(NEWRL_DB + '.snapshot*') if not s.endswith(('-wal', '-shm'))]
     if len(snapshots) > 0:
         snapshot = snapshots[0]
-        subprocess.call(["cp", snapshot, NEWRL_DB])
+        with snapshots_paused():
+            restore_database(snapshot, NEWRL_DB)
 
 
 def create_block_snapshot(block_index):
@@ -58,6 +175,8 @@ def create_block_snapshot(block_index):
             create_db_snapshot(f'.snapshot')
             snapshot_schedule['next_snapshot'] = block_index + random.randint(500, 1000)
             logger.info('Next snapshot creation scheduled for block %d', snapshot_schedule['next_snapshot'])
+        except SnapshotCancelled:
+            logger.info('Snapshot creation cancelled')
         except Exception as e:
             logger.error('Error during snapshot creation' + str(e))
         snapshot_schedule['snapshot_creation_in_progress'] = False
@@ -66,13 +185,14 @@ def create_block_snapshot(block_index):
 
 
 def check_and_create_snapshot_in_thread(block_index):
+    global snapshot_thread
     if snapshot_schedule['snapshot_creation_in_progress']:
         return
-    # thread = threading.Thread(target=create_block_snapshot,
-    #     args = (block_index, ))
-    # thread.start()
-    # TODO - Check and enable threading
-    create_block_snapshot(block_index)
+    if snapshot_thread is not None and snapshot_thread.is_alive():
+        return
+    snapshot_thread = threading.Thread(
+        target=create_block_snapshot, args=(block_index, ), name='snapshot', daemon=True)
+    snapshot_thread.start()
 
 
 def get_or_create_db_snapshot():
@@ -2,13 +2,14 @@ import json
 import glob
 import os
 from app.constants import BLOCK_ARCHIVE_PATH
+from app.codes.serialization import encode
 
 
 def archive_block(block):
     block_index = block['index']
     new_file_name = f'{BLOCK_ARCHIVE_PATH}block_{block_index}.json'
-    with open(new_file_name, 'w') as _file:
-        json.dump(block, _file)
+    with open(new_file_name, 'wb') as _file:
+        _file.write(encode(block))
     return new_file_name
 
 
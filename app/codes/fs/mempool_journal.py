@@ -0,0 +1,167 @@
+"""Append only journal which persists the in-memory mempool"""
+
+import json
+import logging
+import os
+import threading
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+JOURNAL_OP_ADD = 'a'
+JOURNAL_OP_REMOVE = 'r'
+
+
+class MempoolJournal:
+    """Segment file with one JSON record per line
+
+    Records are written to the OS on every append and fsynced in batches,
+    either when fsync_batch_size records are pending or when flush is
+    called by the maintenance thread. A torn record at the end of the file
+    after a crash is cut off on replay, so the next record starts on a
+    line of its own.
+    """
+
+    def __init__(self, path, fsync_batch_size=100):
+        self.path = path
+        self.fsync_batch_size = fsync_batch_size
+        self.lock = threading.Lock()
+        self.file = None
+        self.unsynced_records = 0
+        self.live_records = 0
+        self.dead_records = 0
+        self.compaction_buffer = None
+        self.compacted_records = 0
+
+    def replay(self):
+        """Returns the live transactions in the journal in the order they were added"""
+        transactions = {}
+        records = 0
+        self.live_records = 0
+        self.dead_records = 0
+        if not os.path.exists(self.path):
+            return transactions
+        complete_size = 0
+        with open(self.path, 'rb') as _file:
+            for line in _file:
+                if not line.endswith(b'\n'):
+                    logger.info('Cutting torn record off the mempool journal')
+                    break
+                complete_size += len(line)
+                records += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.info('Skipping unreadable mempool journal record')
+                    continue
+                if record['op'] == JOURNAL_OP_ADD:
+                    transactions[record['transaction']['transaction']['trans_code']] = record['transaction']
+                elif record['op'] == JOURNAL_OP_REMOVE:
+                    transactions.pop(record['trans_code'], None)
+        if complete_size < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as _file:
+                _file.truncate(complete_size)
+                os.fsync(_file.fileno())
+        self.live_records = len(transactions)
+        self.dead_records = records - self.live_records
+        return transactions
+
+    def _open(self):
+        if self.file is None:
+            self.file = open(self.path, 'a')
+
+    def _write(self, record):
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self._open()
+            self.file.write(line)
+            self.file.flush()
+            if self.compaction_buffer is not None:
+                self.compaction_buffer.append(line)
+            self.unsynced_records += 1
+            if self.unsynced_records >= self.fsync_batch_size:
+                self._fsync()
+
+    def _fsync(self):
+        if self.file is not None and self.unsynced_records > 0:
+            os.fsync(self.file.fileno())
+        self.unsynced_records = 0
+
+    def append_add(self, transaction):
+        self._write({'op': JOURNAL_OP_ADD, 'transaction': transaction})
+        self.live_records += 1
+
+    def append_remove(self, transaction_code):
+        self._write({'op': JOURNAL_OP_REMOVE, 'trans_code': transaction_code})
+        self.live_records -= 1
+        self.dead_records += 2
+
+    def flush(self):
+        """Fsyncs records appended since the last fsync"""
+        with self.lock:
+            self._fsync()
+
+    def needs_compaction(self, min_dead_records):
+        return self.dead_records >= min_dead_records and self.dead_records > self.live_records
+
+    def start_compaction(self):
+        """Starts recording appends which happen while the segment is rewritten"""
+        with self.lock:
+            self.compaction_buffer = []
+
+    def write_compacted(self, transactions):
+        """Writes the live transactions to a new segment next to the journal"""
+        with open(self.path + '.compact', 'w') as _file:
+            for transaction in transactions:
+                _file.write(json.dumps({'op': JOURNAL_OP_ADD, 'transaction': transaction}) + '\n')
+        self.compacted_records = len(transactions)
+
+    def finish_compaction(self, live_records):
+        """Replaces the journal with the compacted segment
+
+        The caller must make sure no record is appended concurrently.
+        Returns False if the journal was truncated since the compaction
+        started, in which case the compacted segment is dropped.
+        """
+        with self.lock:
+            if self.compaction_buffer is None:
+                if os.path.exists(self.path + '.compact'):
+                    os.remove(self.path + '.compact')
+                return False
+            with open(self.path + '.compact', 'a') as _file:
+                _file.writelines(self.compaction_buffer)
+                _file.flush()
+                os.fsync(_file.fileno())
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            os.replace(self.path + '.compact', self.path)
+            fsync_directory(self.path)
+            # Removals carried over from the buffer are still dead records
+            self.dead_records = self.compacted_records + len(self.compaction_buffer) - live_records
+            self.compaction_buffer = None
+            self.unsynced_records = 0
+            self.live_records = live_records
+            return True
+
+    def truncate(self):
+        """Empties the journal and cancels a compaction in progress"""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.path, 'w')
+            self.compaction_buffer = None
+            self.unsynced_records = 0
+            self.live_records = 0
+            self.dead_records = 0
+
+
+def fsync_directory(path):
+    """Makes a rename within the directory of path durable"""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -1,12 +1,22 @@
 """Temp file manager"""
 
+import bisect
 import glob
+import heapq
 import json
+import logging
 import os
+import threading
+import time
 
-from ...constants import MEMPOOL_PATH, MEMPOOL_TRANSACTION_LIFETIME_SECONDS, TMP_PATH
+from ...constants import MEMPOOL_JOURNAL_COMPACTION_MIN_RECORDS, MEMPOOL_JOURNAL_FILE, MEMPOOL_JOURNAL_FSYNC_BATCH_SIZE, MEMPOOL_JOURNAL_FSYNC_INTERVAL_SECONDS, MEMPOOL_PATH, MEMPOOL_TRANSACTION_LIFETIME_SECONDS, TMP_PATH
+from .mempool_journal import MempoolJournal
 from ..clock.global_time import get_corrected_time_ms
 
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 def get_receipts_from_storage(block_index, folder=TMP_PATH):
     """Returns a list of receipts matching a block index from mempool"""
     blocks = []
@@ -43,36 +53,292 @@ def append_receipt_to_block(block, new_receipt):
     return False
 
 
+class Mempool:
+    """Process wide store of pending transactions keyed by trans_code
+
+    Transactions are indexed by signing wallet, type and timestamp so that
+    lookups do not touch the filesystem. An expiry heap of (timestamp,
+    trans_code) lets cleanup pop only the expired transactions. Entries of
+    transactions removed for other reasons are skipped when popped, and
+    the heap is rebuilt from the live transactions once it holds more than
+    twice as many entries.
+    Timestamp order is kept as a sorted list of distinct timestamps, each
+    with an insertion ordered bucket of trans_codes, so reads in that order
+    do not sort. Additions and removals are written to an append only
+    journal in MEMPOOL_PATH which is replayed into memory on first use.
+
+    Listeners are told about every transaction entering or leaving the
+    mempool while the mempool lock is held. A listener implements
+    on_transaction_added, on_transaction_removed and on_mempool_cleared.
+    """
+
+    def __init__(self, path=MEMPOOL_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.journal = MempoolJournal(
+            path + MEMPOOL_JOURNAL_FILE, fsync_batch_size=MEMPOOL_JOURNAL_FSYNC_BATCH_SIZE)
+        self.transactions = {}
+        self.by_wallet = {}
+        self.by_type = {}
+        self.by_timestamp = {}
+        self.timestamps = []
+        self.expiry_heap = []
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Registers a listener and tells it about the transactions already present"""
+        with self.lock:
+            self.listeners.append(listener)
+            for transaction in self.transactions.values():
+                listener.on_transaction_added(transaction)
+
+    def load(self):
+        """Replays the mempool journal into memory"""
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            for transaction in self.journal.replay().values():
+                self._index(transaction)
+            self._import_transaction_files()
+
+    def _import_transaction_files(self):
+        """Moves transactions stored as one file each into the journal"""
+        for filename in os.listdir(self.path):
+            if not (filename.startswith('transaction-') and filename.endswith('.json')):
+                continue
+            try:
+                with open(self.path + filename, 'r') as _file:
+                    transaction = json.load(_file)
+                if self._index(transaction):
+                    self.journal.append_add(transaction)
+            except Exception as e:
+                logger.info(f'Could not load mempool file {filename}: {e}')
+                continue
+            os.remove(self.path + filename)
+        self.journal.flush()
+
+    def _index(self, transaction):
+        transaction_code = transaction['transaction']['trans_code']
+        if transaction_code in self.transactions:
+            return False
+        self.transactions[transaction_code] = transaction
+        for wallet in get_transaction_wallets(transaction):
+            self.by_wallet.setdefault(wallet, set()).add(transaction_code)
+        self.by_type.setdefault(
+            transaction['transaction']['type'], set()).add(transaction_code)
+        timestamp = transaction['transaction']['timestamp']
+        codes = self.by_timestamp.get(timestamp)
+        if codes is None:
+            codes = {}
+            self.by_timestamp[timestamp] = codes
+            bisect.insort(self.timestamps, timestamp)
+        codes[transaction_code] = None
+        heapq.heappush(self.expiry_heap, (timestamp, transaction_code))
+        for listener in self.listeners:
+            listener.on_transaction_added(transaction)
+        return True
+
+    def _unindex(self, transaction_code):
+        transaction = self.transactions.pop(transaction_code, None)
+        if transaction is None:
+            return False
+        for wallet in get_transaction_wallets(transaction):
+            codes = self.by_wallet.get(wallet)
+            if codes is not None:
+                codes.discard(transaction_code)
+                if len(codes) == 0:
+                    del self.by_wallet[wallet]
+        transaction_type = transaction['transaction']['type']
+        codes = self.by_type.get(transaction_type)
+        if codes is not None:
+            codes.discard(transaction_code)
+            if len(codes) == 0:
+                del self.by_type[transaction_type]
+        timestamp = transaction['transaction']['timestamp']
+        codes = self.by_timestamp.get(timestamp)
+        if codes is not None:
+            codes.pop(transaction_code, None)
+            if len(codes) == 0:
+                del self.by_timestamp[timestamp]
+                del self.timestamps[bisect.bisect_left(self.timestamps, timestamp)]
+        if len(self.expiry_heap) > 2 * len(self.transactions):
+            self._rebuild_expiry_heap()
+        for listener in self.listeners:
+            listener.on_transaction_removed(transaction)
+        return True
+
+    def _rebuild_expiry_heap(self):
+        self.expiry_heap = [
+            (transaction['transaction']['timestamp'], transaction_code)
+            for transaction_code, transaction in self.transactions.items()
+        ]
+        heapq.heapify(self.expiry_heap)
+
+    def add(self, transaction):
+        """Adds a signed transaction. Returns False if it is already present"""
+        self.load()
+        with self.lock:
+            if not self._index(transaction):
+                return False
+            self.journal.append_add(transaction)
+        return True
+
+    def exists(self, transaction_code):
+        self.load()
+        return transaction_code in self.transactions
+
+    def get(self, transaction_code):
+        self.load()
+        return self.transactions.get(transaction_code)
+
+    def remove(self, transaction_code):
+        self.load()
+        with self.lock:
+            if not self._unindex(transaction_code):
+                return False
+            self.journal.append_remove(transaction_code)
+        return True
+
+    def clear(self):
+        self.load()
+        with self.lock:
+            self.transactions = {}
+            self.by_wallet = {}
+            self.by_type = {}
+            self.by_timestamp = {}
+            self.timestamps = []
+            self.expiry_heap = []
+            self.journal.truncate()
+            for listener in self.listeners:
+                listener.on_mempool_cleared()
+
+    def flush(self):
+        """Fsyncs journal records which are not yet on disk"""
+        self.journal.flush()
+
+    def compact(self):
+        """Rewrites the journal with only the live transactions
+
+        The live set is written without holding the mempool lock. Records
+        appended in the meantime are carried over before the swap.
+        """
+        self.load()
+        with self.lock:
+            transactions = [self.transactions[code] for code in self._get_ordered_codes()]
+            self.journal.start_compaction()
+        self.journal.write_compacted(transactions)
+        with self.lock:
+            self.journal.finish_compaction(len(self.transactions))
+
+    def maintain_journal(self):
+        self.flush()
+        if self.journal.needs_compaction(MEMPOOL_JOURNAL_COMPACTION_MIN_RECORDS):
+            logger.info('Compacting mempool journal')
+            self.compact()
+
+    def _get_ordered_codes(self):
+        return [
+            code for timestamp in self.timestamps
+            for code in self.by_timestamp[timestamp]
+        ]
+
+    def get_transaction_codes(self):
+        """Returns transaction codes ordered by transaction timestamp"""
+        self.load()
+        with self.lock:
+            return self._get_ordered_codes()
+
+    def get_transactions(self):
+        """Returns transactions ordered by transaction timestamp"""
+        self.load()
+        with self.lock:
+            return [self.transactions[code] for code in self._get_ordered_codes()]
+
+    def get_transactions_for_wallet(self, wallet_address):
+        self.load()
+        with self.lock:
+            codes = self.by_wallet.get(wallet_address, set())
+            return [self.transactions[code] for code in codes]
+
+    def get_transactions_for_type(self, transaction_type):
+        self.load()
+        with self.lock:
+            codes = self.by_type.get(transaction_type, set())
+            return [self.transactions[code] for code in codes]
+
+    def remove_expired(self, timestamp):
+        """Removes transactions with timestamp older than the given one
+
+        Returns the removed transaction codes.
+        """
+        self.load()
+        removed = []
+        with self.lock:
+            while len(self.expiry_heap) > 0 and self.expiry_heap[0][0] < timestamp:
+                expiry_timestamp, transaction_code = heapq.heappop(self.expiry_heap)
+                transaction = self.transactions.get(transaction_code)
+                if transaction is None or transaction['transaction']['timestamp'] != expiry_timestamp:
+                    continue
+                if self.remove(transaction_code):
+                    removed.append(transaction_code)
+        return removed
+
+    def __len__(self):
+        self.load()
+        return len(self.transactions)
+
+
+def get_transaction_wallets(transaction):
+    """Returns the wallets which signed a transaction"""
+    wallets = []
+    for signature in transaction.get('signatures', []):
+        wallet = signature.get('wallet_address')
+        if wallet is not None and wallet not in wallets:
+            wallets.append(wallet)
+    return wallets
+
+
+mempool = Mempool()
+
+
+def start_mempool_journal_thread():
+    """Fsyncs and compacts the mempool journal in the background"""
+    def maintain():
+        while True:
+            time.sleep(MEMPOOL_JOURNAL_FSYNC_INTERVAL_SECONDS)
+            try:
+                mempool.maintain_journal()
+            except Exception as e:
+                logger.error(f'Mempool journal maintenance failed: {e}')
+
+    mempool.load()
+    thread = threading.Thread(target=maintain, daemon=True)
+    thread.start()
+    return thread
+
+
+def add_transaction_to_mempool(transaction):
+    return mempool.add(transaction)
+
+
 def transaction_exists_in_mempool(transaction_code):
-    existing_files_for_block = glob.glob(f'{MEMPOOL_PATH}transaction-*-{transaction_code}*.json')
-    if len(existing_files_for_block) == 0:
-        return False
-    return True
+    return mempool.exists(transaction_code)
 
 
 def get_mempool_transaction(transaction_code):
-    existing_files_for_block = glob.glob(f'{MEMPOOL_PATH}transaction-*-{transaction_code}*.json')
-    if len(existing_files_for_block) == 0:
-        return None
-    
-    with open(existing_files_for_block[0], 'r') as _file:
-        transaction = json.load(_file)
-        return transaction
+    return mempool.get(transaction_code)
 
 
 def remove_transaction_from_mempool(transaction_code):
-    transaction_files = glob.glob(f'{MEMPOOL_PATH}transaction-*-{transaction_code}*.json')
-    for f in transaction_files:
-        os.remove(f)
+    return mempool.remove(transaction_code)
 
 
 def clear_mempool():
-    filenames = os.listdir(MEMPOOL_PATH)
-    
-    for filename in filenames:
-        file = MEMPOOL_PATH + filename
-        os.remove(file)
-    
+    mempool.clear()
     clear_temp()
 
 def clear_temp():
@@ -84,10 +350,7 @@ def clear_temp():
 
 
 def mempool_cleanup():
-    transaction_files = glob.glob(f'{MEMPOOL_PATH}transaction-*.json')
-
-    for transaction_file in transaction_files:
-        with open(transaction_file, 'r') as _file:
-            t = json.load(_file)
-            if t['transaction']['timestamp'] < get_corrected_time_ms() - MEMPOOL_TRANSACTION_LIFETIME_SECONDS * 1000:
-                os.remove(transaction_file)
+    expiry_time = get_corrected_time_ms() - MEMPOOL_TRANSACTION_LIFETIME_SECONDS * 1000
+    removed = mempool.remove_expired(expiry_time)
+    if len(removed) > 0:
+        logger.info(f'Removed {len(removed)} expired transactions from mempool')
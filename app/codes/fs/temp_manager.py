@@ -5,6 +5,7 @@ import json
 import os
 
 from ...constants import MEMPOOL_PATH, TMP_PATH
+from ..serialization import encode
 
 
 def get_blocks_for_index_from_storage(block_index, folder=TMP_PATH):
@@ -50,8 +51,8 @@ def store_block_to_temp(block, folder=TMP_PATH):
     block_hash = block['hash']
     # existing_files_for_block = glob.glob(f'{folder}/block_{block_index}_*.json')
     new_file_name = f'{folder}block_{block_index}_{block_hash}.json'
-    with open(new_file_name, 'w') as _file:
-        json.dump(block, _file)
+    with open(new_file_name, 'wb') as _file:
+        _file.write(encode(block))
     return new_file_name
 
 
@@ -1,6 +1,6 @@
 import json
-import sqlite3
 
+from app.codes.storage import get_cursor
 from app.codes.transactionmanager import Transactionmanager
 from app.constants import NEWRL_DB
 from app.ntypes import *
@@ -24,11 +24,9 @@ def validate(transaction: Transactionmanager, contract_address: str):
             if contract_address != transaction.transaction['specific_data']['wallet1']:
                 return False
     if type==TRANSACTION_TRUST_SCORE_CHANGE:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
+        cur = get_cursor()
         signatories = cur.execute(
             'SELECT signatories FROM contracts WHERE address=?', (contract_address,)).fetchone()
-        con.close()
         if signatories is None:
             print("Contract does not exist.")
             return [-1]
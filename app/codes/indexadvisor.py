@@ -0,0 +1,135 @@
+"""Finds queries which scan whole tables
+
+QueryRecorder captures the statements a workload runs through the storage
+connections. advise runs EXPLAIN QUERY PLAN on each distinct query shape
+and reports the plan steps which scan a table instead of searching an
+index. HOT_QUERIES lists the shapes the node runs for every block or API
+request, which must never scan.
+"""
+
+import re
+import threading
+
+from .storage import connect, set_trace_callback
+from ..constants import NEWRL_DB
+
+
+HOT_QUERIES = {
+    'blocks in range': (
+        'SELECT * FROM blocks where block_index >= ? and block_index < ?', (1, 10)),
+    'transactions in range': (
+        'SELECT * FROM transactions where block_index >= ? and block_index < ?', (1, 10)),
+    'block transactions': (
+        'SELECT * FROM transactions where block_index=?', (1, )),
+    'transaction': (
+        'SELECT * FROM transactions where transaction_code=?', ('', )),
+    'incoming trust scores': (
+        'SELECT src_person_id, score, last_time FROM trust_scores where dest_person_id=?', ('', )),
+    'outgoing trust scores': (
+        'SELECT dest_person_id, score, last_time FROM trust_scores where src_person_id=?', ('', )),
+    'dao member': (
+        'SELECT count(*) FROM dao_membership WHERE dao_person_id=? and member_person_id=?', ('', '')),
+    'dao members': (
+        'Select member_person_id from  dao_membership  where dao_person_id = (:dao_person_id)',
+        {'dao_person_id': ''}),
+    'member daos': (
+        'Select count(*) from  dao_membership  where member_person_id = (:member_person_id)',
+        {'member_person_id': ''}),
+    'wallet stake': (
+        'select amount,staker_wallet_address from stake_ledger where wallet_address=:address',
+        {'address': ''}),
+    'eligible miners': (
+        '''
+        select distinct m.wallet_address, network_address, last_broadcast_timestamp, block_index
+        from miners m
+        join person_wallet pw on m.wallet_address = pw.wallet_id
+        join trust_scores ts on pw.person_id = ts.dest_person_id
+        join stake_ledger sl on sl.wallet_address = m.wallet_address
+        and m.block_index > ?
+        and m.wallet_address != ?
+        and sl.amount >= ?
+        where ts.score > 0
+        order by +m.wallet_address asc
+        ''', (0, '', 0)),
+}
+
+EXPLAINED_STATEMENTS = ('select', 'with', 'update', 'delete')
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+WHITESPACE = re.compile(r'\s+')
+
+
+def get_query_shape(sql):
+    """Replaces literals with ? so calls with different values group together"""
+    shape = STRING_LITERAL.sub('?', sql)
+    shape = NUMBER_LITERAL.sub('?', shape)
+    return WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryRecorder:
+    """Records the statements run on storage connections while active
+
+    Use as a context manager around the workload. Statements are grouped
+    by shape, keeping one example with its values for EXPLAIN.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = {}
+
+    def record(self, sql):
+        if not sql.lstrip().lower().startswith(EXPLAINED_STATEMENTS):
+            return
+        shape = get_query_shape(sql)
+        with self.lock:
+            query = self.queries.get(shape)
+            if query is None:
+                self.queries[shape] = {'sql': sql, 'count': 1}
+            else:
+                query['count'] += 1
+
+    def __enter__(self):
+        set_trace_callback(self.record)
+        return self
+
+    def __exit__(self, *args):
+        set_trace_callback(None)
+
+
+def get_query_plan(cur, sql, params=()):
+    """Returns the detail lines of the query plan of a statement"""
+    rows = cur.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    return [row[3] for row in rows]
+
+
+def find_scans(plan):
+    """Returns the plan steps which read a whole table or index"""
+    return [
+        step for step in plan
+        if step.startswith('SCAN ') and step != 'SCAN CONSTANT ROW'
+    ]
+
+
+def advise(queries, db_path=NEWRL_DB):
+    """Explains recorded queries and returns them with the scans found
+
+    Queries which no longer parse against the database, such as ones on
+    dropped temporary tables, are reported with their error. Uses its own
+    connection, as a cached EXPLAIN statement keeps its plan after the
+    schema changes.
+    """
+    con = connect(db_path, read_only=True)
+    cur = con.cursor()
+    report = []
+    for shape, query in queries.items():
+        entry = {'query': shape, 'count': query['count'], 'plan': [], 'scans': [], 'error': None}
+        try:
+            entry['plan'] = get_query_plan(cur, query['sql'])
+        except Exception as e:
+            entry['error'] = str(e)
+        entry['scans'] = find_scans(entry['plan'])
+        report.append(entry)
+    con.close()
+    report.sort(key=lambda entry: (not entry['scans'], -entry['count']))
+    return report
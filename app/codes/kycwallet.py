@@ -1,14 +1,14 @@
 """Wallet manager"""
 import codecs
-import ecdsa
 from Crypto.Hash import keccak
 import os
 import hashlib
 import datetime
 import base64
-import sqlite3
 
+from .crypto import derive_public_key
 from .utils import get_time_ms
+from .storage import get_cursor
 from ..constants import TMP_PATH, NEWRL_DB
 from .transactionmanager import Transactionmanager
 
@@ -28,9 +28,7 @@ def get_address_from_public_key(public_key):
 def generate_wallet_address():
     private_key_bytes = os.urandom(32)
     key_data = {'public': None, 'private': None, 'address': None}
-    key = ecdsa.SigningKey.from_string(
-        private_key_bytes, curve=ecdsa.SECP256k1).verifying_key
-    key_bytes = key.to_string()
+    key_bytes = derive_public_key(private_key_bytes)
 
     private_key_hex = private_key_bytes.hex()
     public_key_hex = key_bytes.hex()
@@ -139,13 +137,12 @@ def get_digest(file_path):
     return h.hexdigest()
 
 
-def get_person_id_for_wallet_from_db(addressinput):
-    con = sqlite3.connect(NEWRL_DB)
-    cur = con.cursor()
+def get_person_id_for_wallet_from_db(addressinput, cur=None):
+    if cur is None:
+        cur = get_cursor()
     wallet_cursor = cur.execute(
         'SELECT person_id FROM person_wallet WHERE wallet_id=?', (addressinput, )).fetchone()
     if wallet_cursor is None:
         return None
     pid = wallet_cursor[0]
-    con.close()
     return wallet_cursor[0]
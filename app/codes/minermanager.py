@@ -1,5 +1,4 @@
 """Miner update functions"""
-import sqlite3
 import logging
 
 from .blockchain import get_last_block_index
@@ -12,6 +11,7 @@ from .auth.auth import get_wallet
 from .signmanager import sign_transaction
 from ..ntypes import TRANSACTION_MINER_ADDITION
 from .utils import get_time_ms
+from .storage import get_cursor
 from .transactionmanager import Transactionmanager
 from .validator import validate
 from .committeemanager import get_eligible_miners, get_miner_for_current_block, get_committee_for_current_block
@@ -53,8 +53,7 @@ def miner_addition_transaction(wallet=None, my_address=None):
 
 
 def get_miner_status(wallet_address):
-    con = sqlite3.connect(NEWRL_DB)
-    cur = con.cursor()
+    cur = get_cursor()
     miner_cursor = cur.execute(
         'SELECT wallet_address, network_address, last_broadcast_timestamp FROM miners WHERE wallet_address=?', (wallet_address, )).fetchone()
     if miner_cursor is None:
@@ -64,7 +63,6 @@ def get_miner_status(wallet_address):
         'network_address': miner_cursor[1],
         'broadcast_timestamp': miner_cursor[2]
     }
-    con.close()
     return miner_info
 
 
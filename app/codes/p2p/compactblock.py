@@ -0,0 +1,106 @@
+"""Compact block relay
+
+Blocks are relayed with transaction codes in place of transactions.
+Receivers take the transactions from their mempool and fetch only the
+missing ones from the peer which sent the block.
+"""
+
+import copy
+import logging
+import requests
+
+from app.codes.blockchain import block_exists
+from app.codes.crypto import calculate_hash
+from app.codes.fs.archivemanager import get_block_from_archive
+from app.codes.fs.mempool_manager import mempool
+from app.codes.fs.temp_manager import get_blocks_for_index_from_storage
+from app.codes.p2p.packager import from_compact_block
+from app.codes.p2p.sync_chain import receive_block
+from app.constants import REQUEST_TIMEOUT
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def receive_compact_block(compact_block, sender_url):
+    """Rebuilds a compact block and hands it to receive_block"""
+    if block_exists(compact_block['index']):
+        logger.info('Block alredy exist in chain. Ignoring.')
+        return False
+    transaction_codes = compact_block['data']['text']['transactions']
+    transactions = {}
+    for transaction_code in transaction_codes:
+        transaction = mempool.get(transaction_code)
+        if transaction is not None:
+            transactions[transaction_code] = copy.deepcopy(transaction)
+
+    missing = [code for code in transaction_codes if code not in transactions]
+    if len(missing) > 0:
+        logger.info(f'Fetching {len(missing)} of {len(transaction_codes)} block transactions from {sender_url}')
+        transactions.update(fetch_block_transactions(sender_url, compact_block, missing))
+    block, missing = from_compact_block(compact_block, transactions)
+    if block is None:
+        logger.info(f'Could not get transactions {missing} of compact block {compact_block["index"]}')
+        return False
+
+    if calculate_hash(block['data']) != block['hash']:
+        # A mempool copy differs from the transaction in the block
+        logger.info('Compact block does not match its hash. Fetching all transactions.')
+        transactions = fetch_block_transactions(sender_url, compact_block, transaction_codes)
+        block, missing = from_compact_block(compact_block, transactions)
+        if block is None or calculate_hash(block['data']) != block['hash']:
+            logger.info(f'Could not rebuild compact block {compact_block["index"]}')
+            return False
+    return receive_block(block)
+
+
+def fetch_block_transactions(url, compact_block, transaction_codes):
+    """Returns {transaction code: transaction} for the codes the peer has"""
+    try:
+        response = requests.post(
+            url + '/get-block-transactions',
+            json={
+                'block_index': compact_block['index'],
+                'block_hash': compact_block['hash'],
+                'transaction_codes': transaction_codes,
+            },
+            timeout=REQUEST_TIMEOUT
+        )
+        fetched = response.json()
+    except Exception as e:
+        logger.info(f'Could not fetch block transactions from {url}: {e}')
+        return {}
+    requested = set(transaction_codes)
+    transactions = {}
+    for transaction in fetched:
+        transaction_code = transaction['transaction']['trans_code']
+        if transaction_code in requested:
+            transactions[transaction_code] = transaction
+    return transactions
+
+
+def get_block_transactions(block_index, block_hash, transaction_codes):
+    """Returns the transactions of a proposed or committed block, mempool as a fallback"""
+    block_transactions = {}
+    for block_payload in get_blocks_for_index_from_storage(block_index):
+        if block_payload.get('hash') == block_hash:
+            block_transactions = get_transactions_by_code(block_payload['data'])
+            break
+    else:
+        archived_block = get_block_from_archive(block_index)
+        if archived_block is not None and calculate_hash(archived_block) == block_hash:
+            block_transactions = get_transactions_by_code(archived_block)
+
+    transactions = []
+    for transaction_code in transaction_codes:
+        transaction = block_transactions.get(transaction_code) or mempool.get(transaction_code)
+        if transaction is not None:
+            transactions.append(transaction)
+    return transactions
+
+
+def get_transactions_by_code(block):
+    return {
+        t['transaction']['trans_code']: t for t in block['text']['transactions']
+    }
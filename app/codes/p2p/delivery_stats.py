@@ -0,0 +1,62 @@
+"""Per peer results of requests sent by this node"""
+
+import threading
+from urllib.parse import urlparse
+
+from ..clock.global_time import get_corrected_time_ms
+from ...constants import DELIVERY_LATENCY_SMOOTHING
+
+
+class PeerDeliveryStats:
+    """Latency, status and bytes of the requests sent to each peer
+
+    Latency is kept as the last value and an exponential moving average so
+    that a peer which is slow on most requests stands out.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.peers = {}
+
+    def record(self, url, status, latency_ms, bytes_sent):
+        """Records one request. status is None when the request failed to get a response"""
+        peer = urlparse(url).netloc or url
+        with self.lock:
+            stats = self.peers.get(peer)
+            if stats is None:
+                stats = {
+                    'requests': 0,
+                    'failures': 0,
+                    'bytes_sent': 0,
+                    'last_status': None,
+                    'last_latency_ms': None,
+                    'average_latency_ms': None,
+                    'last_request_time': None,
+                }
+                self.peers[peer] = stats
+            stats['requests'] += 1
+            if status is None or status >= 400:
+                stats['failures'] += 1
+            stats['bytes_sent'] += bytes_sent
+            stats['last_status'] = status
+            stats['last_latency_ms'] = latency_ms
+            if stats['average_latency_ms'] is None:
+                stats['average_latency_ms'] = latency_ms
+            else:
+                stats['average_latency_ms'] += DELIVERY_LATENCY_SMOOTHING * (
+                    latency_ms - stats['average_latency_ms'])
+            stats['last_request_time'] = get_corrected_time_ms()
+
+    def clear(self):
+        with self.lock:
+            self.peers = {}
+
+    def get_stats(self):
+        """Returns the stats of every peer, slowest first"""
+        with self.lock:
+            peers = {peer: dict(stats) for peer, stats in self.peers.items()}
+        return dict(sorted(
+            peers.items(), key=lambda item: item[1]['average_latency_ms'] or 0, reverse=True))
+
+
+delivery_stats = PeerDeliveryStats()
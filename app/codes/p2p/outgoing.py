@@ -3,12 +3,16 @@ import logging
 import random
 import time
 import requests
-from threading import Thread
+from threading import Lock, Thread
+from urllib.parse import urlparse
 
-from app.codes.p2p.packager import compress_block_payload
+from app.codes.p2p.delivery_stats import delivery_stats
+from app.codes.p2p.packager import WIRE_CONTENT_TYPE, compress_block_payload, encode_wire_payload, to_compact_block
+from app.codes.serialization import encode
 
 from ..clock.global_time import get_corrected_time_ms
-from ...constants import IS_TEST, MAX_BROADCAST_NODES, NETWORK_TRUSTED_ARCHIVE_NODES, NEWRL_PORT, REQUEST_TIMEOUT, TRANSPORT_SERVER
+from ..fs.mempool_manager import get_mempool_transaction
+from ...constants import IS_TEST, MAX_BROADCAST_NODES, MAX_TRANSACTION_ANNOUNCE_SIZE, MAX_TRANSACTION_BATCH_SIZE, NETWORK_TRUSTED_ARCHIVE_NODES, NEWRL_PORT, REQUEST_TIMEOUT, TRANSACTION_ANNOUNCE_INTERVAL_SECONDS, TRANSPORT_SERVER, WIRE_FORMAT_RETRY_SECONDS
 from ..p2p.utils import get_my_address, get_peers
 from ..p2p.utils import is_my_address
 
@@ -16,60 +20,98 @@ from ..p2p.utils import is_my_address
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def propogate_transaction_to_peers(transaction, exclude_nodes=None):
+# Peer address to the time it last rejected the compact wire format
+legacy_wire_peers = {}
+# Peer address to the time it last rejected a compact block
+full_block_peers = {}
+# Peer address to the time it last rejected a transaction announcement
+full_transaction_peers = {}
+
+announcement_lock = Lock()
+pending_announcements = []
+
+
+def queue_transaction_announcement(transaction_codes):
+    """Queues transaction codes for the next announcement to peers"""
     if IS_TEST:
         return
-    peers = get_peers()
-    if exclude_nodes:
-        peers = get_excluded_peers_to_broadcast(peers, exclude_nodes)
+    with announcement_lock:
+        pending_announcements.extend(transaction_codes)
 
-    node_count = min(MAX_BROADCAST_NODES, len(peers))
-    peers = random.sample(peers, k=node_count)
-    
-    payload = {
-        'signed_transaction': transaction,
-        'peers_already_broadcasted': get_excluded_node_list(peers, exclude_nodes)
-    }
 
-    logger.info(f"Broadcasting transaction to peers {peers}")
+def announce_transactions_to_peers():
+    """Sends queued transaction codes to random peers
+
+    Each peer replies with the codes it is missing and only those
+    transactions are sent to it.
+    """
+    with announcement_lock:
+        transaction_codes = pending_announcements[:MAX_TRANSACTION_ANNOUNCE_SIZE]
+        del pending_announcements[:MAX_TRANSACTION_ANNOUNCE_SIZE]
+    if len(transaction_codes) == 0:
+        return
+
+    peers = get_random_peers()
+    logger.info(f"Announcing {len(transaction_codes)} transactions to peers {peers}")
     for peer in peers:
         if is_my_address(peer['address']):
             continue
         url = 'http://' + peer['address'] + ':' + str(NEWRL_PORT)
+        thread = Thread(target=announce_transactions_to_peer, args=(url, transaction_codes))
+        thread.start()
+
+
+def announce_transactions_to_peer(url, transaction_codes):
+    """Announces transaction codes to a peer and sends the ones it is missing
+
+    Peers which do not take announcements, being on older software, are
+    sent every transaction and keep getting them for WIRE_FORMAT_RETRY_SECONDS.
+    """
+    missing = None
+    if not has_rejected(full_transaction_peers, url):
         try:
-            thread = Thread(target=send_request, args = (url + '/receive-transaction', payload))
-            thread.start()
+            response = requests.post(
+                url + '/announce-transactions',
+                json={'transaction_codes': transaction_codes},
+                timeout=REQUEST_TIMEOUT
+            )
+            if 200 <= response.status_code < 300:
+                missing = set(response.json()['missing'])
+            else:
+                logger.info(f'Peer {url} rejected transaction announcement with status {response.status_code}. Sending transactions.')
+                if is_rejection(response.status_code):
+                    full_transaction_peers[urlparse(url).netloc] = time.time()
         except Exception as e:
-            pass
-            # logger.warn(f"Error broadcasting transaction to peer: {url} Error - {str(e)}")
+            logger.info(f'Could not announce transactions to peer {url}: {e}. Sending transactions.')
+    if missing is None:
+        missing = set(transaction_codes)
 
+    transactions = []
+    for transaction_code in transaction_codes:
+        if transaction_code not in missing:
+            continue
+        transaction = get_mempool_transaction(transaction_code)
+        if transaction is not None:
+            transactions.append(transaction)
+    for start in range(0, len(transactions), MAX_TRANSACTION_BATCH_SIZE):
+        send_wire_request(url + '/receive-transactions', {
+            'transactions': transactions[start:start + MAX_TRANSACTION_BATCH_SIZE],
+            'peers_already_broadcasted': []
+        }, as_json=True)
 
-def propogate_transaction_batch_to_peers(transactions, exclude_nodes=None):
-    if IS_TEST:
-        return
-    peers = get_peers()
-    if exclude_nodes:
-        peers = get_excluded_peers_to_broadcast(peers, exclude_nodes)
 
-    node_count = min(MAX_BROADCAST_NODES, len(peers))
-    peers = random.sample(peers, k=node_count)
-    
-    payload = {
-        'transactions': transactions,
-        'peers_already_broadcasted': get_excluded_node_list(peers, exclude_nodes)
-    }
+def start_transaction_announcer_thread():
+    def announce():
+        while True:
+            time.sleep(TRANSACTION_ANNOUNCE_INTERVAL_SECONDS)
+            try:
+                announce_transactions_to_peers()
+            except Exception as e:
+                logger.error(f'Transaction announcement failed: {e}')
 
-    logger.info(f"Broadcasting transaction to peers {peers}")
-    for peer in peers:
-        if is_my_address(peer['address']):
-            continue
-        url = 'http://' + peer['address'] + ':' + str(NEWRL_PORT)
-        try:
-            thread = Thread(target=send_request, args = (url + '/receive-transactions', payload))
-            thread.start()
-        except Exception as e:
-            pass
-            # logger.warn(f"Error broadcasting block to peer: {url} Error - {str(e)}")
+    thread = Thread(target=announce, daemon=True)
+    thread.start()
+    return thread
 
 
 def send_request_in_thread(url, data, as_json=True):
@@ -77,17 +119,122 @@ def send_request_in_thread(url, data, as_json=True):
     thread.start()
 
 def send_request(url, data, as_json=True):
+    """Posts data to url and records the delivery for the peer
+
+    With as_json=False data is sent as a compressed block payload. Bytes
+    are taken to be compressed already so that a broadcast compresses once
+    for all peers.
+    """
     if IS_TEST:
         return
+    if as_json:
+        body = encode(data)
+        headers = {'Content-Type': 'application/json'}
+    else:
+        body = data if isinstance(data, bytes) else compress_block_payload(data)
+        headers = None
+    post_request(url, body, headers)
+
+
+def post_request(url, body, headers=None):
+    """Posts body to url, records the delivery and returns the status or None on failure"""
+    status = None
+    start_time = time.perf_counter()
     try:
-        if as_json:
-            requests.post(url, json=data, timeout=REQUEST_TIMEOUT)
-        else:
-            data = compress_block_payload(data)
-            requests.post(url, data=data, timeout=REQUEST_TIMEOUT)
+        response = requests.post(url, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+        status = response.status_code
     except Exception as e:
         pass
         # logger.warn(f"Error broadcasting block to peer: {url} Error - {str(e)}")
+    latency_ms = (time.perf_counter() - start_time) * 1000
+    delivery_stats.record(url, status, latency_ms, len(body))
+    return status
+
+
+def has_rejected(rejections, url):
+    """Checks if the peer at url rejected a format within WIRE_FORMAT_RETRY_SECONDS"""
+    rejected_time = rejections.get(urlparse(url).netloc)
+    return rejected_time is not None and time.time() - rejected_time <= WIRE_FORMAT_RETRY_SECONDS
+
+
+def is_rejection(status):
+    return status is not None and status >= 400 and status != 429
+
+
+class EncodedBodies:
+    """Wire and legacy encodings of a payload shared by the threads sending it
+
+    Each encoding is made once, by the first peer which needs it, so a
+    broadcast never encodes per peer and peers taking the compact block do
+    not pay for the full block encodings.
+    """
+
+    def __init__(self, payload, as_json=False):
+        self.payload = payload
+        self.as_json = as_json
+        self.lock = Lock()
+        self.wire_body = None
+        self.legacy_body = None
+
+    def get_wire_body(self):
+        with self.lock:
+            if self.wire_body is None:
+                self.wire_body = encode_wire_payload(self.payload)
+            return self.wire_body
+
+    def get_legacy_body(self):
+        with self.lock:
+            if self.legacy_body is None:
+                self.legacy_body = encode(self.payload) if self.as_json else compress_block_payload(self.payload)
+            return self.legacy_body
+
+
+def send_wire_request(url, payload, bodies=None, as_json=False):
+    """Posts payload in the compact wire format
+
+    Peers which reject it, being on older software, are sent the legacy
+    encoding instead and keep getting it for WIRE_FORMAT_RETRY_SECONDS.
+    Pass bodies to share the encodings between peers.
+    """
+    if IS_TEST:
+        return
+    if bodies is None:
+        bodies = EncodedBodies(payload, as_json)
+    if not has_rejected(legacy_wire_peers, url):
+        status = post_request(url, bodies.get_wire_body(), {'Content-Type': WIRE_CONTENT_TYPE})
+        if not is_rejection(status):
+            return
+        logger.info(f'Peer {url} rejected wire format with status {status}. Sending legacy payload.')
+        legacy_wire_peers[urlparse(url).netloc] = time.time()
+    headers = {'Content-Type': 'application/json'} if bodies.as_json else None
+    post_request(url, bodies.get_legacy_body(), headers)
+
+
+def send_compact_block(url, compact_body, block_bodies):
+    """Sends a compact block to the node at url
+
+    Nodes which reject compact blocks get the full block instead.
+    """
+    if not has_rejected(full_block_peers, url):
+        status = post_request(url + '/receive-compact-block', compact_body, {'Content-Type': WIRE_CONTENT_TYPE})
+        if not is_rejection(status):
+            return
+        logger.info(f'Peer {url} rejected compact block with status {status}. Sending full block.')
+        full_block_peers[urlparse(url).netloc] = time.time()
+    send_wire_request(url + '/receive-block-binary', block_bodies.payload, block_bodies)
+
+
+def send_to_peers(urls, block_payload):
+    """Sends a block payload to the node at every url, one thread each
+
+    The compact block is encoded once for all peers, and the full block
+    encodings once for all peers falling back to them.
+    """
+    compact_body = encode_wire_payload(to_compact_block(block_payload))
+    block_bodies = EncodedBodies(block_payload)
+    for url in urls:
+        thread = Thread(target=send_compact_block, args=(url, compact_body, block_bodies))
+        thread.start()
 
 def send(payload):
     response = requests.post(TRANSPORT_SERVER + '/send', json=payload, timeout=REQUEST_TIMEOUT)
@@ -110,7 +257,7 @@ def broadcast_receipt(receipt, nodes):
         logger.info(f"Sending receipt to node {url}")
         payload = {'receipt': receipt}
         try:
-            thread = Thread(target=send_request, args=(url + '/receive-receipt', payload))
+            thread = Thread(target=send_wire_request, args=(url + '/receive-receipt', payload, None, True))
             thread.start()
         except Exception as e:
             pass
@@ -138,21 +285,17 @@ def broadcast_block(block_payload, nodes=None, exclude_nodes=None, send_to_archi
     if my_address in peers_i_am_broadcasting:
         peers_i_am_broadcasting.remove(my_address)
     block_payload['peers_already_broadcasted'] = peers_i_am_broadcasting
-    # TODO - Do not send to self
+    urls = []
     for peer in peers:
         if 'address' not in peer or is_my_address(peer['address']):
             continue
-        url = 'http://' + peer['address'] + ':' + str(NEWRL_PORT)
-        try:
-            # send_request_in_thread(url + '/receive-block', {'block': block_payload})
-            send_request_in_thread(url + '/receive-block-binary', block_payload, as_json=False)
-        except Exception as e:
-            pass
-            # logger.warn(f"Error broadcasting block-binary to peer: {url} Error - {str(e)}")
+        urls.append('http://' + peer['address'] + ':' + str(NEWRL_PORT))
     if send_to_archive:
         for archive_node in NETWORK_TRUSTED_ARCHIVE_NODES:
-            url = 'http://' + archive_node + ':' + str(NEWRL_PORT)
-            send_request_in_thread(url + '/receive-block-binary', block_payload, as_json=False)
+            urls.append('http://' + archive_node + ':' + str(NEWRL_PORT))
+    if len(urls) == 0:
+        return True
+    send_to_peers(urls, block_payload)
     return True
 
 
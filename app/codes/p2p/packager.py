@@ -1,6 +1,31 @@
-"""Library for packing and unpacking blocks for quick transport"""
+"""Library for packing and unpacking blocks for quick transport
+
+Payloads go over the wire in one of two encodings. The legacy one is zlib
+compressed JSON. The compact one starts with WIRE_FORMAT_MAGIC and a version
+byte followed by a zlib compressed binary encoding. Dicts with a known key
+order are written as positional arrays and hex and base64 strings as raw
+bytes. Every value decodes back to exactly what was encoded, key order
+included, so block hashes and signatures are unaffected.
+
+From version 2 a dictionary version byte follows the format version. zlib
+is then primed with that preset dictionary, which holds values that recur
+across payloads such as miner addresses, so that single transactions and
+receipts compress well too. Dictionary 0 means no dictionary.
+
+Payloads come from peers, so decoding raises ValueError on any malformed
+input and decompresses at most MAX_DECOMPRESSED_PAYLOAD_BYTES.
+"""
+import base64
+import glob
 import json
+import os
+import re
+import struct
 import zlib
+from collections import Counter
+
+from app.codes.serialization import encode, track
+from app.constants import COMPRESSION_DICTIONARY_SIZE, COMPRESSION_DICTIONARY_VERSION, MAX_DECOMPRESSED_PAYLOAD_BYTES, WIRE_FORMAT_VERSION
 
 def compress_signature(signature):
     return [signature['wallet_address'], signature['msgsign']]
@@ -69,61 +94,370 @@ def decompress_block_transaction(compressed_transaction):
         }
 
 
+WIRE_FORMAT_MAGIC = b'NWR'
+WIRE_CONTENT_TYPE = 'application/x-newrl-wire'
+
+# Key orders written positionally, by wire format version. The index in the
+# tuple is the shape id on the wire so shapes are only ever appended within
+# a version.
+WIRE_SHAPES = {
+    1: (
+        ('index', 'hash', 'data', 'receipts', 'software_version', 'peers_already_broadcasted'),
+        ('index', 'hash', 'data', 'receipts', 'peers_already_broadcasted'),
+        ('index', 'timestamp', 'proof', 'status', 'text', 'creator_wallet', 'expected_miner', 'committee', 'previous_hash'),
+        ('index', 'timestamp', 'proof', 'text', 'creator_wallet', 'expected_miner', 'committee', 'previous_hash'),
+        ('transactions', 'previous_block_receipts'),
+        ('transactions', 'signatures'),
+        ('data', 'public_key', 'signature'),
+        ('block_index', 'block_hash', 'vote', 'timestamp', 'wallet_address'),
+        ('transaction', 'signatures'),
+        ('timestamp', 'trans_code', 'type', 'currency', 'fee', 'descr', 'valid', 'specific_data'),
+        ('wallet_address', 'msgsign'),
+        ('transactions', 'peers_already_broadcasted'),
+        ('wallet_address', 'network_address', 'broadcast_timestamp', 'software_version', 'last_block_index'),
+    ),
+}
+WIRE_SHAPES[2] = WIRE_SHAPES[1]
+WIRE_SHAPE_IDS = {
+    version: {keys: shape_id for shape_id, keys in enumerate(shapes)}
+    for version, shapes in WIRE_SHAPES.items()
+}
+
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_INT = 3
+_FLOAT = 4
+_STR = 5
+_LIST = 6
+_DICT = 7
+_HEX = 8
+_PREFIXED_HEX = 9
+_BASE64 = 10
+_SHAPE = 11
+
+# Shorter strings are not worth the checks
+_MIN_PACKED_STRING_LENGTH = 16
+_HEX_PATTERN = re.compile('[0-9a-f]+')
+_BASE64_PATTERN = re.compile('[A-Za-z0-9+/]+={0,2}')
+_FLOAT_STRUCT = struct.Struct('>d')
+
+DICTIONARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dictionaries')
+DICTIONARY_FILE_PATTERN = 'wire_v{}.zdict'
+_MIN_DICTIONARY_TOKEN_LENGTH = 3
+_MAX_DICTIONARY_SAMPLE_LENGTH = 1024
+_DICTIONARY_SAMPLES = 4
+
+
+def load_compression_dictionaries(path=DICTIONARY_PATH):
+    """Returns {version: dictionary bytes} for the dictionaries shipped in path"""
+    dictionaries = {}
+    for file_name in glob.glob(os.path.join(path, DICTIONARY_FILE_PATTERN.format('*'))):
+        version = os.path.basename(file_name)[len('wire_v'):-len('.zdict')]
+        if not version.isdigit():
+            continue
+        with open(file_name, 'rb') as _file:
+            dictionaries[int(version)] = _file.read()
+    return dictionaries
+
+
+compression_dictionaries = load_compression_dictionaries()
+
+
 def compress_block_payload(block_payload):
-    compressed_data = zlib.compress(json.dumps(block_payload).encode("utf-8"))
-    return compressed_data
-    receipts = list(
-        map(lambda r: compress_block_receipt(r), block_payload['receipts']))
-    previous_block_receipts = list(
-        map(lambda r: compress_block_receipt(r),
-            block_payload['data']['text']['previous_block_receipts']))
-    transactions = list(
-        map(lambda r: compress_block_transaction(r),
-            block_payload['data']['text']['transactions']))
-    block_list = [
-        block_payload['index'],
-        block_payload['hash'],
-        block_payload['data']['index'],
-        block_payload['data']['timestamp'],
-        block_payload['data']['proof'],
-        transactions,
-        previous_block_receipts,
-        block_payload['data']['creator_wallet'],
-        block_payload['data']['expected_miner'],
-        block_payload['data']['committee'],
-        block_payload['data']['previous_hash'],
-        receipts,
-        block_payload['software_version'],
-        block_payload['peers_already_broadcasted'],
-    ]
-    # compressed_data = zlib.compress(json.dumps(block_list).encode("utf-8"))
-    compressed_data = zlib.compress(json.dumps(block_payload).encode("utf-8"))
+    compressed_data = zlib.compress(encode(block_payload))
     return compressed_data
 
+
 def decompress_block_payload(compressed_block):
-    compressed_block = zlib.decompress(compressed_block)
-    compressed_block = json.loads(compressed_block)
+    """Unpacks a block payload sent in either wire encoding"""
+    if is_wire_payload(compressed_block):
+        return track(decode_wire_payload(compressed_block))
+    compressed_block = _inflate(compressed_block)
+    compressed_block = track(json.loads(compressed_block))
     return compressed_block
-    transactions = list(map(lambda r: decompress_block_transaction(r), compressed_block[5]))
-    previous_block_receipts = list(map(lambda r: decompress_block_receipt(r), compressed_block[6]))
-    receipts = list(map(lambda r: decompress_block_receipt(r), compressed_block[11]))
-    return {
-        'index': compressed_block[0],
-        'hash': compressed_block[1],
-        'data': {
-            'index': compressed_block[2],
-            'timestamp': compressed_block[3],
-            'proof': compressed_block[4],
-            'text': {
-                'transactions': transactions,
-                'previous_block_receipts': previous_block_receipts
-            },
-            "creator_wallet": compressed_block[7],
-            "expected_miner": compressed_block[8],
-            "committee": compressed_block[9],
-            "previous_hash": compressed_block[10]
-        },
-        'receipts': receipts,
-        'software_version': compressed_block[12],
-        'peers_already_broadcasted': compressed_block[13],
-    }
+
+
+def to_compact_block(block_payload):
+    """Returns the block payload with its transactions replaced by their codes
+
+    Peers rebuild the block from their mempool with from_compact_block.
+    """
+    text = dict(block_payload['data']['text'])
+    text['transactions'] = [t['transaction']['trans_code'] for t in text['transactions']]
+    data = dict(block_payload['data'])
+    data['text'] = text
+    compact_block = dict(block_payload)
+    compact_block['data'] = data
+    return compact_block
+
+
+def from_compact_block(compact_block, transactions):
+    """Rebuilds a block payload from a compact one
+
+    transactions maps transaction codes to transactions. Returns the block
+    payload and the codes missing from transactions. The block is None
+    when any are missing.
+    """
+    transaction_codes = compact_block['data']['text']['transactions']
+    missing = [code for code in transaction_codes if code not in transactions]
+    if len(missing) > 0:
+        return None, missing
+    text = dict(compact_block['data']['text'])
+    text['transactions'] = [transactions[code] for code in transaction_codes]
+    data = dict(compact_block['data'])
+    data['text'] = text
+    block_payload = dict(compact_block)
+    block_payload['data'] = data
+    return track(block_payload), []
+
+
+def is_wire_payload(data):
+    return data[:len(WIRE_FORMAT_MAGIC)] == WIRE_FORMAT_MAGIC
+
+
+def encode_wire_payload(payload, version=WIRE_FORMAT_VERSION, dictionary_version=COMPRESSION_DICTIONARY_VERSION):
+    """Encodes a JSON compatible payload in the compact wire format
+
+    A dictionary this node does not have is replaced by no dictionary.
+    """
+    if version not in WIRE_SHAPES:
+        raise ValueError(f'Unsupported wire format version {version}')
+    out = bytearray()
+    _write(payload, out, WIRE_SHAPE_IDS[version])
+    if version == 1:
+        return WIRE_FORMAT_MAGIC + bytes([version]) + zlib.compress(out)
+    if dictionary_version not in compression_dictionaries:
+        dictionary_version = 0
+    return WIRE_FORMAT_MAGIC + bytes([version, dictionary_version]) + _compress(out, dictionary_version)
+
+
+def decode_wire_payload(data):
+    """Decodes a compact wire format payload
+
+    Raises ValueError when the data is not in a wire format version this
+    node understands or is malformed.
+    """
+    if not is_wire_payload(data):
+        raise ValueError('Not a wire format payload')
+    try:
+        position = len(WIRE_FORMAT_MAGIC)
+        version = data[position]
+        if version not in WIRE_SHAPES:
+            raise ValueError(f'Unsupported wire format version {version}')
+        if version == 1:
+            body = _inflate(data[position + 1:])
+        else:
+            dictionary_version = data[position + 1]
+            if dictionary_version != 0 and dictionary_version not in compression_dictionaries:
+                raise ValueError(f'Unsupported compression dictionary version {dictionary_version}')
+            body = _decompress(data[position + 2:], dictionary_version)
+        value, position = _read(body, 0, WIRE_SHAPES[version])
+    except (IndexError, KeyError, TypeError, RecursionError, struct.error) as e:
+        raise ValueError(f'Malformed wire format payload: {e!r}')
+    if position != len(body):
+        raise ValueError('Trailing bytes in wire format payload')
+    return value
+
+
+def build_compression_dictionary(payloads, size=COMPRESSION_DICTIONARY_SIZE, version=WIRE_FORMAT_VERSION):
+    """Builds a preset dictionary from representative payloads
+
+    Encoded values found in more than one payload are kept, the most common
+    last since zlib reaches the end of the dictionary with the shortest
+    distances. The encodings of a few small payloads follow so that the
+    positional layout of transactions and receipts is matched as a whole.
+    """
+    shape_ids = WIRE_SHAPE_IDS[version]
+    counts = Counter()
+    samples = []
+    for payload in payloads:
+        tokens = set()
+        _collect_dictionary_tokens(payload, shape_ids, tokens)
+        counts.update(tokens)
+        out = bytearray()
+        _write(payload, out, shape_ids)
+        if len(out) <= _MAX_DICTIONARY_SAMPLE_LENGTH:
+            samples.append(bytes(out))
+    tokens = sorted(
+        (token for token, count in counts.items() if count > 1),
+        key=lambda token: (counts[token], len(token)))
+    dictionary = b''.join(tokens) + b''.join(samples[-_DICTIONARY_SAMPLES:])
+    return dictionary[-size:]
+
+
+def _collect_dictionary_tokens(value, shape_ids, tokens):
+    if isinstance(value, dict):
+        for item in value.values():
+            _collect_dictionary_tokens(item, shape_ids, tokens)
+        return
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            _collect_dictionary_tokens(item, shape_ids, tokens)
+        return
+    out = bytearray()
+    _write(value, out, shape_ids)
+    if len(out) >= _MIN_DICTIONARY_TOKEN_LENGTH:
+        tokens.add(bytes(out))
+
+
+def _compress(data, dictionary_version):
+    if dictionary_version == 0:
+        return zlib.compress(data)
+    compressor = zlib.compressobj(zdict=compression_dictionaries[dictionary_version])
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data, dictionary_version):
+    if dictionary_version == 0:
+        return _inflate(data)
+    return _inflate(data, compression_dictionaries[dictionary_version])
+
+
+def _inflate(data, zdict=None):
+    """Decompresses zlib data of at most MAX_DECOMPRESSED_PAYLOAD_BYTES
+
+    Raises ValueError when the data is corrupt, truncated or too large.
+    """
+    decompressor = zlib.decompressobj() if zdict is None else zlib.decompressobj(zdict=zdict)
+    try:
+        body = decompressor.decompress(data, MAX_DECOMPRESSED_PAYLOAD_BYTES + 1)
+    except zlib.error as e:
+        raise ValueError(f'Corrupt compressed payload: {e}')
+    if len(body) > MAX_DECOMPRESSED_PAYLOAD_BYTES:
+        raise ValueError(f'Payload decompresses to more than {MAX_DECOMPRESSED_PAYLOAD_BYTES} bytes')
+    if not decompressor.eof:
+        raise ValueError('Truncated compressed payload')
+    return body
+
+
+def _write_varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _write_bytes(tag, value, out):
+    out.append(tag)
+    _write_varint(len(value), out)
+    out += value
+
+
+def _write_str(value, out):
+    length = len(value)
+    if length >= _MIN_PACKED_STRING_LENGTH and length % 2 == 0:
+        if _HEX_PATTERN.fullmatch(value):
+            _write_bytes(_HEX, bytes.fromhex(value), out)
+            return
+        if value.startswith('0x') and _HEX_PATTERN.fullmatch(value, 2):
+            _write_bytes(_PREFIXED_HEX, bytes.fromhex(value[2:]), out)
+            return
+    if length >= _MIN_PACKED_STRING_LENGTH and length % 4 == 0 and _BASE64_PATTERN.fullmatch(value):
+        raw = base64.b64decode(value)
+        # Only canonical base64 decodes back to the same text
+        if base64.b64encode(raw).decode() == value:
+            _write_bytes(_BASE64, raw, out)
+            return
+    _write_bytes(_STR, value.encode(), out)
+
+
+def _write(value, out, shape_ids):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        _write_varint(value << 1 if value >= 0 else ((-value) << 1) - 1, out)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _FLOAT_STRUCT.pack(value)
+    elif isinstance(value, str):
+        _write_str(value, out)
+    elif isinstance(value, dict):
+        shape_id = shape_ids.get(tuple(value))
+        if shape_id is not None:
+            out.append(_SHAPE)
+            _write_varint(shape_id, out)
+            for item in value.values():
+                _write(item, out, shape_ids)
+        else:
+            out.append(_DICT)
+            _write_varint(len(value), out)
+            for key, item in value.items():
+                _write_str(str(key), out)
+                _write(item, out, shape_ids)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _write_varint(len(value), out)
+        for item in value:
+            _write(item, out, shape_ids)
+    else:
+        raise TypeError(f'Cannot encode {type(value).__name__} in wire format')
+
+
+def _read(data, position, shapes):
+    tag = data[position]
+    position += 1
+    if tag == _NONE:
+        return None, position
+    if tag == _TRUE:
+        return True, position
+    if tag == _FALSE:
+        return False, position
+    if tag == _INT:
+        value, position = _read_varint(data, position)
+        return (value >> 1 if not value & 1 else -((value + 1) >> 1)), position
+    if tag == _FLOAT:
+        return _FLOAT_STRUCT.unpack_from(data, position)[0], position + 8
+    if tag in (_STR, _HEX, _PREFIXED_HEX, _BASE64):
+        length, position = _read_varint(data, position)
+        raw = data[position:position + length]
+        if len(raw) != length:
+            raise ValueError('Truncated wire format payload')
+        position += length
+        if tag == _STR:
+            return raw.decode(), position
+        if tag == _HEX:
+            return raw.hex(), position
+        if tag == _PREFIXED_HEX:
+            return '0x' + raw.hex(), position
+        return base64.b64encode(raw).decode(), position
+    if tag == _LIST:
+        length, position = _read_varint(data, position)
+        items = []
+        for _ in range(length):
+            item, position = _read(data, position, shapes)
+            items.append(item)
+        return items, position
+    if tag == _DICT:
+        length, position = _read_varint(data, position)
+        value = {}
+        for _ in range(length):
+            key, position = _read(data, position, shapes)
+            value[key], position = _read(data, position, shapes)
+        return value, position
+    if tag == _SHAPE:
+        shape_id, position = _read_varint(data, position)
+        if shape_id >= len(shapes):
+            raise ValueError(f'Unknown wire format shape {shape_id}')
+        value = {}
+        for key in shapes[shape_id]:
+            value[key], position = _read(data, position, shapes)
+        return value, position
+    raise ValueError(f'Unknown wire format tag {tag}')
@@ -6,6 +6,7 @@ import socket
 import subprocess
 from threading import Thread
 from app.codes.signmanager import sign_object
+from app.codes.storage import get_cursor, write_transaction
 from app.codes.validator import validate_signature
 from app.migrations.init import init_newrl
 from ...constants import BOOTSTRAP_NODES, REQUEST_TIMEOUT, NEWRL_P2P_DB, NEWRL_PORT, MY_ADDRESS
@@ -18,34 +19,25 @@ logger = logging.getLogger(__name__)
 
 
 def clear_peer_db():
-    con = sqlite3.connect(NEWRL_P2P_DB)
-    cur = con.cursor()
-    cur.execute('DROP TABLE IF EXISTS peers')
-    con.commit()
-    con.close()
+    with write_transaction(NEWRL_P2P_DB) as cur:
+        cur.execute('DROP TABLE IF EXISTS peers')
 
 def init_peer_db():
-    con = sqlite3.connect(NEWRL_P2P_DB)
-    cur = con.cursor()
-    cur.execute('''
-                    CREATE TABLE IF NOT EXISTS peers
-                    (id text NOT NULL PRIMARY KEY,
-                    address text NOT NULL 
-                    )
-                    ''')
-    # Todo - link node to a person and add record in the node db
-    con.commit()
-    con.close()
+    with write_transaction(NEWRL_P2P_DB) as cur:
+        cur.execute('''
+                        CREATE TABLE IF NOT EXISTS peers
+                        (id text NOT NULL PRIMARY KEY,
+                        address text NOT NULL 
+                        )
+                        ''')
+        # Todo - link node to a person and add record in the node db
 
 
 def get_peers():
     peers = []
-    con = sqlite3.connect(NEWRL_P2P_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_cursor(NEWRL_P2P_DB, row_factory=sqlite3.Row)
     peer_cursor = cur.execute('SELECT * FROM peers').fetchall()
     peers = [dict(ix) for ix in peer_cursor]
-    con.close()
     return peers
 
 
@@ -55,43 +47,34 @@ def add_peer(peer_address):
     if peer_address == '127.0.0.1':
         return {'address': peer_address, 'status': 'FAILURE'}
 
-    con = sqlite3.connect(NEWRL_P2P_DB)
-    cur = con.cursor()
     try:
         logger.info('Adding peer %s', peer_address)
         # await register_me_with_them(peer_address)
-        cur.execute('INSERT OR REPLACE INTO peers(id, address) VALUES(?, ?)', (peer_address, peer_address, ))
-        con.commit()
+        with write_transaction(NEWRL_P2P_DB) as cur:
+            cur.execute('INSERT OR REPLACE INTO peers(id, address) VALUES(?, ?)', (peer_address, peer_address, ))
     except Exception as e:
         logger.info('Did not add peer %s', peer_address)
         return {'address': peer_address, 'status': 'FAILURE', 'reason': str(e)}
-    con.close()
     return {'address': peer_address, 'status': 'SUCCESS'}
 
 
 def remove_peer(peer_id):
-    con = sqlite3.connect(NEWRL_P2P_DB)
-    cur = con.cursor()
     try:
-        cur.execute('DELETE FROM peers where id = ?', (peer_id, ))
-        con.commit()
+        with write_transaction(NEWRL_P2P_DB) as cur:
+            cur.execute('DELETE FROM peers where id = ?', (peer_id, ))
     except Exception as e:
         print(e)
         return False
-    con.close()
     return True
 
 
 def clear_peers():
-    con = sqlite3.connect(NEWRL_P2P_DB)
-    cur = con.cursor()
     try:
-        cur.execute('DELETE FROM peers')
-        con.commit()
+        with write_transaction(NEWRL_P2P_DB) as cur:
+            cur.execute('DELETE FROM peers')
     except Exception as e:
         print(e)
         return False
-    con.close()
     return True
 
 def init_bootstrap_nodes():
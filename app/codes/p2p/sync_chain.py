@@ -1,25 +1,31 @@
 import json
 import logging
 import random
+import os
 import subprocess
 import requests
 import sqlite3
 import time
 import copy
 import multiprocessing
+import queue
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 from app.codes import blockchain
-from app.codes.dbmanager import get_snapshot_last_block_index
+from app.codes.dbmanager import get_snapshot_last_block_index, snapshots_paused
 from app.codes.fs.archivemanager import get_block_from_archive
 from app.codes.utils import get_last_block_hash
 from app.ntypes import BLOCK_CONSENSUS_INVALID, BLOCK_CONSENSUS_NA, BLOCK_CONSENSUS_VALID, BLOCK_STATUS_INVALID_MINED, BLOCK_VOTE_INVALID, BLOCK_VOTE_VALID
 from ..clock.global_time import get_corrected_time_ms
 from app.codes.crypto import calculate_hash
+from app.codes.serialization import encode, track
+from app.codes.statewriter import PRIORITY_CONSENSUS, PRIORITY_MAINTENANCE, PRIORITY_SYNC, state_writer
+from app.codes.storage import get_cursor, restore_database
 from app.codes.minermanager import am_i_in_block_committee, am_i_in_current_committee, get_committee_for_current_block
 from app.codes.p2p.outgoing import broadcast_receipt, broadcast_block
 from app.codes.receiptmanager import check_receipt_exists_in_db, validate_receipt
 # from app.codes.utils import store_block_proposal
-from app.constants import COMMITTEE_SIZE, MINIMUM_ACCEPTANCE_VOTES, NETWORK_TRUSTED_ARCHIVE_NODES, NEWRL_PORT, REQUEST_TIMEOUT, NEWRL_DB
+from app.constants import COMMITTEE_SIZE, MINIMUM_ACCEPTANCE_VOTES, NETWORK_TRUSTED_ARCHIVE_NODES, NEWRL_PORT, REQUEST_TIMEOUT, NEWRL_DB, STATE_WRITER_REQUEST_TIMEOUT_SECONDS
 from app.codes.p2p.peers import get_peers
 
 from app.codes.validator import validate_block, validate_block_data, validate_block_transactions, validate_receipt_signature
@@ -47,9 +53,7 @@ def get_blocks(block_indexes):
 
 
 def get_block_hashes(start_index, end_index):
-    con = sqlite3.connect(NEWRL_DB)
-    # con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_cursor()
 
     blocks = cur.execute(
         '''
@@ -66,7 +70,6 @@ def get_block_hashes(start_index, end_index):
             'timestamp': row[2],
         }
         results.append(block)
-    con.close()
     return results
 
 
@@ -83,6 +86,7 @@ def receive_block(block):
     if SYNC_STATUS['IS_SYNCING']:
         logger.info('Syncing with network. Ignoring incoming block.')
         return
+    block = track(block)
     block_index = block['index']
     if block_index > get_last_block_index() + 1:
         logger.info('Node not in sync. Cannot add block')
@@ -94,7 +98,7 @@ def receive_block(block):
         return False
     
     # Check block for index for index and hash already in temp. If yes append receipts from local block from to the received block
-    logger.info(f'Received new block: {json.dumps(block)}')
+    logger.info(f'Received new block: {encode(block).decode()}')
 
 
     broadcast_exclude_nodes = block['peers_already_broadcasted'] if 'peers_already_broadcasted' in block else None
@@ -228,11 +232,7 @@ def sync_chain_from_node(url, block_index=None):
                 return False
             else:
                 logger.info('Adding block %d', block['index'])
-                con = sqlite3.connect(NEWRL_DB, timeout=10)
-                cur = con.cursor()
-                blockchain.add_block(cur, block, hash)
-                con.commit()
-                con.close()
+                state_writer.submit('sync_block', blockchain.commit_block, block, hash, priority=PRIORITY_SYNC)
 
         block_idx = block['index'] + 1
 
@@ -334,11 +334,17 @@ def accept_block(block, hash):
 
     # if hash is None:
     #     hash = calculate_hash(block['data'])
-    con = sqlite3.connect(NEWRL_DB, timeout=10)
-    cur = con.cursor()
-    block_added_successfully = blockchain.add_block(cur, mutable_block['data'])
-    con.commit()
-    con.close()
+    try:
+        block_added_successfully = state_writer.submit(
+            'add_block', blockchain.commit_block, mutable_block['data'],
+            priority=PRIORITY_CONSENSUS, timeout=STATE_WRITER_REQUEST_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        # Still commits once the writer gets to it
+        logger.warning(f"Block {mutable_block['index']} did not commit within {STATE_WRITER_REQUEST_TIMEOUT_SECONDS} seconds")
+        return False
+    except queue.Full:
+        logger.warning(f"State writer queue is full. Dropping block {mutable_block['index']}")
+        return False
 
     # block_timestamp = int(block['data']['timestamp'])
     # start_mining_clock(block_timestamp)
@@ -575,15 +581,20 @@ def quick_sync(db_url):
         return False
 
     try:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
+        cur = get_cursor()
         existing_block = cur.execute('SELECT block_index, hash FROM blocks ORDER BY block_index DESC LIMIT 1').fetchone()
         logger.info(f"Existing db with block {existing_block[0]} and hash {existing_block[1]}")
-        con.close()
 
         # Only copy if the downloaded db has more blocks than local
         if blocks[0] > existing_block[0]:
-            subprocess.call(["mv", downloaded_db_path, NEWRL_DB])
+            state_writer.submit('restore', replace_db, downloaded_db_path, priority=PRIORITY_MAINTENANCE)
     except Exception as e:
         logger.info('Removing local db and using downloaded db')
-        subprocess.call(["mv", downloaded_db_path, NEWRL_DB])
+        state_writer.submit('restore', replace_db, downloaded_db_path, priority=PRIORITY_MAINTENANCE)
+
+
+def replace_db(db_path):
+    """Restores a database file into the live one. Run on the state writer"""
+    with snapshots_paused():
+        restore_database(db_path)
+    os.remove(db_path)
@@ -1,88 +1,102 @@
-import json
-import os
-from app.constants import INCOMING_PATH, MEMPOOL_PATH, TMP_PATH
+import logging
+import re
 import requests
 
-from app.codes.transactionmanager import Transactionmanager
+from app.codes.db_updater import get_included_transaction_codes
+from app.codes.fs.mempool_manager import add_transaction_to_mempool, mempool
+from app.codes.p2p.outgoing import get_random_peers
+from app.codes.p2p.utils import is_my_address
+from app.codes.storage import get_cursor
+from app.codes.validator import validate as validate_transaction
+from app.constants import MAX_TRANSACTION_BATCH_SIZE, MEMPOOL_SYNC_PEERS, NEWRL_DB, NEWRL_PORT, REQUEST_TIMEOUT
 
 
-def list_mempool_transactions():
-    transaction_files = os.listdir(MEMPOOL_PATH)
-    return transaction_files
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 
-def get_mempool_transactions(filenames):
-    transactions = []
-    for filename in filenames:
-        with open(MEMPOOL_PATH + filename, "r") as transaction_file:
-            transaction = json.load(transaction_file)
-            transaction = {
-                'filename': filename,
-                'data': transaction
-            }
-            transactions.append(transaction)
-    return transactions
+def list_mempool_transactions():
+    """Returns the codes of mempool transactions ordered by timestamp"""
+    return mempool.get_transaction_codes()
 
 
-def push_transactions(filenames):
-    for filename in filenames:
-        print('Pulling transaction:', filename)
+def get_transaction_code_from_name(name):
+    """Accepts a transaction code or a legacy mempool file name"""
+    match = re.match(r'^transaction-\d+-(\w+)\.json$', name)
+    if match:
+        return match.group(1)
+    return name
 
 
-def pull_transactions(filenames):
-    # Todo - Make this call between nodes
-    transactions = get_mempool_transactions(filenames)
+def get_mempool_transactions(transaction_codes):
+    transactions = []
+    for name in transaction_codes:
+        transaction_code = get_transaction_code_from_name(name)
+        transaction = mempool.get(transaction_code)
+        if transaction is None:
+            continue
+        transactions.append({
+            'filename': f"transaction-{transaction['transaction']['type']}-{transaction_code}.json",
+            'transaction_code': transaction_code,
+            'data': transaction
+        })
+    return transactions
+
 
-    for transaction in transactions:
-        filename = transaction['filename']
-        data = transaction['data']
-        print('Pulling transaction:', filename)
-        validate_transaction(transaction)
-        with open(MEMPOOL_PATH + filename, "w") as transaction_file:
-            json.dump(data, transaction_file)
+def get_missing_transaction_codes(transaction_codes):
+    """Returns the codes which are neither in the mempool nor in the chain"""
+    transaction_codes = [code for code in transaction_codes if not mempool.exists(code)]
+    if len(transaction_codes) == 0:
+        return []
+    included_codes = get_included_transaction_codes(get_cursor(), transaction_codes)
+    return [code for code in transaction_codes if code not in included_codes]
+
+
+def pull_transactions(url, transaction_codes):
+    """Fetches transactions from a peer in batches and validates them into the mempool"""
+    pulled = []
+    transaction_codes = list(transaction_codes)
+    for start in range(0, len(transaction_codes), MAX_TRANSACTION_BATCH_SIZE):
+        chunk = transaction_codes[start:start + MAX_TRANSACTION_BATCH_SIZE]
+        try:
+            response = requests.post(
+                url + '/get-mempool-transactions',
+                json={'transaction_codes': chunk},
+                timeout=REQUEST_TIMEOUT
+            )
+            transactions = response.json()
+        except Exception as e:
+            logger.info(f'Could not pull transactions from {url}: {e}')
+            return pulled
+        for transaction in transactions:
+            if validate_transaction(transaction['data'], propagate=False)['valid']:
+                pulled.append(transaction['transaction_code'])
+    return pulled
 
 
 def sync_mempool_transactions():
-    my_transactions = set(list_mempool_transactions())
-    their_transactions = set(list_mempool_transactions())  # Todo - Make this call between nodes
-    transactions_to_pull = their_transactions - my_transactions
-    transactions_to_push = my_transactions - their_transactions
-
-    if len(transactions_to_pull) != 0:
-        pull_transactions(transactions_to_pull)
-    else:
-        print('No new transactions to pull')
-
-    if len(transactions_to_push) != 0:
-        push_transactions(transactions_to_push)
-    else:
-        print('No transactions to push')
-
-    return {
-        'pulled': transactions_to_pull,
-        'pushed': transactions_to_push
-    }
-
-
-def validate_transaction(transaction):
-    filename = INCOMING_PATH + transaction['filename']
-    data = transaction['data']
-    with open(filename, "w") as transaction_file:
-            json.dump(data, transaction_file)
-            
-    tmtemp = Transactionmanager()
-    trandata = tmtemp.loadtransactionpassive(filename)
-    if not tmtemp.verifytransigns():
-        print("Transaction id ", trandata['transaction']['trans_code'], " has invalid signatures")
-        return False
-
-    if not tmtemp.econvalidator():
-        print("Economic validation failed for transaction ", trandata['transaction']['trans_code'])
-        return False
-    return True
+    """Pulls the mempool transactions of a few random peers which this node is missing
+
+    Used when a node comes online. Transactions arriving later are
+    announced by code and fetched on demand.
+    """
+    pulled = []
+    for peer in get_random_peers()[:MEMPOOL_SYNC_PEERS]:
+        if is_my_address(peer['address']):
+            continue
+        url = 'http://' + peer['address'] + ':' + str(NEWRL_PORT)
+        try:
+            response = requests.post(url + '/list-mempool-transactions', timeout=REQUEST_TIMEOUT)
+            their_transactions = response.json()
+        except Exception as e:
+            logger.info(f'Could not list mempool of {url}: {e}')
+            continue
+        missing = get_missing_transaction_codes(
+            [get_transaction_code_from_name(name) for name in their_transactions])
+        pulled.extend(pull_transactions(url, missing))
+    logger.info(f'Pulled {len(pulled)} transactions from peer mempools')
+    return {'pulled': pulled}
 
 
 def receive_transaction(transaction):
-    transaction_code = transaction['transaction']['trans_code']
-    with open(MEMPOOL_PATH + 'transaction-' + transaction_code + '.json', "w") as transaction_file:
-        json.dump(transaction, transaction_file)
\ No newline at end of file
+    add_transaction_to_mempool(transaction)
\ No newline at end of file
@@ -5,13 +5,12 @@ import requests
 import socket
 
 from ...constants import MY_ADDRESS_FILE, NEWRL_P2P_DB, TIME_MINER_BROADCAST_INTERVAL_SECONDS
+from ..storage import get_cursor
 
 
 def get_peers():
     peers = []
-    con = sqlite3.connect(NEWRL_P2P_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_cursor(NEWRL_P2P_DB, row_factory=sqlite3.Row)
     peer_cursor = cur.execute('SELECT * FROM peers').fetchall()
     peers = [dict(ix) for ix in peer_cursor]
     return peers
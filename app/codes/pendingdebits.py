@@ -0,0 +1,90 @@
+"""Amounts pending mempool transactions will take out of wallets"""
+
+import logging
+
+from ..constants import NEWRL_DB
+from .db_updater import get_wallet_token_balances
+from .fs.mempool_manager import mempool
+from .storage import get_cursor
+from .transactionmanager import get_transaction_debits
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PendingDebitLedger:
+    """Running total of mempool debits keyed by (wallet, token)
+
+    The mempool updates the ledger as transactions are admitted, included
+    in a block or expire, always under the mempool lock. Checking a new
+    transaction against it costs one lookup per debited pair.
+    """
+
+    def __init__(self):
+        self.debits = {}
+        self.transaction_debits = {}
+
+    def on_transaction_added(self, transaction):
+        transaction_code = transaction['transaction']['trans_code']
+        if transaction_code in self.transaction_debits:
+            return
+        try:
+            debits = get_transaction_debits(transaction)
+        except Exception as e:
+            logger.info(f'Could not get debits of transaction {transaction_code}: {e}')
+            debits = {}
+        self.transaction_debits[transaction_code] = debits
+        for key, amount in debits.items():
+            self.debits[key] = self.debits.get(key, 0) + amount
+
+    def on_transaction_removed(self, transaction):
+        debits = self.transaction_debits.pop(transaction['transaction']['trans_code'], None)
+        if debits is None:
+            return
+        for key, amount in debits.items():
+            remaining = self.debits.get(key, 0) - amount
+            if remaining > 0:
+                self.debits[key] = remaining
+            else:
+                self.debits.pop(key, None)
+
+    def on_mempool_cleared(self):
+        self.debits = {}
+        self.transaction_debits = {}
+
+    def get_pending_debit(self, wallet_address, token_code):
+        return self.debits.get((wallet_address, token_code), 0)
+
+    def get_overdrafts(self, debits, balances):
+        """Returns the (wallet, token) pairs which the debits would overdraw
+
+        balances holds the confirmed balance of every debited pair.
+        """
+        return [
+            key for key, amount in debits.items()
+            if balances.get(key, 0) - self.get_pending_debit(*key) < amount
+        ]
+
+
+pending_debits = PendingDebitLedger()
+mempool.add_listener(pending_debits)
+
+
+def add_transaction_if_covered(transaction):
+    """Adds a transaction to the mempool if confirmed balances cover it
+
+    Debits of transactions already in the mempool are taken off the
+    confirmed balances first. Returns False when the transaction would
+    overdraw a wallet.
+    """
+    debits = get_transaction_debits(transaction)
+    balances = get_wallet_token_balances(get_cursor(), debits.keys())
+
+    with mempool.lock:
+        overdrafts = pending_debits.get_overdrafts(debits, balances)
+        if len(overdrafts) > 0:
+            logger.info(f'Transaction overdraws {overdrafts} with pending mempool debits')
+            return False
+        mempool.add(transaction)
+    return True
@@ -1,23 +1,190 @@
 """Receipt manager"""
 
+import hashlib
+import json
 import sqlite3
 import logging
+import threading
+from collections import OrderedDict
 
 from app.codes.fs.temp_manager import get_all_receipts_from_storage, remove_receipt_from_temp, store_receipt_to_temp
 from app.codes.kycwallet import get_address_from_public_key
 from app.codes.signmanager import verify_sign
 from .statereader import get_public_key_from_wallet_address
-from ..constants import MAX_RECEIPT_HISTORY_BLOCKS, NEWRL_DB
+from .storage import get_cursor
+from ..constants import COMPACT_RECEIPTS_BLOCK_INDEX, MAX_RECEIPT_HISTORY_BLOCKS, NEWRL_DB, WALLET_PUBLIC_KEY_CACHE_SIZE
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+RECEIPT_CHECK_SIGNATURE = 'signature'
+RECEIPT_CHECK_KEY_BINDING = 'key_binding'
+
+
+class VerifiedReceiptCache:
+    """Results of receipt checks for blocks still under consensus
+
+    Entries are keyed by (block_index, block_hash, wallet_address, digest)
+    where the digest covers the signed data, the public key and the
+    signature, so a tampered receipt never matches a verified one. The
+    entries of a block are dropped once it commits.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blocks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, receipt):
+        data = receipt['data']
+        digest = hashlib.sha256(json.dumps(
+            [data, receipt['public_key'], receipt['signature']], sort_keys=True).encode()).hexdigest()
+        return (data['block_index'], data['block_hash'], data['wallet_address'], digest)
+
+    def get(self, receipt, check):
+        """Returns the cached result of a check or None"""
+        key = self.get_key(receipt)
+        with self.lock:
+            result = self.blocks.get(key[0], {}).get((key, check))
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def set(self, receipt, check, result):
+        key = self.get_key(receipt)
+        with self.lock:
+            self.blocks.setdefault(key[0], {})[(key, check)] = result
+
+    def clear_committed(self, block_index):
+        """Drops the entries of a committed block and of the blocks before it"""
+        with self.lock:
+            for cached_block_index in list(self.blocks.keys()):
+                if cached_block_index <= block_index:
+                    del self.blocks[cached_block_index]
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'blocks': len(self.blocks),
+                'entries': sum(len(entries) for entries in self.blocks.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+verified_receipts = VerifiedReceiptCache()
+
+
+class WalletPublicKeyCache:
+    """Bounded LRU of wallet public keys keyed by wallet address
+
+    Addresses are derived from public keys so a key found for an address
+    never changes. Addresses without a wallet are looked up again.
+    """
+
+    def __init__(self, max_size=WALLET_PUBLIC_KEY_CACHE_SIZE):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, wallet_address, cur=None):
+        with self.lock:
+            public_key = self.keys.get(wallet_address)
+            if public_key is not None:
+                self.keys.move_to_end(wallet_address)
+                self.hits += 1
+                return public_key
+            self.misses += 1
+        public_key = get_public_key_from_wallet_address(wallet_address, cur)
+        if public_key is not None:
+            with self.lock:
+                self.keys[wallet_address] = public_key
+                while len(self.keys) > self.max_size:
+                    self.keys.popitem(last=False)
+        return public_key
+
+    def get_stats(self):
+        with self.lock:
+            return {'size': len(self.keys), 'hits': self.hits, 'misses': self.misses}
+
+
+wallet_public_keys = WalletPublicKeyCache()
+
+
+def compact_receipt(receipt):
+    """Returns the positional form of a receipt used in blocks
+
+    The public key is left out. It is looked up by wallet address when
+    the receipt is expanded.
+    """
+    if isinstance(receipt, list):
+        return receipt
+    data = receipt['data']
+    return [
+        data['block_index'],
+        data['block_hash'],
+        data['vote'],
+        data['timestamp'],
+        data['wallet_address'],
+        receipt['signature'],
+    ]
+
+
+def expand_receipt(receipt, cur=None):
+    """Returns the full form of a receipt stored in either form"""
+    if not isinstance(receipt, list):
+        return receipt
+    return {
+        'data': {
+            'block_index': receipt[0],
+            'block_hash': receipt[1],
+            'vote': receipt[2],
+            'timestamp': receipt[3],
+            'wallet_address': receipt[4],
+        },
+        'public_key': wallet_public_keys.get(receipt[4], cur),
+        'signature': receipt[5],
+    }
+
+
+def get_receipt_data(receipt):
+    """Returns the signed data of a receipt stored in either form"""
+    if not isinstance(receipt, list):
+        return receipt['data']
+    return {
+        'block_index': receipt[0],
+        'block_hash': receipt[1],
+        'vote': receipt[2],
+        'timestamp': receipt[3],
+        'wallet_address': receipt[4],
+    }
+
+
+def pack_receipts_for_block(receipts, block_index):
+    """Returns receipts in the form blocks at block_index carry them"""
+    if block_index < COMPACT_RECEIPTS_BLOCK_INDEX:
+        return [expand_receipt(receipt) for receipt in receipts]
+    return [compact_receipt(receipt) for receipt in receipts]
+
+
+def verify_receipt_signature(receipt):
+    """Checks the signature of a receipt once per node"""
+    result = verified_receipts.get(receipt, RECEIPT_CHECK_SIGNATURE)
+    if result is None:
+        result = bool(verify_sign(receipt['data'], receipt['signature'], receipt['public_key']))
+        verified_receipts.set(receipt, RECEIPT_CHECK_SIGNATURE, result)
+    return result
+
+
 def get_receipts_included_in_block_from_db(block_index):
-    con = sqlite3.connect(NEWRL_DB)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    cur = get_cursor(row_factory=sqlite3.Row)
     receipt_cursor = cur.execute(
         'SELECT * FROM receipts where included_block_index=?', (block_index,))
     
@@ -31,14 +198,13 @@ def get_receipts_included_in_block_from_db(block_index):
             'timestamp': _receipt['timestamp'],
             "wallet_address": _receipt['wallet_address'],
         }
-        wallet_public = get_public_key_from_wallet_address(_receipt['wallet_address'], con)
+        wallet_public = get_public_key_from_wallet_address(_receipt['wallet_address'], cur)
         receipt = {
             "data": receipt_data,
             "public_key": wallet_public,
             "signature": _receipt['signature'],
         }
         receipts.append(receipt)
-    con.close()
     return receipts
 
 
@@ -48,11 +214,12 @@ def update_receipts_in_state(cur, block):
     receipts = block['text']['previous_block_receipts']
 
     for receipt in receipts:
+        receipt_data = get_receipt_data(receipt)
         db_receipt_data = (
-            receipt['data']['block_index'],
-            receipt['data']['block_hash'],
-            receipt['data']['vote'],
-            receipt['data']['wallet_address'],
+            receipt_data['block_index'],
+            receipt_data['block_hash'],
+            receipt_data['vote'],
+            receipt_data['wallet_address'],
         )
 
         cur.execute('''
@@ -63,20 +230,16 @@ def update_receipts_in_state(cur, block):
 
 
         remove_receipt_from_temp(
-            receipt['data']['block_index'],
-            receipt['data']['block_hash'],
-            receipt['data']['wallet_address'])
+            receipt_data['block_index'],
+            receipt_data['block_hash'],
+            receipt_data['wallet_address'])
     
     cur.execute('DELETE FROM receipts where block_index < ?', (block['index'] - MAX_RECEIPT_HISTORY_BLOCKS, ))
 
 
 def check_receipt_exists_in_db(block_index, block_hash, wallet_address, cur=None):
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        connection_created = True
-    else:
-        connection_created = False
+        cur = get_cursor()
 
     receipt_cursor = cur.execute(
         '''
@@ -85,8 +248,6 @@ def check_receipt_exists_in_db(block_index, block_hash, wallet_address, cur=None
         , (block_index, block_hash, wallet_address)).fetchone()
 
     receipt_exists = receipt_cursor is not None
-    if connection_created:
-        con.close()
     return receipt_exists
 
 
@@ -111,20 +272,30 @@ def get_receipt_in_temp_not_in_chain(exclude_block, cur=None):
 
 
 def validate_receipt(receipt):
-    if not verify_sign(receipt['data'], receipt['signature'], receipt['public_key']):
-        logger.warn('Invalid signature for receipt')
+    receipt = expand_receipt(receipt)
+    if receipt['public_key'] is None:
+        logger.warning('Receipt wallet address not present in db')
         return False
-    
+    if not verify_receipt_signature(receipt):
+        logger.warning('Invalid signature for receipt')
+        return False
+
+    # A key which is not in the db yet may be added by a later block, so
+    # only a matching key is remembered
+    if verified_receipts.get(receipt, RECEIPT_CHECK_KEY_BINDING):
+        return True
+
     signer_address = get_address_from_public_key(receipt['public_key'])
     if receipt['data']['wallet_address'] != signer_address:
-        logger.warn('Receipt signing address not matching the address in data')
+        logger.warning('Receipt signing address not matching the address in data')
         return False
     
     public_key_in_db = get_public_key_from_wallet_address(signer_address)
     if public_key_in_db != receipt['public_key']:
-        logger.warn('Receipt wallet address not present in db')
+        logger.warning('Receipt wallet address not present in db')
         return False
-    
+
+    verified_receipts.set(receipt, RECEIPT_CHECK_KEY_BINDING, True)
     return True
 
 
@@ -0,0 +1,186 @@
+"""secp256k1 backends used for every key derivation, signature and verification
+
+Keys and signatures are exchanged as raw bytes in the format the chain
+already uses. Private keys are 32 bytes, public keys are the 64 byte x||y
+point and signatures are the 64 byte r||s pair over the sha1 digest of the
+message. A backend only changes how fast that is computed, never what goes
+on the wire.
+"""
+
+import hashlib
+import logging
+
+import ecdsa
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+CURVE_ORDER = ecdsa.SECP256k1.order
+
+
+class Secp256k1Backend:
+    """Interface of a secp256k1 implementation
+
+    load_public_key parses a public key into whatever object verify_loaded
+    needs, so that callers can cache parsed keys.
+    """
+    name = None
+
+    def derive_public_key(self, private_key):
+        raise NotImplementedError
+
+    def sign(self, private_key, message):
+        raise NotImplementedError
+
+    def load_public_key(self, public_key):
+        raise NotImplementedError
+
+    def precompute_public_key(self, loaded_key):
+        """Returns a loaded key prepared for many verifications"""
+        return loaded_key
+
+    def verify_loaded(self, loaded_key, signature, message):
+        raise NotImplementedError
+
+    def verify(self, public_key, signature, message):
+        return self.verify_loaded(self.load_public_key(public_key), signature, message)
+
+
+class EcdsaBackend(Secp256k1Backend):
+    """Pure Python implementation from the ecdsa package"""
+    name = 'ecdsa'
+
+    def derive_public_key(self, private_key):
+        return ecdsa.SigningKey.from_string(
+            private_key, curve=ecdsa.SECP256k1).verifying_key.to_string()
+
+    def sign(self, private_key, message):
+        return ecdsa.SigningKey.from_string(private_key, curve=ecdsa.SECP256k1).sign(message)
+
+    def load_public_key(self, public_key):
+        return ecdsa.VerifyingKey.from_string(public_key, curve=ecdsa.SECP256k1)
+
+    def precompute_public_key(self, loaded_key):
+        # Keys parsed with from_string carry a point without the curve
+        # order, which precompute needs, so the point is rebuilt first
+        point = loaded_key.pubkey.point
+        precomputed = ecdsa.VerifyingKey.from_public_point(
+            ecdsa.ellipticcurve.Point(ecdsa.SECP256k1.curve, point.x(), point.y(), CURVE_ORDER),
+            curve=ecdsa.SECP256k1)
+        precomputed.precompute()
+        return precomputed
+
+    def verify_loaded(self, loaded_key, signature, message):
+        try:
+            return loaded_key.verify(signature, message)
+        except Exception:
+            return False
+
+
+class CoincurveBackend(Secp256k1Backend):
+    """libsecp256k1 through the optional coincurve package
+
+    libsecp256k1 signs and verifies 32 byte digests, only accepts low S
+    signatures and uses DER encoding. The sha1 digest is left padded to
+    32 bytes, which is the same integer ecdsa derives from it, and
+    signatures are normalized and converted on the way in and out.
+    """
+    name = 'coincurve'
+
+    def __init__(self):
+        import coincurve
+        self.coincurve = coincurve
+
+    @staticmethod
+    def hasher(message):
+        return hashlib.sha1(message).digest().rjust(32, b'\0')
+
+    def derive_public_key(self, private_key):
+        return self.coincurve.PrivateKey(private_key).public_key.format(compressed=False)[1:]
+
+    def sign(self, private_key, message):
+        signature = self.coincurve.PrivateKey(private_key).sign(message, hasher=self.hasher)
+        return der_to_raw_signature(signature)
+
+    def load_public_key(self, public_key):
+        return self.coincurve.PublicKey(b'\x04' + public_key)
+
+    def verify_loaded(self, loaded_key, signature, message):
+        if len(signature) != 64:
+            return False
+        try:
+            signature = raw_to_der_signature(normalize_signature(signature))
+            return loaded_key.verify(signature, message, hasher=self.hasher)
+        except Exception:
+            return False
+
+
+BACKENDS = {
+    EcdsaBackend.name: EcdsaBackend,
+    CoincurveBackend.name: CoincurveBackend,
+}
+
+
+def get_available_backends():
+    """Returns the backends which can be loaded on this node"""
+    available = []
+    for backend_class in BACKENDS.values():
+        try:
+            available.append(backend_class())
+        except ImportError:
+            continue
+    return available
+
+
+def load_backend(name):
+    """Loads a backend by name. 'auto' picks the fastest one installed
+
+    An unknown or missing backend falls back to ecdsa.
+    """
+    if name == 'auto':
+        for candidate in [CoincurveBackend.name, EcdsaBackend.name]:
+            try:
+                return BACKENDS[candidate]()
+            except ImportError:
+                continue
+    try:
+        return BACKENDS[name]()
+    except (KeyError, ImportError) as e:
+        logger.warning(f'Crypto backend {name} not available. Using ecdsa. {e}')
+        return EcdsaBackend()
+
+
+def normalize_signature(signature):
+    """Returns the r||s signature with s in the lower half of the curve order"""
+    r = int.from_bytes(signature[:32], 'big')
+    s = int.from_bytes(signature[32:], 'big')
+    if s > CURVE_ORDER // 2:
+        s = CURVE_ORDER - s
+    return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+
+def _der_integer(value):
+    encoded = value.to_bytes((value.bit_length() + 8) // 8, 'big')
+    return b'\x02' + bytes([len(encoded)]) + encoded
+
+
+def raw_to_der_signature(signature):
+    r = int.from_bytes(signature[:32], 'big')
+    s = int.from_bytes(signature[32:], 'big')
+    body = _der_integer(r) + _der_integer(s)
+    return b'\x30' + bytes([len(body)]) + body
+
+
+def der_to_raw_signature(signature):
+    if signature[0] != 0x30 or signature[2] != 0x02:
+        raise ValueError('Invalid DER signature')
+    r_length = signature[3]
+    r = int.from_bytes(signature[4:4 + r_length], 'big')
+    s_start = 4 + r_length
+    if signature[s_start] != 0x02:
+        raise ValueError('Invalid DER signature')
+    s_length = signature[s_start + 1]
+    s = int.from_bytes(signature[s_start + 2:s_start + 2 + s_length], 'big')
+    return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
@@ -0,0 +1,220 @@
+"""Canonical serialization which encodes blocks and transactions once
+
+A block is hashed, signed, archived, stored to temp and sent to peers. Each
+of those used to run json.dumps on the whole block again. Wrapping a block
+with track keeps its encodings cached on the containers themselves and any
+mutation of a tracked container drops the cached encodings of it and of
+every container holding it.
+"""
+
+import copy
+import hashlib
+import json
+import weakref
+
+
+class _Tracked:
+    """Encoding cache shared by TrackedDict and TrackedList"""
+
+    def _init_tracking(self):
+        self._encodings = {}
+        self._parents = []
+
+    def _add_parent(self, parent):
+        self._parents.append(weakref.ref(parent))
+
+    def _invalidate(self):
+        pending = [self]
+        while len(pending) > 0:
+            container = pending.pop()
+            container._encodings.clear()
+            for parent_ref in container._parents:
+                parent = parent_ref()
+                if parent is not None:
+                    pending.append(parent)
+
+    def _track_child(self, value):
+        value = track(value)
+        if isinstance(value, _Tracked):
+            value._add_parent(self)
+        return value
+
+
+class TrackedDict(_Tracked, dict):
+    def __init__(self, *args, **kwargs):
+        self._init_tracking()
+        dict.__init__(self)
+        for key, value in dict(*args, **kwargs).items():
+            dict.__setitem__(self, key, self._track_child(value))
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, self._track_child(value))
+        self._invalidate()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._invalidate()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def pop(self, *args):
+        value = dict.pop(self, *args)
+        self._invalidate()
+        return value
+
+    def popitem(self):
+        item = dict.popitem(self)
+        self._invalidate()
+        return item
+
+    def clear(self):
+        dict.clear(self)
+        self._invalidate()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            dict.__setitem__(self, key, self._track_child(value))
+        self._invalidate()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return _copy_tracked(self, memo)
+
+    def __reduce__(self):
+        return (dict, (dict(self), ))
+
+
+class TrackedList(_Tracked, list):
+    def __init__(self, iterable=()):
+        self._init_tracking()
+        list.__init__(self, [self._track_child(value) for value in iterable])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [self._track_child(v) for v in value]
+        else:
+            value = self._track_child(value)
+        list.__setitem__(self, index, value)
+        self._invalidate()
+
+    def __delitem__(self, index):
+        list.__delitem__(self, index)
+        self._invalidate()
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, count):
+        list.__imul__(self, count)
+        self._invalidate()
+        return self
+
+    def append(self, value):
+        list.append(self, self._track_child(value))
+        self._invalidate()
+
+    def extend(self, values):
+        list.extend(self, [self._track_child(v) for v in values])
+        self._invalidate()
+
+    def insert(self, index, value):
+        list.insert(self, index, self._track_child(value))
+        self._invalidate()
+
+    def pop(self, *args):
+        value = list.pop(self, *args)
+        self._invalidate()
+        return value
+
+    def remove(self, value):
+        list.remove(self, value)
+        self._invalidate()
+
+    def clear(self):
+        list.clear(self)
+        self._invalidate()
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        self._invalidate()
+
+    def reverse(self):
+        list.reverse(self)
+        self._invalidate()
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return _copy_tracked(self, memo)
+
+    def __reduce__(self):
+        return (list, (list(self), ))
+
+
+def track(value):
+    """Returns value with its dicts and lists replaced by tracked containers"""
+    if isinstance(value, _Tracked):
+        return value
+    if isinstance(value, dict):
+        return TrackedDict(value)
+    if isinstance(value, list):
+        return TrackedList(value)
+    return value
+
+
+def _copy_tracked(value, memo):
+    """Deep copies a tracked container child by child
+
+    Keys and values keep their types, such as int keys and tuples which a
+    copy through JSON would turn into strings and lists. The copy encodes
+    the same as the original so the cached encodings are carried over.
+    """
+    if isinstance(value, TrackedDict):
+        copied = TrackedDict()
+        memo[id(value)] = copied
+        for key, child in value.items():
+            dict.__setitem__(
+                copied, copy.deepcopy(key, memo), copied._track_child(copy.deepcopy(child, memo)))
+    else:
+        copied = TrackedList()
+        memo[id(value)] = copied
+        list.extend(copied, [copied._track_child(copy.deepcopy(child, memo)) for child in value])
+    copied._encodings.update(value._encodings)
+    return copied
+
+
+def encode(value, sort_keys=False):
+    """Returns the JSON bytes of value, cached when value is tracked
+
+    sort_keys=False is the encoding signatures are made over and the one
+    stored and sent. sort_keys=True is the encoding hashes are taken over.
+    """
+    if isinstance(value, _Tracked):
+        encoded = value._encodings.get(sort_keys)
+        if encoded is None:
+            encoded = json.dumps(value, sort_keys=sort_keys).encode()
+            value._encodings[sort_keys] = encoded
+        return encoded
+    return json.dumps(value, sort_keys=sort_keys).encode()
+
+
+def digest(value):
+    """Returns the sha256 hex digest of the canonical encoding of value"""
+    if isinstance(value, _Tracked):
+        hexdigest = value._encodings.get('digest')
+        if hexdigest is None:
+            hexdigest = hashlib.sha256(encode(value, sort_keys=True)).hexdigest()
+            value._encodings['digest'] = hexdigest
+        return hexdigest
+    return hashlib.sha256(encode(value, sort_keys=True)).hexdigest()
@@ -0,0 +1,64 @@
+"""Verifies batches of transaction signatures across worker processes"""
+
+import hashlib
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .crypto import verify_message
+from ..constants import MIN_PARALLEL_SIGNATURE_VERIFICATIONS, SIGNATURE_VERIFICATION_WORKERS
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+pool = None
+pool_lock = threading.Lock()
+
+
+def get_signature_key(message, public_key, signature):
+    """Identifies a signature check by message digest, public key hex and signature hex"""
+    return (hashlib.sha256(message).hexdigest(), public_key, signature)
+
+
+def verify_signature(task):
+    """Verifies one (message, public_key, signature) task. Runs in worker processes"""
+    message, public_key, signature = task
+    try:
+        return verify_message(public_key, bytes.fromhex(signature), message)
+    except Exception:
+        return False
+
+
+def get_pool(max_workers):
+    """Returns the process pool, started with spawn so workers do not inherit node threads"""
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'))
+        return pool
+
+
+def verify_signatures(tasks, max_workers=SIGNATURE_VERIFICATION_WORKERS):
+    """Verifies (message, public_key, signature) tasks
+
+    Returns {signature key: valid}. Small batches and single core nodes
+    verify in process since handing work to the pool costs more than it saves.
+    """
+    tasks = list(tasks)
+    if max_workers <= 1 or len(tasks) < MIN_PARALLEL_SIGNATURE_VERIFICATIONS:
+        results = [verify_signature(task) for task in tasks]
+    else:
+        chunksize = max(1, len(tasks) // (max_workers * 4))
+        try:
+            results = list(get_pool(max_workers).map(verify_signature, tasks, chunksize=chunksize))
+        except Exception as e:
+            logger.error(f'Signature verification pool failed. Verifying in process. {e}')
+            results = [verify_signature(task) for task in tasks]
+    return {
+        get_signature_key(*task): result for task, result in zip(tasks, results)
+    }
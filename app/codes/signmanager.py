@@ -1,8 +1,8 @@
 """Sign and validate signatures"""
-import json
 import base64
-import ecdsa
 
+from .crypto import sign_message, verify_message
+from .serialization import encode
 from .transactionmanager import Transactionmanager, get_valid_addresses
 
 
@@ -46,19 +46,15 @@ def sign_transaction(wallet_data, transaction_data):
 
 def sign_object(private_key, data):
     pvtkeybytes = bytes.fromhex(private_key)
-    msg = json.dumps(data).encode()
-    sk = ecdsa.SigningKey.from_string(pvtkeybytes, curve=ecdsa.SECP256k1)
-    msgsignbytes = sk.sign(msg)
+    msg = encode(data)
+    msgsignbytes = sign_message(pvtkeybytes, msg)
     msgsign = msgsignbytes.hex()
     return msgsign
 
 def verify_sign(data, signature, public_key):
-    public_key_bytes = bytes.fromhex(public_key)
     sign_trans_bytes = bytes.fromhex(signature)
-    vk = ecdsa.VerifyingKey.from_string(
-        public_key_bytes, curve=ecdsa.SECP256k1)
-    message = json.dumps(data).encode()
+    message = encode(data)
     try:
-        return vk.verify(sign_trans_bytes, message)
+        return verify_message(public_key, sign_trans_bytes, message)
     except:
         return False
@@ -1,6 +1,9 @@
+import copy
 import logging
 import math
 import json
+import threading
+import time
 import importlib
 from lib2to3.pgen2 import token
 import re
@@ -16,6 +19,7 @@ from app.codes.helpers.CentralRespository import CentralRepository
 from .db_updater import *
 from app.codes.networkscoremanager import get_invalid_block_creation_score, get_invalid_receipt_score, get_valid_block_creation_score, get_valid_receipt_score, update_network_trust_score_from_receipt
 from .p2p.utils import get_peers
+from .receiptmanager import expand_receipt
 from ..Configuration import Configuration
 
 from ..nvalues import NETWORK_TRUST_MANAGER_PID, TREASURY_WALLET_ADDRESS
@@ -28,11 +32,26 @@ from ..ntypes import BLOCK_STATUS_MINING_TIMEOUT, BLOCK_VOTE_MINER, NEWRL_TOKEN_
 logger = logging.getLogger(__name__)
 
 value_txns = []
+state_update_lock = threading.RLock()  # Guards the module level state used while applying a block
 
 
-def update_db_states(cur, block):
+def update_db_states(cur, block, failed_transactions=None, dry_run=False):
+    """Applies the transactions of a block to state
+
+    Codes of top level transactions which fail are appended to
+    failed_transactions when given. A dry run does not reload the
+    configuration after a configuration change.
+    """
+    with state_update_lock:
+        return _update_db_states(cur, block, failed_transactions, dry_run)
+
+
+def _update_db_states(cur, block, failed_transactions, dry_run):
     newblockindex = block['index'] if 'index' in block else block['block_index']
     transactions = block['text']['transactions']
+    creator_wallet = block.get('creator_wallet')
+    if failed_transactions is None:
+        failed_transactions = []
     # last_block_cursor = cur.execute(
     #     f'''SELECT block_index FROM blocks ORDER BY block_index DESC LIMIT 1''')
     # last_block = last_block_cursor.fetchone()
@@ -42,10 +61,10 @@ def update_db_states(cur, block):
     #    latest_index = cur.execute('SELECT MAX(block_index) FROM blocks')
     add_tx_to_block(cur, newblockindex, transactions)
 
-    if 'creator_wallet' in block and block['creator_wallet'] is not None:
-        add_block_reward(cur, block['creator_wallet'], newblockindex)
+    if creator_wallet is not None:
+        add_block_reward(cur, creator_wallet, newblockindex)
 
-    collated_txns = simplify_transactions(cur, transactions)
+    collated_txns = simplify_transactions(cur, transactions, failed_transactions)
     global simplified_transactions
     simplified_transactions = []
     global config_updated
@@ -53,17 +72,20 @@ def update_db_states(cur, block):
 
     sc_nesting = 0  # Denotes the level of nesting of smart contract call. 1 for a normal sc call. 2 for sc calling sc. 
     sc_in_failed_state = False  # Used to flag a sc execution failure for flushing out all future child transactions
+    sc_transaction_code = None  # Top level smart contract transaction being applied
     for transaction in collated_txns:
         if sc_in_failed_state:  # If any transaction in SC fails, keep flushing future transactions till all parent SCs end
             if transaction == 'SC_END':
                 sc_nesting -= 1
                 if sc_nesting == 0:
                     sc_in_failed_state = False
+                    _record_failure(failed_transactions, sc_transaction_code)
             continue
                 
         if transaction == 'SC_START':
             if sc_nesting == 0:  # One savepoint for complete nested SC
                 cur.execute(f'SAVEPOINT sc_start')
+                sc_transaction_code = None
             sc_nesting += 1
             continue
         elif transaction == 'SC_END':
@@ -72,10 +94,13 @@ def update_db_states(cur, block):
                 cur.execute(f'RELEASE SAVEPOINT sc_start')
             continue
 
+        if sc_nesting > 0 and sc_transaction_code is None:
+            sc_transaction_code = transaction['transaction']['trans_code']
+
         if transaction['transaction']['type'] == TRANSACTION_SMART_CONTRACT:
             if sc_nesting > 1:  # Not to charge fee for child sc transactions
                 continue
-            if not pay_fee_for_transaction(cur, transaction, block['creator_wallet']):
+            if not pay_fee_for_transaction(cur, transaction, creator_wallet):
                 sc_in_failed_state = True
                 cur.execute(f'ROLLBACK to SAVEPOINT sc_start')
                 continue
@@ -92,8 +117,9 @@ def update_db_states(cur, block):
             'trans_code']
         
         if newblockindex > 60000:  # prior to this block, the account balance could've been negative
-            if sc_nesting == 0 and not pay_fee_for_transaction(cur, transaction, block['creator_wallet']):
+            if sc_nesting == 0 and not pay_fee_for_transaction(cur, transaction, creator_wallet):
                 logger.error(f'Fee payment failed for transaction {transaction_code}')
+                _record_failure(failed_transactions, transaction_code)
                 if sc_nesting > 0:
                     sc_in_failed_state = True
                     cur.execute(f'ROLLBACK to SAVEPOINT sc_start')
@@ -106,6 +132,8 @@ def update_db_states(cur, block):
                 if sc_nesting > 0:
                     sc_in_failed_state = True
                     cur.execute(f'ROLLBACK to SAVEPOINT sc_start')
+                else:
+                    _record_failure(failed_transactions, transaction_code)
                 continue
         else:
             tm = Transactionmanager()
@@ -115,10 +143,13 @@ def update_db_states(cur, block):
                 if sc_nesting > 0:
                     sc_in_failed_state = True
                     cur.execute(f'ROLLBACK to SAVEPOINT sc_start')
+                else:
+                    _record_failure(failed_transactions, transaction_code)
                 continue
             
-            if sc_nesting == 0 and not pay_fee_for_transaction(cur, transaction, block['creator_wallet']):
+            if sc_nesting == 0 and not pay_fee_for_transaction(cur, transaction, creator_wallet):
                 logger.error(f'Fee payment failed for transaction {transaction_code}')
+                _record_failure(failed_transactions, transaction_code)
                 if sc_nesting > 0:
                     sc_in_failed_state = True
                     cur.execute(f'ROLLBACK to SAVEPOINT sc_start')
@@ -139,11 +170,52 @@ def update_db_states(cur, block):
             logger.error(f'Error in transaction: {str(transaction)}')
             logger.error(str(e))
             logger.error(traceback.format_exc())
-    if config_updated:
+            _record_failure(failed_transactions, sc_transaction_code if sc_nesting > 0 else transaction_code)
+    if config_updated and not dry_run:
         Configuration.updateDataFromDB(cur)
     return True
 
 
+def _record_failure(failed_transactions, transaction_code):
+    if transaction_code is not None and transaction_code not in failed_transactions:
+        failed_transactions.append(transaction_code)
+
+
+def dry_run_transactions(cur, transactions, block_index):
+    """Applies transactions one at a time inside a savepoint which is rolled back
+
+    Each transaction sees the effects of the ones before it which applied
+    cleanly. Returns the codes of failed transactions and the time in
+    milliseconds each transaction took to apply.
+    """
+    failed = []
+    costs = {}
+    cur.execute('SAVEPOINT dry_run_block')
+    try:
+        for transaction in transactions:
+            transaction_code = transaction['transaction']['trans_code']
+            failures = []
+            cur.execute('SAVEPOINT dry_run_transaction')
+            start_time = time.perf_counter()
+            try:
+                update_db_states(cur, {
+                    'index': block_index,
+                    'text': {'transactions': [copy.deepcopy(transaction)]}
+                }, failed_transactions=failures, dry_run=True)
+            except Exception as e:
+                logger.info(f'Dry run of transaction {transaction_code} failed: {e}')
+                failures.append(transaction_code)
+            costs[transaction_code] = (time.perf_counter() - start_time) * 1000
+            if len(failures) > 0:
+                failed.append(transaction_code)
+                cur.execute('ROLLBACK TO SAVEPOINT dry_run_transaction')
+            cur.execute('RELEASE SAVEPOINT dry_run_transaction')
+    finally:
+        cur.execute('ROLLBACK TO SAVEPOINT dry_run_block')
+        cur.execute('RELEASE SAVEPOINT dry_run_block')
+    return failed, costs
+
+
 def update_state_from_transaction(cur, transaction_type, transaction_data, transaction_code, transaction_timestamp,
                                   transaction_signer=None, block_index=None, full_transaction=None):
     if transaction_type == TRANSACTION_WALLET_CREATION:  # this is a wallet creation transaction
@@ -266,6 +338,7 @@ def update_trust_scores(cur, block):
     receipts = block['text']['previous_block_receipts']
 
     for receipt in receipts:
+        receipt = expand_receipt(receipt, cur)
         if receipt['data']['block_index'] > block['index'] - MAX_RECEIPT_HISTORY_BLOCKS:
             update_network_trust_score_from_receipt(cur, receipt=receipt)
 
@@ -277,7 +350,7 @@ def update_miners(cur, block):
         logger.info('Removing miner %s due to timeout', block['expected_miner'])
         cur.execute('DELETE FROM miners WHERE wallet_address = ?', (block['expected_miner'], ))
 
-def simplify_transactions(cur, transactions):
+def simplify_transactions(cur, transactions, failed_transactions=None):
   global value_txns
   simplified_transactions = []
   for transaction in transactions:
@@ -291,6 +364,8 @@ def simplify_transactions(cur, transactions):
         logger.error(
             f"Exception during sc txn execution for txn : {transaction}")
         logger.error(traceback.format_exc())
+        if failed_transactions is not None:
+            _record_failure(failed_transactions, transaction['transaction']['trans_code'])
       print(f"Value transactions are {value_txns}")
       simplified_transactions.append('SC_START')
       simplified_transactions.append(transaction)
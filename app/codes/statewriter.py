@@ -0,0 +1,151 @@
+"""Single writer thread for chain state
+
+Block commits, reverts, restores and block candidate dry runs are queued
+to one thread which runs them in priority order, so they never contend for
+the SQLite write lock and commit in a well defined order. Readers use their
+own connections and do not wait for the queue. Snapshots copy from a read
+transaction on their own thread and are not queued.
+"""
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .storage import in_write_transaction
+
+from ..constants import STATE_WRITER_LATENCY_SMOOTHING, STATE_WRITER_QUEUE_SIZE, STATE_WRITER_SUBMIT_TIMEOUT_SECONDS
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# Lower runs first. Commands of the same priority run in submission order
+PRIORITY_CONSENSUS = 0  # Blocks agreed by the committee
+PRIORITY_SYNC = 1  # Blocks fetched from peers while catching up
+PRIORITY_MAINTENANCE = 2  # Reverts, restores and state rebuilds
+PRIORITY_CANDIDATE = 3  # Block candidate dry runs
+
+
+class Command:
+    def __init__(self, name, function, args, kwargs):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class StateWriter:
+    """Runs state changes one at a time on a dedicated thread
+
+    The queue is bounded. Submitters block while it is full and get
+    queue.Full after submit_timeout seconds. Latency is kept per command
+    name as time waiting in the queue and time running.
+    """
+
+    def __init__(self, max_queue_size=STATE_WRITER_QUEUE_SIZE, submit_timeout=STATE_WRITER_SUBMIT_TIMEOUT_SECONDS):
+        self.queue = queue.PriorityQueue(max_queue_size)
+        self.submit_timeout = submit_timeout
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.commands = {}
+        self.max_queue_depth = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='state-writer', daemon=True)
+                self.thread.start()
+
+    def submit(self, name, function, *args, priority=PRIORITY_SYNC, timeout=None, **kwargs):
+        """Runs function on the writer thread and returns its result
+
+        Exceptions raised by the function are raised here. Raises
+        RuntimeError when called from a command or inside a write
+        transaction, which would wait on itself. Commands call the
+        functions of other commands directly. With a timeout, raises
+        concurrent.futures.TimeoutError if the command has not finished by
+        then. It still runs.
+        """
+        if threading.current_thread() is self.thread:
+            raise RuntimeError(f'Cannot submit {name} from the state writer thread')
+        if in_write_transaction():
+            raise RuntimeError(f'Cannot submit {name} inside a write transaction')
+        self.start()
+        command = Command(name, function, args, kwargs)
+        self.queue.put((priority, next(self.sequence), command), timeout=self.submit_timeout)
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return command.future.result(timeout)
+
+    def run(self):
+        while True:
+            _, _, command = self.queue.get()
+            started = time.perf_counter()
+            try:
+                result = command.function(*command.args, **command.kwargs)
+                error = None
+            except Exception as e:
+                logger.error(f'State writer command {command.name} failed: {e}')
+                result = None
+                error = e
+            finished = time.perf_counter()
+            self.record(
+                command.name,
+                (started - command.enqueued) * 1000,
+                (finished - started) * 1000,
+                error is not None
+            )
+            if error is None:
+                command.future.set_result(result)
+            else:
+                command.future.set_exception(error)
+
+    def record(self, name, wait_ms, run_ms, failed):
+        with self.lock:
+            stats = self.commands.get(name)
+            if stats is None:
+                stats = {
+                    'count': 0,
+                    'failures': 0,
+                    'last_wait_ms': None,
+                    'average_wait_ms': None,
+                    'max_wait_ms': 0,
+                    'last_run_ms': None,
+                    'average_run_ms': None,
+                    'max_run_ms': 0,
+                }
+                self.commands[name] = stats
+            stats['count'] += 1
+            if failed:
+                stats['failures'] += 1
+            for kind, value in (('wait', wait_ms), ('run', run_ms)):
+                stats[f'last_{kind}_ms'] = value
+                stats[f'max_{kind}_ms'] = max(stats[f'max_{kind}_ms'], value)
+                average = stats[f'average_{kind}_ms']
+                if average is None:
+                    stats[f'average_{kind}_ms'] = value
+                else:
+                    stats[f'average_{kind}_ms'] = average + STATE_WRITER_LATENCY_SMOOTHING * (value - average)
+
+    def clear(self):
+        with self.lock:
+            self.commands = {}
+            self.max_queue_depth = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'commands': {name: dict(stats) for name, stats in self.commands.items()},
+            }
+
+
+state_writer = StateWriter()
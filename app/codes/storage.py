@@ -0,0 +1,282 @@
+"""Shared SQLite connections
+
+Reads go through one connection per thread and database. Writes go through
+a single connection per database, serialized by a lock. Query APIs read
+through read-only connections inside one read transaction, so they see
+the state of a single committed block. All connections
+are configured from the storage profile in STORAGE_PROFILE. Snapshot
+restores and quick sync rewrite the database in place with
+restore_database, as connections held by other threads cannot be closed
+before a file is swapped under them. Statements run through them can be traced with set_trace_callback.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from ..constants import NEWRL_DB, STORAGE_PROFILE
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+STORAGE_PROFILES = {
+    # WAL lets readers run while a block commits. NORMAL sync may lose the
+    # last commits on power loss, but never corrupts, and blocks can be
+    # synced again from peers
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 10000,
+    },
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16384,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 10000,
+    },
+    'low_memory': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -2048,
+        'mmap_size': 0,
+        'temp_store': 'FILE',
+        'busy_timeout': 10000,
+    },
+}
+
+
+def get_profile(name=STORAGE_PROFILE):
+    if name not in STORAGE_PROFILES:
+        logger.warning(f'Storage profile {name} not found. Using default.')
+        name = 'default'
+    return STORAGE_PROFILES[name]
+
+
+def get_file_id(db_path):
+    try:
+        stat = os.stat(db_path)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+class Connection(sqlite3.Connection):
+    """Remembers the trace callback it was given"""
+    trace_callback = None
+
+
+trace_callback = None
+
+
+def set_trace_callback(callback):
+    """Passes the SQL of every statement run on storage connections to callback
+
+    Connections pick the callback up the next time they are handed out, on
+    the thread using them, so callback must be thread safe. Pass None to
+    stop tracing.
+    """
+    global trace_callback
+    trace_callback = callback
+
+
+def apply_trace_callback(con):
+    if con.trace_callback is not trace_callback:
+        con.set_trace_callback(trace_callback)
+        con.trace_callback = trace_callback
+    return con
+
+
+def connect(db_path, profile=None, check_same_thread=True, read_only=False):
+    """Opens a connection configured with the pragmas of a storage profile
+
+    Read-only connections leave the journal mode to the writer.
+    """
+    if read_only:
+        con = sqlite3.connect(
+            f'file:{db_path}?mode=ro', uri=True, check_same_thread=check_same_thread, factory=Connection)
+    else:
+        con = sqlite3.connect(db_path, check_same_thread=check_same_thread, factory=Connection)
+    for pragma, value in (profile or get_profile()).items():
+        if read_only and pragma == 'journal_mode':
+            continue
+        con.execute(f'PRAGMA {pragma}={value}')
+    return con
+
+
+class Writer:
+    """The single write connection of a database
+
+    The lock is reentrant and only the outermost write_transaction
+    commits, so helpers which write can be called from within a write.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.connection = None
+        self.file_id = None
+        self.depth = 0
+        self.owner = None
+
+    def get_connection(self):
+        file_id = get_file_id(self.db_path)
+        if self.connection is None or file_id != self.file_id:
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = connect(self.db_path, check_same_thread=False)
+            self.file_id = get_file_id(self.db_path)
+        return apply_trace_callback(self.connection)
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+            self.connection = None
+            self.file_id = None
+
+
+readers = threading.local()
+writers = {}
+writers_lock = threading.Lock()
+
+
+def get_connection(db_path=NEWRL_DB, read_only=False):
+    """Returns the read connection of this thread for a database"""
+    connections = getattr(readers, 'connections', None)
+    if connections is None:
+        connections = {}
+        readers.connections = connections
+    file_id = get_file_id(db_path)
+    entry = connections.get((db_path, read_only))
+    if entry is None or entry[1] != file_id:
+        if entry is not None:
+            entry[0].close()
+        con = connect(db_path, read_only=read_only)
+        entry = (con, get_file_id(db_path))
+        connections[(db_path, read_only)] = entry
+    return apply_trace_callback(entry[0])
+
+
+def get_cursor(db_path=NEWRL_DB, row_factory=None):
+    """Returns a new cursor on the read connection of this thread"""
+    cur = get_connection(db_path).cursor()
+    if row_factory is not None:
+        cur.row_factory = row_factory
+    return cur
+
+
+@contextmanager
+def read_snapshot(db_path=NEWRL_DB, row_factory=None):
+    """Yields a cursor on a read-only connection inside one read transaction
+
+    The transaction is pinned by the first query, after which commits by
+    the writer are not seen until the block exits. Nested snapshots share
+    the outer transaction.
+    """
+    con = get_connection(db_path, read_only=True)
+    cur = con.cursor()
+    if row_factory is not None:
+        cur.row_factory = row_factory
+    if con.in_transaction:
+        yield cur
+        return
+    cur.execute('BEGIN')
+    try:
+        yield cur
+    finally:
+        con.rollback()
+
+
+def get_writer(db_path=NEWRL_DB):
+    with writers_lock:
+        writer = writers.get(db_path)
+        if writer is None:
+            writer = Writer(db_path)
+            writers[db_path] = writer
+        return writer
+
+
+@contextmanager
+def write_transaction(db_path=NEWRL_DB, row_factory=None):
+    """Yields a cursor on the write connection and commits when the block exits
+
+    Rolls back when the block raises.
+    """
+    writer = get_writer(db_path)
+    with writer.lock:
+        con = writer.get_connection()
+        cur = con.cursor()
+        if row_factory is not None:
+            cur.row_factory = row_factory
+        writer.depth += 1
+        writer.owner = threading.get_ident()
+        try:
+            yield cur
+        except Exception:
+            if writer.depth == 1:
+                con.rollback()
+            raise
+        else:
+            if writer.depth == 1:
+                con.commit()
+        finally:
+            writer.depth -= 1
+            if writer.depth == 0:
+                writer.owner = None
+
+
+def in_write_transaction():
+    """Returns whether this thread is inside a write_transaction of any database"""
+    thread_id = threading.get_ident()
+    with writers_lock:
+        return any(writer.owner == thread_id for writer in writers.values())
+
+
+def restore_database(source_path, db_path=NEWRL_DB):
+    """Replaces the contents of a database with those of another database file
+
+    Copies through the backup API into the write connection under the
+    writer lock, so the file and its write ahead log are rewritten in place
+    rather than swapped. Open connections of every thread stay valid and
+    see the restored state from their next read transaction. A source_path
+    of None empties the database.
+    """
+    writer = get_writer(db_path)
+    with writer.lock:
+        if writer.depth > 0:
+            raise RuntimeError('Cannot restore a database inside a write transaction')
+        source = sqlite3.connect(':memory:' if source_path is None else source_path)
+        try:
+            source.backup(writer.get_connection())
+        finally:
+            source.close()
+
+
+def close_connections(db_path=NEWRL_DB):
+    """Checkpoints and closes the connections of this thread and the writer
+
+    Read connections of other threads stay open, so never replace or remove
+    a live database file after calling this. Use restore_database instead.
+    """
+    writer = get_writer(db_path)
+    with writer.lock:
+        if writer.connection is not None:
+            try:
+                writer.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            except sqlite3.Error as e:
+                logger.info(f'Could not checkpoint {db_path}: {e}')
+        writer.close()
+    connections = getattr(readers, 'connections', {})
+    for read_only in (False, True):
+        entry = connections.pop((db_path, read_only), None)
+        if entry is not None:
+            entry[0].close()
@@ -5,17 +5,20 @@ import logging
 import math
 from re import A
 import time
-import ecdsa
 import os
 import hashlib
 import json
 import datetime
 import base64
-import sqlite3
 
+from app.codes.crypto import sign_message, verify_message
 from app.codes.db_updater import get_contract_from_address, get_wallet_token_balance
+from app.codes.fs.mempool_manager import add_transaction_to_mempool
 from app.codes.helpers.CustomExceptions import ContractValidationError
 from app.codes.helpers.FetchRespository import FetchRepository
+from app.codes.serialization import encode
+from app.codes.signatureverifier import get_signature_key
+from app.codes.storage import get_cursor
 from app.Configuration import Configuration
 from app.nvalues import CUSTODIAN_DAO_ADDRESS
 
@@ -43,6 +46,7 @@ class Transactionmanager:
         self.signatures = []
         self.mempool = MEMPOOL_PATH
         self.validity = 0
+        self.verified_signatures = {}
 
     def get_valid_addresses(self):
         """Get valid signature addresses for a transaction"""
@@ -93,12 +97,10 @@ class Transactionmanager:
 
     def save_transaction_to_mempool(self, file=None):
         """dumps active transaction into a stated file or in mempool by default"""
-        transaction_timestamp = self.transaction['timestamp']
-        if not transaction_timestamp:
-            transaction_timestamp = get_time_ms()
-        if not file:
-            file = f"{self.mempool}transaction-{self.transaction['type']}-{transaction_timestamp}.json"
         transaction_complete = self.get_transaction_complete()
+        if not file:
+            add_transaction_to_mempool(transaction_complete)
+            return None
         with open(file, "w") as writefile:
             json.dump(transaction_complete, writefile)
             print("Wrote transaction to ", file)
@@ -113,9 +115,8 @@ class Transactionmanager:
 
     def sign_transaction(self, private_key_bytes, address):
         """this takes keybytes and not binary string and not base64 string"""
-        msg = json.dumps(self.transaction).encode()
-        signing_key = ecdsa.SigningKey.from_string(private_key_bytes, curve=ecdsa.SECP256k1)
-        msgsignbytes = signing_key.sign(msg)
+        msg = encode(self.transaction)
+        msgsignbytes = sign_message(private_key_bytes, msg)
         msgsign = msgsignbytes.hex()
         self.signatures.append({'wallet_address': address, 'msgsign': msgsign})
         return msgsignbytes
@@ -123,10 +124,12 @@ class Transactionmanager:
     def verify_sign(self, sign_trans, public_key_bytes):
         """The pubkey above is in bytes form"""
         # sign_trans_bytes = base64.decodebytes(sign_trans.encode('utf-8'))
+        message = encode(self.transaction)
+        signature_key = get_signature_key(message, public_key_bytes.hex(), sign_trans)
+        if signature_key in self.verified_signatures:
+            return self.verified_signatures[signature_key]
         sign_trans_bytes = bytes.fromhex(sign_trans)
-        verifying_key = ecdsa.VerifyingKey.from_string(public_key_bytes, curve=ecdsa.SECP256k1)
-        message = json.dumps(self.transaction).encode()
-        return verifying_key.verify(sign_trans_bytes, message)
+        return verify_message(public_key_bytes, sign_trans_bytes, message)
 
     def verifytransigns(self):
         # need to add later a check for addresses mentioned in the transaction (vary by type) and the signing ones
@@ -191,35 +194,6 @@ class Transactionmanager:
             print("Either some signatures invalid or some required ones missing")
             return False
 
-    def mempoolpayment(self, sender, tokencode):
-        #	if not mempool:
-        mempool = self.mempool
-        filenames = os.listdir(mempool)
-        mppayment = 0
-        for filename in filenames:
-            fl = mempool+filename
-        #	self.loadtransaction
-            try:
-                with open(fl, "r") as readfile:
-                    trandata = json.load(readfile)['transaction']
-            except:
-                print('Invalid transaction')
-                continue
-            ttype = trandata['type']
-            if ttype < 3:  # 0 is genesis, 1 is wallet creation, 2 is token creation
-                continue
-            if ttype == 5:  # unilateral transaction so will have only asset_1 number
-                if sender == trandata['specific_data']['wallet1'] and trandata['specific_data']['asset1_code'] == tokencode:
-                    mppayment += trandata['specific_data']['asset1_number']
-            if ttype == 4:  # bilateral trasnaction so will have both aset_1 and asset_2 numbers
-                if sender == trandata['specific_data']['wallet1'] and trandata['specific_data']['asset1_code'] == tokencode:
-                    mppayment += trandata['specific_data']['asset1_number']
-                if sender == trandata['specific_data']['wallet2'] and trandata['specific_data']['asset2_code'] == tokencode:
-                    mppayment += trandata['specific_data']['asset2_number']
-
-        #	need to incorporate the fee as well in future
-        return mppayment
-
     def econvalidator(self, cur=None):
         # start with all holdings of the wallets involved and add validated transactions from mempool
         # from mempool only include transactions that reduce balance and not those that increase
@@ -353,9 +327,6 @@ class Transactionmanager:
             sender1 = self.transaction['specific_data']['wallet1']
             sender2 = self.transaction['specific_data']['wallet2']
             tokencode1 = self.transaction['specific_data']['asset1_code']
-            # token1mp = self.mempoolpayment(sender1, tokencode1)
-            # token1amt = max(
-            #     self.transaction['specific_data']['asset1_number'], token1mp)
             token1amt = self.transaction['specific_data']['asset1_number']
             sender1valid = False
             sender2valid = False
@@ -372,9 +343,6 @@ class Transactionmanager:
             if ttype == 4:  # some attributes of transaction apply only for bilateral transfer and not unilateral
                 #	startingbalance2=0;
                 tokencode2 = self.transaction['specific_data']['asset2_code']
-                # token2mp = self.mempoolpayment(sender2, tokencode2)
-                # token2amt = max(
-                #     self.transaction['specific_data']['asset2_number'], token2mp)
                 token2amt = self.transaction['specific_data']['asset2_number']
 
             # address validity applies to both senders in ttype 4 and 5; since sender2 is still receiving tokens
@@ -507,8 +475,7 @@ class Transactionmanager:
         if funct_called == "setup":
             return True
         funct_name = "validate"
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
+        cur = get_cursor()
         contract = get_contract_from_address(cur, specific_data['address'])
 
         try:
@@ -521,24 +488,18 @@ class Transactionmanager:
             funct(specific_data, fetchRepository)
         except TypeError as e:
             logger.warn(f"Validate method not implemented for {sc_class}")
-            con.close()
             return True
         except AttributeError as e:
             logger.warn(f"Validate method not implemented for {sc_class}")
-            con.close()
             return True
         except ContractValidationError as e:
             logger.error(f"Contract validation failed {e}")
-            con.close()
             return False
         except Exception as e:
             logger.error(f"{type(e)}")
             logger.error(f"Error validating the contract call {e}")
-            con.close()
             return False
 
-        con.close()
-
         return True
 #	def legalvalidator(self):
         # check the token restrictions on ownertype and check the type of the recipient
@@ -548,16 +509,10 @@ class Transactionmanager:
 
 def get_public_key_from_address(address, cur=None):
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
     wallet_cursor = cur.execute(
         'SELECT wallet_public FROM wallets WHERE wallet_address=?', (address, ))
     public_key = wallet_cursor.fetchone()
-    if cursor_opened:
-        con.close()
     if public_key is None:
         return None
     return public_key[0]
@@ -565,16 +520,10 @@ def get_public_key_from_address(address, cur=None):
 
 def is_token_valid(token_code, cur=None):
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
     token_cursor = cur.execute(
         'SELECT tokencode FROM tokens WHERE tokencode=?', (token_code, ))
     token = token_cursor.fetchone()
-    if cursor_opened:
-        con.close()
     if token is None:
         return False
     return True
@@ -585,17 +534,11 @@ def is_wallet_valid(address, cur=None, check_sc=True):
         if is_smart_contract(address, cur=cur):
             return True
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
 
     wallet_cursor = cur.execute(
         'SELECT wallet_public FROM wallets WHERE wallet_address=?', (address, ))
     wallet = wallet_cursor.fetchone()
-    if cursor_opened:
-        con.close()
     if wallet is None:
         return False
 
@@ -615,32 +558,20 @@ def is_custodian_wallet(address, cur=None):
     custodian_dao_pid = get_person_id_for_wallet_address(CUSTODIAN_DAO_ADDRESS)
     wallet_pid = get_person_id_for_wallet_address(address)
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
     pid_cursor = cur.execute(
         'SELECT count(*) FROM dao_membership WHERE dao_person_id=? and member_person_id=?', (custodian_dao_pid, wallet_pid))
     pid = pid_cursor.fetchone()
     is_valid_custodian = pid != None
-    if cursor_opened:
-        con.close()
 
     return is_valid_custodian
 
 
 def get_wallets_from_pid(personidinput, cur=None):
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
     wallet_cursor = cur.execute(
         'SELECT wallet_id FROM person_wallet WHERE person_id=?', (personidinput, )).fetchall()
-    if cursor_opened:
-        con.close()
     if wallet_cursor is None:
         return False
     wallets = [dict(wlt) for wlt in wallet_cursor]
@@ -649,16 +580,10 @@ def get_wallets_from_pid(personidinput, cur=None):
 
 def get_pid_from_wallet(walletaddinput, cur=None):
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
     pid_cursor = cur.execute(
         'SELECT person_id FROM person_wallet WHERE wallet_id=?', (walletaddinput, ))
     pid = pid_cursor.fetchone()
-    if cursor_opened:
-        con.close()
     if pid is None:
         return False
     return pid[0]
@@ -666,16 +591,10 @@ def get_pid_from_wallet(walletaddinput, cur=None):
 
 def get_custodian_from_token(token_code, cur=None):
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
     token_cursor = cur.execute(
         'SELECT custodian FROM tokens WHERE tokencode=?', (token_code, ))
     custodian = token_cursor.fetchone()
-    if cursor_opened:
-        con.close()
     if custodian is None:
         return False
     return custodian[0]
@@ -683,11 +602,7 @@ def get_custodian_from_token(token_code, cur=None):
 
 def get_miner_count_person_id(person_id, cur=None):
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
     token_cursor = cur.execute(
         '''
         select count(*) from miners
@@ -696,8 +611,6 @@ def get_miner_count_person_id(person_id, cur=None):
             where person_id = ?)
         ''', (person_id, ))
     result = token_cursor.fetchone()
-    if cursor_opened:
-        con.close()
     if result is None:
         return 0
     return result[0]
@@ -714,15 +627,9 @@ def get_sc_validadds(transaction, cur=None):
         print("Invalid call to a function of a contract yet to be set up.")
         return [-1]
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
     signatories = cur.execute(
         'SELECT signatories FROM contracts WHERE address=?', (address, )).fetchone()
-    if cursor_opened:
-        con.close()
     if signatories is None:
         print("Contract does not exist.")
         return [-1]
@@ -765,21 +672,58 @@ def get_valid_addresses(transaction, cur=None):
     return valid_addresses
 
 
+def get_transaction_debits(transaction):
+    """Amounts a transaction takes out of each (wallet, token) including fee
+
+    Smart contract fees are attributed to the stated signers so that no
+    state lookup is needed.
+    """
+    if 'transaction' in transaction:
+        transaction = transaction['transaction']
+    transaction_type = transaction['type']
+    specific_data = transaction['specific_data']
+    debits = {}
+
+    def add_debit(wallet, token_code, amount):
+        if not wallet or not token_code or not amount:
+            return
+        key = (wallet, token_code)
+        debits[key] = debits.get(key, 0) + int(amount)
+
+    if transaction_type not in [TRANSACTION_MINER_ADDITION, TRANSACTION_SC_UPDATE]:
+        if transaction_type == TRANSACTION_SMART_CONTRACT:
+            payers = specific_data.get('signers', [])
+        else:
+            try:
+                payers = get_valid_addresses(transaction)
+            except Exception:
+                payers = []
+        fee = transaction.get('fee', 0)
+        for payer in payers:
+            add_debit(payer, transaction['currency'], math.ceil(fee / len(payers)))
+
+    if transaction_type == TRANSACTION_ONE_WAY_TRANSFER:
+        add_debit(specific_data['wallet1'], specific_data['asset1_code'], specific_data['asset1_number'])
+    if transaction_type == TRANSACTION_TWO_WAY_TRANSFER:
+        add_debit(specific_data['wallet1'], specific_data['asset1_code'], specific_data['asset1_number'])
+        add_debit(specific_data['wallet2'], specific_data['asset2_code'], specific_data['asset2_number'])
+    if transaction_type == TRANSACTION_SMART_CONTRACT and isinstance(specific_data.get('params'), dict):
+        signers = specific_data.get('signers', [])
+        if len(signers) > 0:
+            for value in specific_data['params'].get('value', []):
+                add_debit(signers[0], value['token_code'], value['amount'])
+    return debits
+
+
 def get_wallet_token_balance_tm(wallet_address, token_code, cur=None):
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
 
     balance = get_wallet_token_balance(cur, wallet_address, token_code)
     # balance_cursor = cur.execute('SELECT balance FROM balances WHERE wallet_address = :address AND tokencode = :tokencode', {
     #     'address': wallet_address, 'tokencode': token_code})
     # balance_row = balance_cursor.fetchone()
     # balance = balance_row[0] if balance_row is not None else 0
-    if cursor_opened:
-        con.close()
     return balance
 
 
@@ -787,17 +731,11 @@ def is_smart_contract(address, cur=None):
     if not address.startswith('ct'):
         return False
     if cur is None:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        cursor_opened = True
-    else:
-        cursor_opened = False
+        cur = get_cursor()
 
     sc_cursor = cur.execute(
         'SELECT COUNT (*) FROM contracts WHERE address=?', (address, ))
     sc_id = sc_cursor.fetchone()
-    if cursor_opened:
-        con.close()
     if sc_id is None:
         return False
     else:
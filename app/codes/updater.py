@@ -1,17 +1,17 @@
 """Updater that adds a new block and updates state db"""
+import copy
 import datetime
 import json
 import os
 import logging
 from random import randint
-import sqlite3
 import time
 import threading
 from app.codes.dbmanager import check_and_create_snapshot_in_thread
 from app.codes.fs.archivemanager import cleanup_old_archive_blocks
 from app.codes.fs.temp_manager import store_receipt_to_temp
 from app.codes.p2p.sync_chain import sync_chain_from_peers
-from app.codes.receiptmanager import get_receipt_in_temp_not_in_chain
+from app.codes.receiptmanager import get_receipt_in_temp_not_in_chain, pack_receipts_for_block
 from app.codes.timers import SYNC_STATUS
 
 # from app.codes.receiptmanager import get_receipts_for_block_from_db
@@ -22,19 +22,24 @@ from .fs.temp_manager import get_all_receipts_from_storage, get_blocks_for_index
 from .minermanager import am_i_in_current_committee, broadcast_miner_update, get_committee_for_current_block, get_miner_for_current_block, should_i_mine
 from ..Configuration import Configuration
 from ..nvalues import SENTINEL_NODE_WALLET, TREASURY_WALLET_ADDRESS
-from ..constants import ALLOWED_FEE_PAYMENT_TOKENS, BLOCK_RECEIVE_TIMEOUT_SECONDS, BLOCK_TIME_INTERVAL_SECONDS, COMMITTEE_SIZE, GLOBAL_INTERNAL_CLOCK_SECONDS, IS_TEST, MIN_SYNC_INTERVAL_MS, MINIMUM_ACCEPTANCE_VOTES, NEWRL_DB, NEWRL_PORT, NO_BLOCK_TIMEOUT, NO_RECEIPT_COMMITTEE_TIMEOUT, REQUEST_TIMEOUT, MEMPOOL_PATH, SOFTWARE_VERSION, TIME_BETWEEN_BLOCKS_SECONDS, TIME_MINER_BROADCAST_INTERVAL_SECONDS
+from ..constants import ALLOWED_FEE_PAYMENT_TOKENS, BLOCK_RECEIVE_TIMEOUT_SECONDS, BLOCK_TIME_INTERVAL_SECONDS, COMMITTEE_SIZE, GLOBAL_INTERNAL_CLOCK_SECONDS, IS_TEST, MAX_BLOCK_PAYLOAD_BYTES, MIN_SYNC_INTERVAL_MS, MINIMUM_ACCEPTANCE_VOTES, NEWRL_DB, NEWRL_PORT, NO_BLOCK_TIMEOUT, NO_RECEIPT_COMMITTEE_TIMEOUT, REQUEST_TIMEOUT, SOFTWARE_VERSION, TIME_BETWEEN_BLOCKS_SECONDS, TIME_MINER_BROADCAST_INTERVAL_SECONDS
 from .p2p.peers import get_peers
 from .p2p.utils import is_my_address
 from .utils import BufferedLog, get_time_ms
 from .blockchain import Blockchain, get_last_block, get_last_block_index
+from .blockbuilder import fit_receipts_in_block
+from .blockcandidate import block_candidate, should_include_transaction
 from .transactionmanager import Transactionmanager, get_valid_addresses
 from .state_updater import pay_fee_for_transaction, update_db_states
 from .crypto import calculate_hash, sign_object, _private, _public
+from .serialization import track
+from .statewriter import PRIORITY_CONSENSUS, state_writer
+from .storage import get_cursor, write_transaction
 from .consensus.consensus import generate_block_receipt
 from .db_updater import transfer_tokens_and_update_balances, get_wallet_token_balance
 from .p2p.outgoing import broadcast_block, broadcast_receipt, send_request_in_thread
 from .auth.auth import get_wallet
-from .fs.mempool_manager import mempool_cleanup
+from .fs.mempool_manager import mempool, mempool_cleanup
 from .timers import TIMERS
 from .auth.auth import get_wallet
 
@@ -42,16 +47,12 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-MAX_BLOCK_SIZE = 100
-
-
 def run_updater(add_to_chain=False):
     start_time = time.time()
     # logger = BufferedLog()
     blockchain = Blockchain()
 
-    con = sqlite3.connect(NEWRL_DB)
-    cur = con.cursor()
+    cur = get_cursor()
     block_time_limit = 1  # Number of hours of no transactions still prompting new block
     block_height = 0
     latest_ts = blockchain.get_latest_ts(cur)
@@ -73,60 +74,8 @@ def run_updater(add_to_chain=False):
             return existing_block_proposals[0]
 
     logger.info(f'Proposing new block {new_block_index}')
-    filenames = os.listdir(MEMPOOL_PATH)  # this is the mempool
-    logger.info(f"Transactions in mempool: {len(filenames)}")
-    textarray = []
-    transfiles = filenames
-    txcodes = {}
-    tmtemp = Transactionmanager()
-
-    transaction_fees = 0
-
-    for filename in transfiles:
-        file = MEMPOOL_PATH + filename
-        try:
-            with open(file, "r") as read_file:
-                trandata = tmtemp.loadtransactionpassive(file)
-                transaction = trandata['transaction']
-        except:
-            logger.info(f"Couldn't load transaction file {file}")
-            continue
-        
-        # if not tmtemp.verifytransigns():
-        #     logger.info(
-        #         f"Transaction id {trandata['transaction']['trans_code']} has invalid signatures")
-        #     os.remove(file)
-        #     continue
-        # Pay fee for transaction. If payee doesn't have enough funds, remove transaction
-        if transaction['type'] != TRANSACTION_MINER_ADDITION and not pay_fee_for_transaction(cur, transaction, get_wallet()['address']):
-            os.remove(file)
-            continue
-        if not tmtemp.econvalidator():
-            logger.info(f"Economic validation failed for transaction {trandata['transaction']['trans_code']}")
-            os.remove(file)
-            continue
-
-        # logger.info("Found valid transaction, checking if it is already included")
-        transactions_cursor = cur.execute("SELECT transaction_code FROM transactions where transaction_code=?", (transaction['trans_code'], ))
-        row = transactions_cursor.fetchone()
-        if row is not None:
-            # The current transaction is already included in some earlier block
-            os.remove(file)
-            continue
-        
-        if not should_include_transaction(transaction, new_block_index - 1):
-            os.remove(file)
-            continue
-        
-        if trandata['transaction']['trans_code'] not in txcodes:
-            textarray.append(tmtemp.get_transaction_complete())
-            txcodes[trandata['transaction']['trans_code']] = 1
-            block_height += 1
-        
-        if block_height >= MAX_BLOCK_SIZE:
-            logger.info(
-                "Reached max block height, moving forward with the collected transactions")
-            break
+    textarray, template = block_candidate.snapshot()
+    logger.info(f"Transactions in mempool: {len(mempool)}")
 
     transactionsdata = {"transactions": textarray}
     if len(textarray) > 0:
@@ -147,36 +96,45 @@ def run_updater(add_to_chain=False):
 
     # transactionsdata['previous_block_receipts'] = get_receipts_from_storage(previous_block['index'])
     if previous_block is not None:
-        transactionsdata['previous_block_receipts'] = get_receipt_in_temp_not_in_chain(exclude_block=previous_block['index'] + 1)
-        receipts_to_include_count = MAX_BLOCK_SIZE - len(textarray)
-        transactionsdata['previous_block_receipts'] = transactionsdata['previous_block_receipts'][:receipts_to_include_count]
+        transactionsdata['previous_block_receipts'] = pack_receipts_for_block(
+            get_receipt_in_temp_not_in_chain(exclude_block=previous_block['index'] + 1),
+            new_block_index)
+        transactionsdata['previous_block_receipts'] = fit_receipts_in_block(
+            transactionsdata['previous_block_receipts'],
+            MAX_BLOCK_PAYLOAD_BYTES - template.payload_bytes)
     else:
         transactionsdata['previous_block_receipts'] = []
     # transactionsdata['previous_block_proposals'] = get_proposals_for_block(previous_block['index'])
     logger.info("Time taken to mine block: %s seconds" % (time.time() - start_time))
     if add_to_chain:
-        block = blockchain.mine_block(cur, transactionsdata)
-        update_db_states(cur, block)
-        con.commit()
-        con.close()
+        block = state_writer.submit(
+            'mine_block', mine_and_commit_block, blockchain, transactionsdata, priority=PRIORITY_CONSENSUS)
     else:
         block = blockchain.propose_block(cur, transactionsdata)
+    block = track(block)
     block_receipt = generate_block_receipt(block, vote=BLOCK_VOTE_MINER)
-    block_payload = {
+    block_payload = track({
         'index': block['index'],
         'hash': calculate_hash(block),
         'data': block,
         'receipts': [block_receipt],
         'software_version': SOFTWARE_VERSION
-    }
+    })
     store_block_to_temp(block_payload)
     # store_receipt_to_temp(block_receipt)
     logger.info(f"Stored block to temp with index {block_payload['index']} and hash {block_payload['hash']}")
     broadcast_block_proposal(block_payload, block_receipt)
-    con.close()
     return block_payload
 
 
+def mine_and_commit_block(blockchain, transactionsdata):
+    """Mines a block and applies it to state. Run on the state writer"""
+    with write_transaction() as cur:
+        block = blockchain.mine_block(cur, transactionsdata)
+        update_db_states(cur, block)
+    return block
+
+
 def broadcast_block_proposal(block_payload, block_receipt=None):
     if not IS_TEST:
         nodes = get_committee_for_current_block()
@@ -199,13 +157,14 @@ def create_empty_block_receipt_and_broadcast():
     #     return
     blockchain = Blockchain()
     block = blockchain.mine_empty_block()
+    block = track(block)
     block_receipt = generate_block_receipt(block)
-    block_payload = {
+    block_payload = track({
         'index': block['index'],
         'hash': calculate_hash(block),
         'data': block,
         'receipts': [block_receipt]
-    }
+    })
     store_block_to_temp(block_payload)
 
     committee = get_committee_for_current_block()
@@ -261,23 +220,6 @@ def start_miner_broadcast_clock():
     timer.start()
 
 
-def should_include_transaction(transaction, my_last_block_index=0):
-    try:
-        if transaction['type'] == 7:
-            broadcast_timestamp = transaction['specific_data']['broadcast_timestamp']
-            if broadcast_timestamp < get_corrected_time_ms() - TIME_MINER_BROADCAST_INTERVAL_SECONDS * 1000:
-                return False
-            software_version = transaction['specific_data']['software_version']
-            last_block_index = transaction['specific_data']['last_block_index']
-            # if software_version < SOFTWARE_VERSION or last_block_index < my_last_block_index - 100:
-            if last_block_index < my_last_block_index - 300:
-                return False
-    except Exception as e:
-        logger.error(f'Invalid transaction format {str(transaction)}, {str(e)}')
-        return False
-    return True
-
-
 def global_internal_clock():
     """Reccuring clock for all node level activities"""
     global TIMERS
@@ -370,13 +312,14 @@ def sentitnel_node_mine_empty():
     #     block = blockchain.mine_empty_block(current_time_ms, block_status=BLOCK_STATUS_CONSENSUS_TIMEOUT)
     # else:
     #     block = blockchain.mine_empty_block(current_time_ms, block_status=BLOCK_STATUS_MINING_TIMEOUT)
+    block = track(block)
     block_receipt = generate_block_receipt(block)
-    block_payload = {
+    block_payload = track({
         'index': block['index'],
         'hash': calculate_hash(block),
         'data': block,
         'receipts': [block_receipt]
-    }
+    })
     store_block_to_temp(block_payload)
     broadcast_block(block_payload=block_payload, send_to_archive=True)
 
@@ -396,13 +339,14 @@ def committee_mine_empty():
     
     blockchain = Blockchain()
     block = blockchain.mine_empty_block(block_status=block_status)
+    block = track(block)
     block_receipt = generate_block_receipt(block)
-    block_payload = {
+    block_payload = track({
         'index': block['index'],
         'hash': calculate_hash(block),
         'data': block,
         'receipts': [block_receipt]
-    }
+    })
     store_block_to_temp(block_payload)
 
     committee = get_committee_for_current_block()
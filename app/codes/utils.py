@@ -4,6 +4,7 @@ import time
 
 from ..constants import NEWRL_DB
 from .clock.global_time import get_corrected_time_ms
+from .storage import get_cursor
 
 
 def save_file_and_get_path(upload_file):
@@ -42,13 +43,11 @@ def get_person_id_for_wallet_address(wallet_address):
 
 def get_last_block_hash():
     """Get last block hash from db"""
-    con = sqlite3.connect(NEWRL_DB)
-    cur = con.cursor()
+    cur = get_cursor()
     last_block_cursor = cur.execute(
         'SELECT block_index, hash, timestamp FROM blocks ORDER BY block_index DESC LIMIT 1'
     )
     last_block = last_block_cursor.fetchone()
-    con.close()
 
     if last_block is not None:
         return {
@@ -5,18 +5,20 @@ import datetime
 import json
 import logging
 
-import ecdsa
 import os
 from app.codes.clock.global_time import get_corrected_time_ms
-from app.codes.crypto import calculate_hash
+from app.codes.crypto import calculate_hash, verify_message
+from app.codes.serialization import encode
 
-from app.codes.fs.mempool_manager import transaction_exists_in_mempool
-from app.codes.p2p.transport import send
+from app.codes.fs.mempool_manager import add_transaction_to_mempool, transaction_exists_in_mempool
 from app.ntypes import BLOCK_VOTE_INVALID, BLOCK_VOTE_VALID, TRANSACTION_MINER_ADDITION
 from .utils import get_last_block_hash
+from .blockcandidate import block_candidate
+from .pendingdebits import add_transaction_if_covered
+from .receiptmanager import verify_receipt_signature
 from .transactionmanager import Transactionmanager
-from ..constants import IS_TEST, MAX_TRANSACTION_SIZE, MEMPOOL_PATH, MEMPOOL_TRANSACTION_LIFETIME_SECONDS
-from .p2p.outgoing import propogate_transaction_to_peers
+from ..constants import IS_TEST, MAX_TRANSACTION_SIZE, MEMPOOL_TRANSACTION_LIFETIME_SECONDS
+from .p2p.outgoing import queue_transaction_announcement
 from .chainscanner import get_transaction
 
 from jsonschema import validate as jsonvalidate
@@ -26,7 +28,12 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def validate(transaction, propagate=False, validate_economics=True):
+def validate(transaction, propagate=False, validate_economics=True, verified_signatures=None):
+    """Validates a transaction and adds it to the mempool
+
+    verified_signatures holds signature checks already done for a batch,
+    as returned by signatureverifier.verify_signatures.
+    """
     if not validate_transaction_structure(transaction):
         return {'valid': False, 'msg': 'Invalid transaction structure'}
     # if transaction['transaction']['timestamp'] < get_corrected_time_ms() - MEMPOOL_TRANSACTION_LIFETIME_SECONDS * 1000:
@@ -51,6 +58,8 @@ def validate(transaction, propagate=False, validate_economics=True):
     
     transaction_manager = Transactionmanager()
     transaction_manager.set_transaction_data(transaction)
+    if verified_signatures is not None:
+        transaction_manager.verified_signatures = verified_signatures
     signatures_valid = transaction_manager.verifytransigns()
     valid = False
     if not signatures_valid:
@@ -73,20 +82,22 @@ def validate(transaction, propagate=False, validate_economics=True):
                 msg = "Contract Validation Failed"
                 valid = False
     
+    if valid:
+        if not validate_economics:
+            add_transaction_to_mempool(transaction_manager.get_transaction_complete())
+        elif not add_transaction_if_covered(transaction_manager.get_transaction_complete()):
+            msg = "Balance does not cover pending mempool transactions"
+            valid = False
+
     check = {'valid': valid, 'msg': msg, 'new_transaction': True}
 
     if valid:  # Economics and signatures are both valid
-        transaction_file = f"{MEMPOOL_PATH}transaction-{transaction_manager.transaction['type']}-{transaction_manager.transaction['trans_code']}.json"
-        transaction_manager.save_transaction_to_mempool(transaction_file)
+        block_candidate.on_transaction_admitted(transaction_manager.get_transaction_complete())
 
         if propagate and not IS_TEST:
-            # Broadcast transaction to peers via HTTP
+            # Announce the transaction code to peers. Peers fetch it if missing
             if transaction['transaction']['timestamp'] > get_corrected_time_ms() - MEMPOOL_TRANSACTION_LIFETIME_SECONDS * 1000:
-                exclude_nodes = transaction['peers_already_broadcasted'] if 'peers_already_broadcasted' in transaction else None
-                propogate_transaction_to_peers(
-                    transaction_manager.get_transaction_complete(),
-                    exclude_nodes=exclude_nodes
-                )
+                queue_transaction_announcement([transaction['transaction']['trans_code']])
 
             # Broadcaset transaction via transport server
             # try:
@@ -103,20 +114,17 @@ def validate(transaction, propagate=False, validate_economics=True):
 
 
 def validate_signature(data, public_key, signature):
-    public_key_bytes = bytes.fromhex(public_key)
     sign_trans_bytes = bytes.fromhex(signature)
-    vk = ecdsa.VerifyingKey.from_string(
-        public_key_bytes, curve=ecdsa.SECP256k1)
-    message = json.dumps(data).encode()
+    message = encode(data)
     try:
-        return vk.verify(sign_trans_bytes, message)
+        return verify_message(public_key, sign_trans_bytes, message)
     except:
         return False
 
 
 def validate_receipt_signature(receipt):
     try:
-        return validate_signature(receipt['data'], receipt['public_key'], receipt['signature'])
+        return verify_receipt_signature(receipt)
     except Exception as e:
         logger.error('Error validating receipt signature')
         return False
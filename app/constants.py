@@ -1,7 +1,7 @@
 """Global constants in this file"""
 import os
 
-from .ntypes import NEWRL_TOKEN_CODE, NUSD_TOKEN_CODE
+from .ntypes import NEWRL_TOKEN_CODE, NUSD_TOKEN_CODE, TRANSACTION_MINER_ADDITION, TRANSACTION_ONE_WAY_TRANSFER, TRANSACTION_SC_UPDATE, TRANSACTION_SMART_CONTRACT, TRANSACTION_TOKEN_CREATION, TRANSACTION_TRUST_SCORE_CHANGE, TRANSACTION_TWO_WAY_TRANSFER, TRANSACTION_WALLET_CREATION
 
 SOFTWARE_VERSION = "1.4.2"
 
@@ -68,11 +68,44 @@ NO_BLOCK_TIMEOUT = 10  # No block received timeout in seconds
 NO_RECEIPT_COMMITTEE_TIMEOUT = 10  # Timeout in seconds
 NETWORK_BLOCK_TIMEOUT = 25
 MAX_BROADCAST_NODES = 13
+DELIVERY_LATENCY_SMOOTHING = 0.2  # Weight of the latest request in the average peer latency
+WIRE_FORMAT_VERSION = 2  # Compact wire format version sent to peers
+COMPRESSION_DICTIONARY_VERSION = 1  # Preset zlib dictionary sent with the wire format. 0 for none
+COMPRESSION_DICTIONARY_SIZE = 16384  # Bytes kept when building a dictionary. zlib uses at most 32768
+MAX_DECOMPRESSED_PAYLOAD_BYTES = 16000000  # Largest size a payload from a peer may decompress to
+WIRE_FORMAT_RETRY_SECONDS = 3600  # Peers which rejected the compact wire format get legacy payloads for this long
 MEMPOOL_TRANSACTION_LIFETIME_SECONDS = 3600  # Mempool transactions will be removed after 1 hour
+MEMPOOL_JOURNAL_FILE = 'mempool.journal'
+MEMPOOL_JOURNAL_FSYNC_BATCH_SIZE = 100  # Records appended before the journal is fsynced
+MEMPOOL_JOURNAL_FSYNC_INTERVAL_SECONDS = 1
+MEMPOOL_JOURNAL_COMPACTION_MIN_RECORDS = 1000  # Removed records tolerated before compaction
 MAX_TRANSACTION_BATCH_SIZE = 50
+SIGNATURE_VERIFICATION_WORKERS = os.cpu_count() or 1
+MIN_PARALLEL_SIGNATURE_VERIFICATIONS = 8  # Smaller batches are verified in process
+CRYPTO_BACKEND = os.environ.get('NEWRL_CRYPTO_BACKEND', 'ecdsa')  # ecdsa, coincurve or auto
+VERIFYING_KEY_CACHE_SIZE = 4096
+VERIFYING_KEY_PRECOMPUTE_HITS = 16  # Uses of a public key before its multiplication tables are precomputed
+TRANSACTION_ANNOUNCE_INTERVAL_SECONDS = 1
+MAX_TRANSACTION_ANNOUNCE_SIZE = 1000  # Transaction codes sent in one announcement
+MEMPOOL_SYNC_PEERS = 3  # Peers whose mempool is pulled when a node comes online
 MAX_TRANSACTION_SIZE = 4096
+MAX_BLOCK_PAYLOAD_BYTES = 400000  # Serialized size of transactions and receipts in a block
+MAX_BLOCK_EXECUTION_COST = 1000  # Sum of TRANSACTION_EXECUTION_COST over transactions in a block
 MIN_SYNC_INTERVAL_MS = 60000
 MAX_RECEIPT_HISTORY_BLOCKS = 1000
+# Blocks from this index carry receipts without public keys. Not scheduled on public networks yet
+COMPACT_RECEIPTS_BLOCK_INDEX = 0 if IS_TEST or NEWRL_ENV == 'test' else 2 ** 63 - 1
+WALLET_PUBLIC_KEY_CACHE_SIZE = 4096
+SQLITE_MAX_QUERY_PARAMETERS = 500  # Chunk size for IN (...) lookups
+STORAGE_PROFILE = os.environ.get('NEWRL_STORAGE_PROFILE', 'default')  # default, durable or low_memory
+STATE_WRITER_QUEUE_SIZE = 256  # State changes waiting for the writer thread before submitters block
+STATE_WRITER_SUBMIT_TIMEOUT_SECONDS = 60  # Time a submitter waits for room in a full writer queue
+STATE_WRITER_REQUEST_TIMEOUT_SECONDS = 30  # Time a request handler waits for its state change to run
+STATE_WRITER_LATENCY_SMOOTHING = 0.2  # Weight of the latest command in the average writer latencies
+BLOCK_HEIGHT_HEADER = 'X-Block-Height'  # Last committed block a query response was read at
+SNAPSHOT_BACKUP_PAGES = 1024  # Db pages copied per online backup step of a snapshot
+SNAPSHOT_STEP_SLEEP_SECONDS = 0.01  # Pause after each snapshot backup step so block commits get the disk
+SNAPSHOT_STEP_BUDGET_MS = 50  # Backup steps slower than this are followed by a pause as long as the step
 
 # Variables
 MY_ADDRESS_FILE = DATA_PATH + 'my_address.json'
@@ -86,6 +119,19 @@ MY_ADDRESS = ''
 
 ALLOWED_FEE_PAYMENT_TOKENS = [NEWRL_TOKEN_CODE, NUSD_TOKEN_CODE]
 
+# Estimated cost of applying a transaction by type, relative to a one way transfer
+TRANSACTION_EXECUTION_COST = {
+    TRANSACTION_WALLET_CREATION: 2,
+    TRANSACTION_TOKEN_CREATION: 2,
+    TRANSACTION_SMART_CONTRACT: 20,
+    TRANSACTION_TWO_WAY_TRANSFER: 2,
+    TRANSACTION_ONE_WAY_TRANSFER: 1,
+    TRANSACTION_TRUST_SCORE_CHANGE: 2,
+    TRANSACTION_MINER_ADDITION: 1,
+    TRANSACTION_SC_UPDATE: 2,
+}
+DEFAULT_TRANSACTION_EXECUTION_COST = 20
+
 MAX_NETWORK_TRUST_SCORE = 1000000
 INITIAL_NETWORK_TRUST_SCORE = 100000
 CUSTODIAN_OWNER_TYPE = 101
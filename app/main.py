@@ -17,6 +17,9 @@ from .codes.p2p.sync_chain import sync_chain_from_peers
 from .constants import NEWRL_PORT, IS_TEST
 from .codes.p2p.peers import init_bootstrap_nodes, update_my_address, update_software
 from .codes.clock.global_time import sync_timer_clock_with_global
+from .codes.fs.mempool_manager import mempool, start_mempool_journal_thread
+from .codes.p2p.outgoing import start_transaction_announcer_thread
+from .codes.p2p.sync_mempool import sync_mempool_transactions
 from .codes.updater import am_i_sentinel_node, global_internal_clock, start_miner_broadcast_clock, start_mining_clock
 
 from .routers import blockchain, system, p2p, transport
@@ -87,11 +90,15 @@ def app_startup():
             init_bootstrap_nodes()
             sync_chain_from_peers()
             update_my_address()
+            sync_mempool_transactions()
     except Exception as e:
         logger.error('Bootstrap failed')
         logging.critical(e, exc_info=True)
 
+    start_mempool_journal_thread()
+
     if not IS_TEST:
+        start_transaction_announcer_thread()
         if not am_i_sentinel_node():
             logger.info('Participating in mining')
             start_miner_broadcast_clock()
@@ -105,6 +112,7 @@ def app_startup():
 @app.on_event("shutdown")
 def shutdown_event():
     print('Shutting down node')
+    mempool.flush()
     os._exit(0)
 
 if __name__ == "__main__":
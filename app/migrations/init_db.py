@@ -3,13 +3,15 @@ import json
 import os
 import logging
 
-from app.codes.dbmanager import revert_to_last_snapshot
+from app.codes.dbmanager import restore_last_snapshot, snapshots_paused
 from app.codes.fs.archivemanager import get_block_from_archive
 
 from ..codes.blockchain import Blockchain, add_block
 from ..codes import blockchain
 from ..codes.state_updater import add_block_reward, update_state_from_transaction, update_trust_scores
 from ..codes.receiptmanager import update_receipts_in_state
+from ..codes.statewriter import PRIORITY_MAINTENANCE, state_writer
+from ..codes.storage import restore_database, write_transaction
 from .migrate_db import run_migrations
 from ..constants import NEWRL_DB, NEWRL_P2P_DB
 from ..codes.timers import SYNC_STATUS
@@ -21,7 +23,8 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def clear_db():
-    os.remove(NEWRL_DB)
+    with snapshots_paused():
+        restore_database(None)
     # con = sqlite3.connect(db_path)
     # cur = con.cursor()
     # cur.execute('DROP TABLE IF EXISTS wallets')
@@ -317,9 +320,13 @@ def init_db():
 
 
 def revert_chain_quick(revert_to_snapshot=True):
+    return state_writer.submit('revert', _revert_chain_quick, revert_to_snapshot, priority=PRIORITY_MAINTENANCE)
+
+
+def _revert_chain_quick(revert_to_snapshot):
     SYNC_STATUS['IS_SYNCING'] = True
     if revert_to_snapshot:
-        revert_to_last_snapshot()
+        restore_last_snapshot()
     else:
         clear_db()
         init_db()
@@ -329,6 +336,10 @@ def revert_chain_quick(revert_to_snapshot=True):
 
 def revert_chain(block_index):
     """Revert chain to given index"""
+    return state_writer.submit('revert', _revert_chain, block_index, priority=PRIORITY_MAINTENANCE)
+
+
+def _revert_chain(block_index):
     logger.info(f'Reverting chain to local snapshot.')
     global SYNC_STATUS
     if SYNC_STATUS['IS_SYNCING']:
@@ -342,7 +353,7 @@ def revert_chain(block_index):
         if block_index == 0:
             clear_db()
         else:
-            revert_to_last_snapshot()
+            restore_last_snapshot()
             SYNC_STATUS['IS_SYNCING'] = False
             return
             con = sqlite3.connect(NEWRL_DB)
@@ -376,16 +387,11 @@ def revert_chain(block_index):
         init_db()
         run_migrations()
 
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-
-        chain = Blockchain()
-        for _block_index in range(1, block_index):
-            block = chain.get_block(_block_index)
-            add_block(cur, block, is_state_reconstruction=True)
-
-        con.commit()
-        con.close()
+        with write_transaction() as cur:
+            chain = Blockchain()
+            for _block_index in range(1, block_index):
+                block = chain.get_block(_block_index)
+                add_block(cur, block, is_state_reconstruction=True)
     except Exception as e:
         logger.error(f'Error reverting {str(e)}')
     SYNC_STATUS['IS_SYNCING'] = False
@@ -416,11 +422,7 @@ def clear_state_and_make_from_archive():
         if block is None:
             logger.info(f'Finished archive block at index: {block_index}')
             break
-        con = sqlite3.connect(NEWRL_DB, timeout=10)
-        cur = con.cursor()
-        blockchain.add_block(cur, block)
-        con.commit()
-        con.close()
+        state_writer.submit('rebuild_block', blockchain.commit_block, block, priority=PRIORITY_MAINTENANCE)
         block_index += 1
 
 
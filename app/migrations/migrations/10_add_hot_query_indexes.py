@@ -0,0 +1,34 @@
+import sqlite3
+
+from ...constants import NEWRL_DB
+
+
+# Found with scripts/index_advisor.py. Each of these queries scanned its table
+HOT_QUERY_INDEXES = {
+    # get_blocks_in_range, chainscanner block transactions
+    'idx_transactions_block_index': 'transactions (block_index)',
+    # get_incoming_trust_scores, eligible miner join
+    'idx_trust_scores_dest_person_id': 'trust_scores (dest_person_id)',
+    # Membership checks by DAO and member
+    'idx_dao_membership_dao_person_id_member_person_id': 'dao_membership (dao_person_id, member_person_id)',
+    'idx_dao_membership_member_person_id': 'dao_membership (member_person_id)',
+    # slashing_tokens, eligible miner join
+    'idx_stake_ledger_wallet_address': 'stake_ledger (wallet_address)',
+    # get_eligible_miners
+    'idx_miners_block_index': 'miners (block_index)',
+}
+
+
+def migrate():
+    add_hot_query_indexes()
+
+def add_hot_query_indexes():
+    """Add indexes for the hot query shapes which scanned their tables"""
+    con = sqlite3.connect(NEWRL_DB)
+    cur = con.cursor()
+
+    for name, columns in HOT_QUERY_INDEXES.items():
+        cur.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {columns}')
+
+    con.commit()
+    con.close()
@@ -7,7 +7,7 @@ from typing import List
 from fastapi import APIRouter
 from fastapi.datastructures import UploadFile
 from fastapi.params import File
-from fastapi import HTTPException
+from fastapi import HTTPException, Response
 from fastapi.responses import HTMLResponse
 from starlette.responses import FileResponse
 from starlette.requests import Request
@@ -18,8 +18,10 @@ from app.codes.helpers.FetchRespository import FetchRepository
 from app.codes.p2p.sync_chain import find_forking_block, get_block_hashes, get_blocks
 from app.codes.scoremanager import get_incoming_trust_scores, get_outgoing_trust_scores, get_trust_score, get_trust_score_for_wallets
 
+from app.codes.blockchain import get_last_block
+from app.codes.storage import read_snapshot
 from app.codes.transactionmanager import Transactionmanager
-from app.constants import NEWRL_DB
+from app.constants import BLOCK_HEIGHT_HEADER, NEWRL_DB
 from app.nvalues import NETWORK_TRUST_MANAGER_PID
 
 from .request_models import AddWalletRequest, BalanceRequest, BalanceType, CallSC, CreateTokenRequest, CreateWalletRequest, GetTokenRequest, RunSmartContractRequest, TransferRequest, CreateSCRequest, TrustScoreUpdateRequest
@@ -47,55 +49,74 @@ legacy = 'Legacy'
 system = "System"
 
 
+def pin_block_height(response: Response, cur):
+    """Pins a query snapshot to the last committed block and returns its height in a header"""
+    last_block = get_last_block(cur)
+    response.headers[BLOCK_HEIGHT_HEADER] = str(last_block['index'] if last_block is not None else 0)
+    return last_block
+
+
 @router.get("/get-block", tags=[query_tag])
-def get_block_api(block_index: str):
+def get_block_api(block_index: str, response: Response):
     """Get a block from the chain"""
-    block = get_block(block_index)
+    with read_snapshot(row_factory=sqlite3.Row) as cur:
+        pin_block_height(response, cur)
+        block = get_block(block_index, cur)
     if block is None:
         raise HTTPException(status_code=400, detail="Block not found")
     return block
 
 @router.get("/get-transaction", tags=[query_tag])
-def get_transaction_api(transaction_code: str):
+def get_transaction_api(transaction_code: str, response: Response):
     """Get a transaction from the chain"""
-    transaction = get_transaction(transaction_code)
+    with read_snapshot(row_factory=sqlite3.Row) as cur:
+        pin_block_height(response, cur)
+        transaction = get_transaction(transaction_code, cur)
     if transaction is None:
         raise HTTPException(status_code=400, detail="Transaction not found")
     return transaction
 
 @router.get("/get-wallet", tags=[query_tag])
-def get_wallet_api(wallet_address: str):
+def get_wallet_api(wallet_address: str, response: Response):
     """Get a wallet details from the chain"""
-    wallet = get_wallet(wallet_address)
+    with read_snapshot(row_factory=sqlite3.Row) as cur:
+        pin_block_height(response, cur)
+        wallet = get_wallet(wallet_address, cur)
     if wallet is None:
         raise HTTPException(status_code=400, detail="Wallet not found")
     return wallet
 
 @router.get("/get-token", tags=[query_tag])
-def get_token_api(token_code: str):
+def get_token_api(token_code: str, response: Response):
     """Get a token details from the chain"""
-    wallet = get_token(token_code)
+    with read_snapshot(row_factory=sqlite3.Row) as cur:
+        pin_block_height(response, cur)
+        wallet = get_token(token_code, cur)
     if wallet is None:
         raise HTTPException(status_code=400, detail="Token not found")
     return wallet
 
 @router.get("/get-balances", tags=[query_tag])
-def get_balances_api(balance_type: BalanceType, token_code: str = "", wallet_address: str = ""):
-    chain_scanner = Chainscanner()
-    if balance_type == BalanceType.TOKEN_IN_WALLET:
-        balance = chain_scanner.getbaladdtoken(
-            wallet_address, str(token_code))
-    elif balance_type == BalanceType.ALL_TOKENS_IN_WALLET:
-        balance = chain_scanner.getbalancesbyaddress(wallet_address)
-    elif balance_type == BalanceType.ALL_WALLETS_FOR_TOKEN:
-        balance = chain_scanner.getbalancesbytoken(str(token_code))
+def get_balances_api(response: Response, balance_type: BalanceType, token_code: str = "", wallet_address: str = ""):
+    with read_snapshot() as cur:
+        pin_block_height(response, cur)
+        chain_scanner = Chainscanner(cur)
+        if balance_type == BalanceType.TOKEN_IN_WALLET:
+            balance = chain_scanner.getbaladdtoken(
+                wallet_address, str(token_code))
+        elif balance_type == BalanceType.ALL_TOKENS_IN_WALLET:
+            balance = chain_scanner.getbalancesbyaddress(wallet_address)
+        elif balance_type == BalanceType.ALL_WALLETS_FOR_TOKEN:
+            balance = chain_scanner.getbalancesbytoken(str(token_code))
     return {'balance': balance}
 
 
 @router.get("/get-contract", tags=[query_tag])
-def get_contract_api(contract_address: str):
+def get_contract_api(contract_address: str, response: Response):
     """Get a contract details from the chain"""
-    contract = get_contract(contract_address)
+    with read_snapshot(row_factory=sqlite3.Row) as cur:
+        pin_block_height(response, cur)
+        contract = get_contract(contract_address, cur)
     if contract is None:
         raise HTTPException(status_code=400, detail="Contract not found")
     return contract
@@ -104,9 +125,12 @@ def get_contract_api(contract_address: str):
 @router.get("/get-trustscore-pid", tags=[query_tag])
 def get_trust_score_api(
         destination_person_id: str,
+        response: Response,
         source_person_id: str=Configuration.config("NETWORK_TRUST_MANAGER_PID")):
     """Get a trust score. Default source_person_id is network trust manager"""
-    trust_score = get_trust_score(src_person_id=source_person_id, dest_person_id=destination_person_id)
+    with read_snapshot() as cur:
+        pin_block_height(response, cur)
+        trust_score = get_trust_score(src_person_id=source_person_id, dest_person_id=destination_person_id, cur=cur)
     if trust_score is None:
         raise HTTPException(status_code=400, detail="Trust score not available")
     return {'trust_score': trust_score}
@@ -115,9 +139,12 @@ def get_trust_score_api(
 @router.get("/get-trustscore-wallets", tags=[query_tag])
 def get_trust_score_api(
         src_wallet_address: str,
-        dst_wallet_address: str):
+        dst_wallet_address: str,
+        response: Response):
     """Get a trust score. Default source_person_id is network trust manager"""
-    trust_score = get_trust_score_for_wallets(src_wallet_address, dst_wallet_address)
+    with read_snapshot() as cur:
+        pin_block_height(response, cur)
+        trust_score = get_trust_score_for_wallets(src_wallet_address, dst_wallet_address, cur)
     if trust_score is None:
         raise HTTPException(status_code=400, detail="Trust score not available")
     return {'status': 'SUCCESS', 'trust_score': trust_score}
@@ -125,9 +152,12 @@ def get_trust_score_api(
 
 @router.get("/get-incoming-trustscores", tags=[query_tag])
 def get_trust_score_api(
-        dst_wallet_address: str):
+        dst_wallet_address: str,
+        response: Response):
     """Get a trust score. Default source_person_id is network trust manager"""
-    trust_score = get_incoming_trust_scores(dst_wallet_address)
+    with read_snapshot(row_factory=sqlite3.Row) as cur:
+        pin_block_height(response, cur)
+        trust_score = get_incoming_trust_scores(dst_wallet_address, cur)
     if trust_score is None:
         raise HTTPException(status_code=400, detail="Trust score not available")
     return {'status': 'SUCCESS', 'trust_score': trust_score}
@@ -135,9 +165,12 @@ def get_trust_score_api(
 
 @router.get("/get-outgoing-trustscores", tags=[query_tag])
 def get_trust_score_api(
-        src_wallet_address: str):
+        src_wallet_address: str,
+        response: Response):
     """Get a trust score. Default source_person_id is network trust manager"""
-    trust_score = get_outgoing_trust_scores(src_wallet_address)
+    with read_snapshot(row_factory=sqlite3.Row) as cur:
+        pin_block_height(response, cur)
+        trust_score = get_outgoing_trust_scores(src_wallet_address, cur)
     if trust_score is None:
         raise HTTPException(status_code=400, detail="Trust score not available")
     return {'status': 'SUCCESS', 'trust_score': trust_score}
@@ -432,16 +465,15 @@ def run_updater(add_to_chain_before_consensus: bool = False):
     # return log
 
 @router.get("/sc-state",tags=[query_tag])
-def get_sc_state(table_name, contract_address, unique_column, unique_value):
+def get_sc_state(table_name, contract_address, unique_column, unique_value, response: Response):
     try:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        repo = FetchRepository(cur)
+        with read_snapshot() as cur:
+            pin_block_height(response, cur)
+            repo = FetchRepository(cur)
 
-        data = repo.select_Query().add_table_name(table_name).where_clause(unique_column, unique_value, 1).and_clause(
-            "address", contract_address,1).execute_query_single_result({unique_column: unique_value, "address": contract_address})
+            data = repo.select_Query().add_table_name(table_name).where_clause(unique_column, unique_value, 1).and_clause(
+                "address", contract_address,1).execute_query_single_result({unique_column: unique_value, "address": contract_address})
 
-        con.close()
         resp = {"status": "SUCCESS", 'data': data}
         return resp
     except Exception as e:
@@ -450,15 +482,14 @@ def get_sc_state(table_name, contract_address, unique_column, unique_value):
 
 
 @router.get("/sc-states", tags=[query_tag])
-def get_sc_states(table_name, contract_address):
+def get_sc_states(table_name, contract_address, response: Response):
     try:
-        con = sqlite3.connect(NEWRL_DB)
-        cur = con.cursor()
-        repo = FetchRepository(cur)
+        with read_snapshot() as cur:
+            pin_block_height(response, cur)
+            repo = FetchRepository(cur)
 
-        data = repo.select_Query().add_table_name(table_name).where_clause("address", contract_address, 1).execute_query_multiple_result({"address": contract_address})
+            data = repo.select_Query().add_table_name(table_name).where_clause("address", contract_address, 1).execute_query_multiple_result({"address": contract_address})
 
-        con.close()
         resp = {"status": "SUCCESS", 'data': data}
         return resp
     except Exception as e:
@@ -467,9 +498,10 @@ def get_sc_states(table_name, contract_address):
 
 
 @router.get("/get-last-block-hash", tags=[query_tag])
-def get_last_block_hash_api():
+def get_last_block_hash_api(response: Response):
     """Get a block from the chain"""
-    block = get_last_block_hash()
+    with read_snapshot() as cur:
+        block = pin_block_height(response, cur)
     if block is None:
         raise HTTPException(status_code=400, detail="Block not found")
     return block
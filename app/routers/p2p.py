@@ -16,12 +16,14 @@ from app.codes.blockchain import get_blocks_in_range
 from app.codes.chainscanner import download_chain, download_state, get_transaction
 from app.codes.clock.global_time import get_time_stats
 from app.codes.dbmanager import get_or_create_db_snapshot
+from app.codes.p2p.compactblock import get_block_transactions
+from app.codes.p2p.packager import WIRE_CONTENT_TYPE, decode_wire_payload
 from app.codes.p2p.peers import add_peer, clear_peers, get_peers, update_software
 from app.codes.p2p.sync_chain import find_forking_block_with_majority, get_block_hashes, get_blocks, get_last_block_index, get_majority_random_node, quick_sync, receive_block, receive_receipt, sync_chain_from_peers
-from app.codes.p2p.sync_mempool import get_mempool_transactions, list_mempool_transactions, sync_mempool_transactions
+from app.codes.p2p.sync_mempool import get_mempool_transactions, get_missing_transaction_codes, list_mempool_transactions, sync_mempool_transactions
 from app.codes.p2p.peers import call_api_on_peers
-from app.constants import NEWRL_DB
-from .request_models import BlockAdditionRequest, BlockRequest, ReceiptAdditionRequest, TransactionAdditionRequest, TransactionBatchPayload, TransactionsRequest
+from app.constants import MAX_TRANSACTION_ANNOUNCE_SIZE, NEWRL_DB
+from .request_models import BlockAdditionRequest, BlockRequest, BlockTransactionsRequest, ReceiptAdditionRequest, TransactionAdditionRequest, TransactionBatchPayload, TransactionsRequest
 from app.codes.auth.auth import get_node_wallet_address, get_node_wallet_public
 from app.codes.validator import validate as validate_transaction
 from app.codes.minermanager import get_miner_info
@@ -33,6 +35,17 @@ logger = logging.getLogger(__name__)
 
 p2p_tag = 'P2P'
 
+
+async def read_payload(request: Request):
+    """Reads a JSON or compact wire format request body"""
+    if request.headers.get('content-type') != WIRE_CONTENT_TYPE:
+        return await request.json()
+    try:
+        return decode_wire_payload(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+
 @router.get("/get-node-wallet-address", tags=[p2p_tag])
 def api_get_node_wallet_address():
     return {'wallet_address': get_node_wallet_address()}
@@ -46,6 +59,17 @@ def list_mempool_transactions_api():
 def get_mempool_transactions_api(req: TransactionsRequest):
     return get_mempool_transactions(req.transaction_codes)
 
+@router.post("/get-block-transactions", tags=[p2p_tag])
+def get_block_transactions_api(req: BlockTransactionsRequest):
+    """Transactions of a proposed or committed block for peers rebuilding a compact block"""
+    return get_block_transactions(req.block_index, req.block_hash, req.transaction_codes)
+
+@router.post("/announce-transactions", tags=[p2p_tag])
+@limiter.limit("10/second")
+def announce_transactions_api(request: Request, req: TransactionsRequest):
+    transaction_codes = req.transaction_codes[:MAX_TRANSACTION_ANNOUNCE_SIZE]
+    return {'missing': get_missing_transaction_codes(transaction_codes)}
+
 @router.post("/get-blocks", tags=[p2p_tag])
 def get_blocks_api(req: BlockRequest):
     return get_blocks(req.block_indexes)
@@ -74,7 +98,7 @@ async def receive_transaction_api(request: Request):
 @router.post("/receive-transactions", tags=[p2p_tag])
 @limiter.limit("100/minute")
 async def receive_transactions_api(request: Request):
-    request_body = await request.json()
+    request_body = await read_payload(request)
     return process_transaction_batch(request_body['transactions'],
         request_body['peers_already_broadcasted'])
 
@@ -87,7 +111,7 @@ async def receive_block_api(request: Request):
 @router.post("/receive-receipt", tags=[p2p_tag])
 @limiter.limit("100/minute")
 async def receive_receipt_api(request: Request):
-    request_body = await request.json()
+    request_body = await read_payload(request)
     print('reciept_request_body', request_body)
     receipt = request_body['receipt']
     if receive_receipt(receipt):
@@ -97,6 +97,12 @@ class TransactionsRequest(BaseModel):
     transaction_codes: List[str] = []
 
 
+class BlockTransactionsRequest(BaseModel):
+    block_index: int
+    block_hash: str
+    transaction_codes: List[str] = []
+
+
 class BlockRequest(BaseModel):
     block_indexes: List[str] = []
 
@@ -6,14 +6,18 @@ import uvicorn
 from fastapi import APIRouter
 from fastapi.exceptions import HTTPException
 from starlette.requests import Request
-from app.codes.crypto import calculate_hash
+from app.codes.crypto import calculate_hash, verifying_key_cache
 from app.codes.log_config import get_past_log_content, logGenerator
 from sse_starlette.sse import EventSourceResponse
 from fastapi.responses import PlainTextResponse
 
+from app.codes.blockcandidate import block_candidate
 from app.codes.chainscanner import download_chain, download_state, get_config
 from app.codes.clock.global_time import get_time_stats
 from app.codes.fs.mempool_manager import clear_mempool
+from app.codes.p2p.delivery_stats import delivery_stats
+from app.codes.receiptmanager import verified_receipts, wallet_public_keys
+from app.codes.statewriter import state_writer
 from app.codes.p2p.peers import add_peer, clear_peers, get_peers, init_bootstrap_nodes, remove_dead_peers, update_software
 from app.codes.p2p.sync_chain import get_blocks, get_last_block_index, quick_sync, sync_chain_from_node, sync_chain_from_peers
 from app.codes.p2p.sync_mempool import list_mempool_transactions, sync_mempool_transactions
@@ -25,7 +29,7 @@ from app.migrations.init_db import clear_state_and_make_from_archive, revert_cha
 from app.codes.p2p.peers import call_api_on_peers
 from app.codes.auth.auth import get_node_wallet_public
 from app.codes.minermanager import add_miners_as_peers, broadcast_miner_update, get_miner_info
-from app.codes.dbmanager import snapshot_schedule, get_snapshot_last_block_index
+from app.codes.dbmanager import snapshot_schedule, get_snapshot_last_block_index, get_snapshot_progress
 
 
 logging.basicConfig(level=logging.INFO)
@@ -52,16 +56,33 @@ async def get_node_info():
         'timers': get_timers(),
         'snapshot': {
             'snapshot_schedule': snapshot_schedule,
-            'snapshot_last_block': get_snapshot_last_block_index()
+            'snapshot_last_block': get_snapshot_last_block_index(),
+            'snapshot_progress': get_snapshot_progress(),
         },
         'miners': get_miner_info(),
         'peers': get_peers(),
         # 'recent_blocks': get_blocks(list(range(last_block_index - 5, last_block_index))),
         'mempool_transactions': list_mempool_transactions()[-10:],
+        'verifying_key_cache': verifying_key_cache.get_stats(),
+        'verified_receipts': verified_receipts.get_stats(),
+        'wallet_public_keys': wallet_public_keys.get_stats(),
+        'state_writer': state_writer.get_stats(),
     }
     return node_info
 
 
+@router.get("/get-peer-delivery-stats", tags=[p2p_tag])
+def get_peer_delivery_stats_api():
+    """Latency, status and bytes of requests sent to each peer, slowest first"""
+    return delivery_stats.get_stats()
+
+
+@router.get("/get-block-template", tags=[p2p_tag])
+def get_block_template_api():
+    """Transactions picked for the next block proposal and why others were skipped"""
+    return block_candidate.to_dict()
+
+
 @router.get("/download-chain", tags=[p2p_tag])
 def download_chain_api():
     return download_chain()
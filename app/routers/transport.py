@@ -1,8 +1,11 @@
 from fastapi import APIRouter
+from fastapi.exceptions import HTTPException
 from starlette.requests import Request
+from app.codes.p2p.compactblock import receive_compact_block
 from app.codes.p2p.packager import decompress_block_payload
 from app.codes.p2p.transport import receive
 from app.codes.p2p.sync_chain import receive_block
+from app.constants import NEWRL_PORT
 from app.limiter import limiter
 
 router = APIRouter()
@@ -18,5 +21,20 @@ def recieve_api(payload: dict):
 @limiter.limit("100/minute")
 async def receive_block_binary_api(request: Request):
     body = request.body()
-    block = decompress_block_payload(await body)
+    try:
+        block = decompress_block_payload(await body)
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
     return receive_block(block)
+
+
+@router.post("/receive-compact-block", tags=[transport_tag], include_in_schema=False)
+@limiter.limit("100/minute")
+async def receive_compact_block_api(request: Request):
+    body = request.body()
+    try:
+        compact_block = decompress_block_payload(await body)
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    sender_url = 'http://' + request.client.host + ':' + str(NEWRL_PORT)
+    return receive_compact_block(compact_block, sender_url)
@@ -0,0 +1,16 @@
+import logging
+
+from app.codes.aggregator import get_signature_tasks
+
+
+def test_signature_tasks_skip_and_log_malformed_transactions(caplog):
+    transactions = [
+        {'signatures': []},
+        {'transaction': {'trans_code': 'aggregatornosignatures'}},
+        {'transaction': {'trans_code': 'aggregatorbadsignature'}, 'signatures': [{'msgsign': ''}]},
+        'not a transaction',
+    ]
+    with caplog.at_level(logging.WARNING, logger='app.codes.aggregator'):
+        assert get_signature_tasks(transactions) == []
+    assert 'aggregatornosignatures' in caplog.text
+    assert 'aggregatorbadsignature' in caplog.text
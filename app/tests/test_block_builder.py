@@ -0,0 +1,118 @@
+from ..codes.blockbuilder import SKIP_REASON_BLOCK_BYTES, SKIP_REASON_BLOCK_COST, SKIP_REASON_CONFLICT, SKIP_REASON_INSUFFICIENT_BALANCE, build_block_template, fit_receipts_in_block, get_payload_size
+from ..ntypes import NEWRL_TOKEN_CODE, TRANSACTION_ONE_WAY_TRANSFER, TRANSACTION_WALLET_CREATION
+
+
+def make_transfer(trans_code, timestamp, sender, fee=1000000, amount=0):
+    return {
+        'transaction': {
+            'timestamp': timestamp,
+            'trans_code': trans_code,
+            'type': TRANSACTION_ONE_WAY_TRANSFER,
+            'currency': NEWRL_TOKEN_CODE,
+            'fee': fee,
+            'descr': '',
+            'valid': 1,
+            'specific_data': {
+                'wallet1': sender,
+                'wallet2': '0xreceiver',
+                'asset1_code': NEWRL_TOKEN_CODE,
+                'asset2_code': '',
+                'asset1_number': amount,
+                'asset2_number': 0,
+            }
+        },
+        'signatures': [{'wallet_address': sender, 'msgsign': ''}]
+    }
+
+
+def get_codes(template):
+    return [t['transaction']['trans_code'] for t in template.transactions]
+
+
+def test_orders_by_fee_rate_keeping_sender_order():
+    transactions = [
+        make_transfer('a1', 10, '0xa', fee=1000000),
+        make_transfer('a2', 20, '0xa', fee=9000000),
+        make_transfer('b1', 15, '0xb', fee=5000000),
+        make_transfer('c1', 5, '0xc', fee=2000000),
+    ]
+    template = build_block_template(transactions)
+    assert get_codes(template) == ['b1', 'c1', 'a1', 'a2']
+    assert template.skipped == {}
+
+
+def test_skips_when_block_bytes_are_used():
+    transactions = [make_transfer(f'a{i}', i, f'0x{i}', fee=1000000 + i) for i in range(5)]
+    size = get_payload_size(transactions[0])
+    template = build_block_template(transactions, max_bytes=size * 3 + 1)
+    assert get_codes(template) == ['a4', 'a3', 'a2']
+    assert template.skipped == {'a1': SKIP_REASON_BLOCK_BYTES, 'a0': SKIP_REASON_BLOCK_BYTES}
+    assert template.payload_bytes == size * 3
+
+
+def test_cheap_transactions_fill_remaining_cost():
+    contract_call = make_transfer('sc1', 10, '0xa', fee=9000000)
+    contract_call['transaction']['type'] = 3
+    contract_call['transaction']['specific_data'] = {'signers': ['0xa'], 'params': {}}
+    transactions = [contract_call, make_transfer('b1', 10, '0xb'), make_transfer('c1', 10, '0xc')]
+    template = build_block_template(transactions, max_cost=21)
+    assert get_codes(template) == ['sc1', 'b1']
+    assert template.skipped == {'c1': SKIP_REASON_BLOCK_COST}
+
+    template = build_block_template(transactions, max_cost=10)
+    assert sorted(get_codes(template)) == ['b1', 'c1']
+    assert template.skipped == {'sc1': SKIP_REASON_BLOCK_COST}
+
+
+def test_receipts_fill_remaining_bytes():
+    receipts = [{'data': {'block_index': i}} for i in range(3)]
+    size = get_payload_size(receipts[0])
+    assert fit_receipts_in_block(receipts, size * 2) == receipts[:2]
+
+
+def test_skips_spend_beyond_balance():
+    transactions = [
+        make_transfer('a1', 10, '0xa', amount=3000000),
+        make_transfer('a2', 20, '0xa', amount=3000000),
+    ]
+    template = build_block_template(
+        transactions,
+        get_balances=lambda keys: {key: 7000000 for key in keys})
+    assert get_codes(template) == ['a1']
+    assert template.skipped == {'a2': SKIP_REASON_INSUFFICIENT_BALANCE}
+
+
+def test_skips_conflicting_wallet_creation():
+    def make_wallet_creation(trans_code, custodian):
+        return {
+            'transaction': {
+                'timestamp': 10,
+                'trans_code': trans_code,
+                'type': TRANSACTION_WALLET_CREATION,
+                'currency': NEWRL_TOKEN_CODE,
+                'fee': 1000000,
+                'descr': '',
+                'valid': 1,
+                'specific_data': {
+                    'custodian_wallet': custodian,
+                    'wallet_address': '0xnew',
+                }
+            },
+            'signatures': [{'wallet_address': custodian, 'msgsign': ''}]
+        }
+
+    template = build_block_template([
+        make_wallet_creation('w1', '0xa'),
+        make_wallet_creation('w2', '0xb'),
+    ])
+    assert len(template.transactions) == 1
+    assert list(template.skipped.values()) == [SKIP_REASON_CONFLICT]
+
+
+def test_check_transaction_reason_is_recorded():
+    transactions = [make_transfer('a1', 10, '0xa'), make_transfer('b1', 10, '0xb')]
+    template = build_block_template(
+        transactions,
+        check_transaction=lambda t: 'Rejected' if t['transaction']['trans_code'] == 'a1' else None)
+    assert get_codes(template) == ['b1']
+    assert template.to_dict()['skipped'] == {'a1': 'Rejected'}
@@ -0,0 +1,113 @@
+import sqlite3
+
+from ..codes.blockcandidate import BlockCandidate
+from ..codes.fs.mempool_manager import mempool
+from ..codes.state_updater import dry_run_transactions
+from ..constants import NEWRL_DB
+from ..ntypes import NEWRL_TOKEN_CODE, TRANSACTION_ONE_WAY_TRANSFER, TRANSACTION_SC_UPDATE
+
+
+def make_transaction(trans_code, transaction_type, specific_data, wallet):
+    return {
+        'transaction': {
+            'timestamp': 10,
+            'trans_code': trans_code,
+            'type': transaction_type,
+            'currency': NEWRL_TOKEN_CODE,
+            'fee': 1000000,
+            'descr': '',
+            'valid': 1,
+            'specific_data': specific_data
+        },
+        'signatures': [{'wallet_address': wallet, 'msgsign': ''}]
+    }
+
+
+def test_candidate_excludes_unpayable_and_keeps_valid():
+    valid = make_transaction('candidatevalid', TRANSACTION_SC_UPDATE, {'operation': 'none'}, '0xcandidate1')
+    invalid = make_transaction('candidateinvalid', TRANSACTION_ONE_WAY_TRANSFER, {
+        'wallet1': '0xcandidatenowallet',
+        'wallet2': '0xcandidatenowallet2',
+        'asset1_code': NEWRL_TOKEN_CODE,
+        'asset2_code': '',
+        'asset1_number': 1,
+        'asset2_number': 0,
+    }, '0xcandidatenowallet')
+    mempool.add(valid)
+    mempool.add(invalid)
+
+    candidate = BlockCandidate()
+    try:
+        transactions, template = candidate.snapshot()
+        codes = [t['transaction']['trans_code'] for t in transactions]
+        assert 'candidatevalid' in codes
+        assert 'candidateinvalid' not in codes
+        assert template.skipped['candidateinvalid'] == 'Balance does not cover its fee and transfers'
+        # A later block may fund the wallet, so it stays in the mempool
+        assert mempool.exists('candidateinvalid')
+        assert not candidate.dirty
+
+        # A snapshot is not shared with the mempool copy
+        transactions[0]['transaction']['fee'] = 0
+        assert mempool.get(transactions[0]['transaction']['trans_code'])['transaction']['fee'] != 0
+    finally:
+        mempool.remove('candidatevalid')
+        mempool.remove('candidateinvalid')
+
+
+def test_candidate_drops_transactions_removed_from_mempool():
+    transaction = make_transaction('candidateremoved', TRANSACTION_SC_UPDATE, {'operation': 'none'}, '0xcandidate2')
+    mempool.add(transaction)
+    candidate = BlockCandidate()
+    candidate.on_transaction_admitted(transaction)
+    transactions, _ = candidate.snapshot()
+    assert 'candidateremoved' in [t['transaction']['trans_code'] for t in transactions]
+
+    mempool.remove('candidateremoved')
+    candidate.on_block_added({'index': 0, 'text': {'transactions': [transaction]}})
+    transactions, _ = candidate.snapshot()
+    assert 'candidateremoved' not in [t['transaction']['trans_code'] for t in transactions]
+
+
+def test_candidate_rebuilt_when_chain_tip_moved():
+    candidate = BlockCandidate()
+    _, template = candidate.snapshot()
+    assert candidate.snapshot()[1] is template
+
+    # As if a block committed after the template was built
+    candidate.template_block_index -= 1
+    _, rebuilt = candidate.snapshot()
+    assert rebuilt is not template
+    assert candidate.snapshot()[1] is rebuilt
+
+
+def test_dry_run_reports_failures_and_rolls_back():
+    applied = make_transaction('dryrunapplied', TRANSACTION_SC_UPDATE, {'operation': 'none'}, '0xdryrun')
+    failing = make_transaction('dryrunfailing', TRANSACTION_SC_UPDATE, {
+        'operation': 'save', 'table_name': 'no_such_table', 'data': {'a': 1}}, '0xdryrun')
+
+    con = sqlite3.connect(NEWRL_DB)
+    cur = con.cursor()
+    failed, costs = dry_run_transactions(cur, [applied, failing], 1)
+    assert failed == ['dryrunfailing']
+    assert set(costs.keys()) == {'dryrunapplied', 'dryrunfailing'}
+    assert not con.in_transaction
+    row = cur.execute(
+        'SELECT transaction_code FROM transactions WHERE transaction_code = ?', ('dryrunapplied', )).fetchone()
+    assert row is None
+    con.close()
+
+
+def test_candidate_excludes_dry_run_failures_without_evicting():
+    failing = make_transaction('candidatedryrunfailing', TRANSACTION_SC_UPDATE, {
+        'operation': 'save', 'table_name': 'no_such_table', 'data': {'a': 1}}, '0xcandidate3')
+    mempool.add(failing)
+    candidate = BlockCandidate()
+    try:
+        transactions, template = candidate.snapshot()
+        assert 'candidatedryrunfailing' not in [t['transaction']['trans_code'] for t in transactions]
+        assert template.skipped['candidatedryrunfailing'] == 'Failed to apply in dry run'
+        # Later state may let it apply, so it stays for the next candidate
+        assert mempool.exists('candidatedryrunfailing')
+    finally:
+        mempool.remove('candidatedryrunfailing')
@@ -11,7 +11,7 @@ from fastapi.testclient import TestClient
 
 from ..codes.fs.temp_manager import get_blocks_for_index_from_storage
 from ..ntypes import NUSD_TOKEN_CODE
-from ..constants import NEWRL_DB
+from ..constants import BLOCK_HEIGHT_HEADER, NEWRL_DB
 from ..nvalues import TREASURY_WALLET_ADDRESS
 from ..migrations.init import init_newrl
 
@@ -31,3 +31,18 @@ def test_block_exists():
     assert block_exists(previous_block_index - 1) == True
     assert block_exists(previous_block_index + 1) == False
 
+
+def test_query_responses_carry_block_height():
+    last_block_index = int(client.get('/get-last-block-index').text)
+
+    response = client.get('/get-last-block-hash')
+    assert response.status_code == 200
+    assert response.headers[BLOCK_HEIGHT_HEADER] == str(last_block_index)
+    assert response.json()['index'] == last_block_index
+
+    con = sqlite3.connect(NEWRL_DB)
+    wallet_address = con.execute('SELECT wallet_address FROM wallets LIMIT 1').fetchone()[0]
+    con.close()
+    response = client.get('/get-wallet', params={'wallet_address': wallet_address})
+    assert response.status_code == 200
+    assert response.headers[BLOCK_HEIGHT_HEADER] == str(last_block_index)
@@ -1,3 +1,4 @@
+import sqlite3
 import time
 from app.codes.blockchain import get_last_block
 from app.codes.chainscanner import get_transaction
@@ -10,7 +11,8 @@ from .test_miner_committee import _add_test_miner
 from ..codes.updater import mine, run_updater, start_mining_clock
 from ..codes.minermanager import broadcast_miner_update
 from fastapi.testclient import TestClient
-from ..constants import BLOCK_TIME_INTERVAL_SECONDS
+from ..codes.db_updater import get_included_transaction_codes, get_wallet_token_balances
+from ..constants import BLOCK_TIME_INTERVAL_SECONDS, NEWRL_DB
 
 from ..main import app
 from app.codes import updater
@@ -25,4 +27,23 @@ def test_mine():
     block = mine(add_to_chain=True)
     transaction_in_db = get_transaction(transaction['transaction']['trans_code'])
     assert transaction_in_db is not None
-    
\ No newline at end of file
+    
+
+def test_batched_inclusion_and_balance_lookups():
+    con = sqlite3.connect(NEWRL_DB)
+    cur = con.cursor()
+    codes = [f'batchedcode{i}' for i in range(1200)]
+    cur.executemany(
+        'INSERT OR IGNORE INTO transactions (transaction_code, block_index) VALUES (?, ?)',
+        [(code, 1) for code in codes[::2]])
+    cur.execute(
+        'INSERT OR REPLACE INTO balances (wallet_address, tokencode, balance) VALUES (?, ?, ?)',
+        ('0xbatchedwallet', 'NWRL', 42))
+
+    included = get_included_transaction_codes(cur, codes)
+    assert included == set(codes[::2])
+
+    balances = get_wallet_token_balances(cur, {('0xbatchedwallet', 'NWRL'), ('0xbatchedwallet', 'NUSD')})
+    assert balances == {('0xbatchedwallet', 'NWRL'): 42, ('0xbatchedwallet', 'NUSD'): 0}
+    con.rollback()
+    con.close()
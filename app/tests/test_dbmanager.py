@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from app.codes import dbmanager
+from app.codes.storage import close_connections, write_transaction
+
+
+def create_db(db_path, block_count=2000):
+    with write_transaction(db_path) as cur:
+        cur.execute('CREATE TABLE blocks (block_index integer PRIMARY KEY, hash text)')
+        cur.executemany('INSERT INTO blocks VALUES (?, ?)', [
+            (i, os.urandom(256).hex()) for i in range(1, block_count + 1)])
+
+
+def commit_block(db_path):
+    with write_transaction(db_path) as cur:
+        cur.execute('INSERT INTO blocks (hash) VALUES (?)', ('', ))
+
+
+def get_block_count(db_path):
+    con = sqlite3.connect(db_path)
+    assert con.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    count = con.execute('SELECT count(*) FROM blocks').fetchone()[0]
+    con.close()
+    return count
+
+
+def wait_for_snapshot_pages():
+    for _ in range(500):
+        if dbmanager.snapshot_progress['in_progress'] and dbmanager.snapshot_progress['pages_copied'] > 0:
+            return
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    db_path = f'{tmp_path}/newrl.db'
+    monkeypatch.setattr(dbmanager, 'NEWRL_DB', db_path)
+    monkeypatch.setattr(dbmanager, 'SNAPSHOT_BACKUP_PAGES', 10)
+    create_db(db_path)
+    yield db_path
+    close_connections(db_path)
+
+
+def test_snapshot_is_pinned_while_blocks_commit(db_path):
+    done = threading.Event()
+    commits_during_snapshot = []
+
+    def commit_blocks():
+        while not done.is_set():
+            commit_block(db_path)
+            if dbmanager.snapshot_progress['in_progress']:
+                commits_during_snapshot.append(1)
+
+    writer_thread = threading.Thread(target=commit_blocks)
+    writer_thread.start()
+    try:
+        snapshot_file = dbmanager.create_db_snapshot()
+    finally:
+        done.set()
+        writer_thread.join(10)
+
+    progress = dbmanager.get_snapshot_progress()
+    assert snapshot_file == db_path + '.snapshot'
+    assert not os.path.exists(db_path + '.partial.snapshot')
+    assert len(commits_during_snapshot) > 0
+    assert get_block_count(snapshot_file) == progress['last_block_index']
+    assert progress['percent'] == 100
+    assert progress['pages_copied'] == progress['total_pages'] > dbmanager.SNAPSHOT_BACKUP_PAGES
+    assert not progress['in_progress']
+
+
+def test_snapshot_cancelled_when_db_replaced(db_path):
+    dbmanager.create_db_snapshot()
+    commit_block(db_path)
+    errors = []
+
+    def create_snapshot():
+        try:
+            dbmanager.create_db_snapshot()
+        except dbmanager.SnapshotCancelled as e:
+            errors.append(e)
+
+    snapshot_thread = threading.Thread(target=create_snapshot)
+    snapshot_thread.start()
+    wait_for_snapshot_pages()
+    with dbmanager.snapshots_paused():
+        assert not dbmanager.snapshot_progress['in_progress']
+    snapshot_thread.join(10)
+
+    assert len(errors) == 1
+    assert not os.path.exists(db_path + '.partial.snapshot')
+    # The last complete snapshot is kept
+    assert get_block_count(db_path + '.snapshot') == 2000
@@ -0,0 +1,32 @@
+from app.codes.indexadvisor import HOT_QUERIES, QueryRecorder, advise, find_scans, get_query_plan
+from app.codes.storage import close_connections, get_cursor, write_transaction
+
+
+def test_hot_queries_use_indexes():
+    cur = get_cursor()
+    for name, (query, params) in HOT_QUERIES.items():
+        plan = get_query_plan(cur, query, params)
+        assert find_scans(plan) == [], f'{name} scans: {plan}'
+
+
+def test_recorder_flags_scans(tmp_path):
+    db_path = f'{tmp_path}/test.db'
+    with write_transaction(db_path) as cur:
+        cur.execute('CREATE TABLE items (id integer PRIMARY KEY, owner text)')
+
+    with QueryRecorder() as recorder:
+        for owner in ('a', 'b'):
+            get_cursor(db_path).execute('SELECT * FROM items WHERE owner=?', (owner, )).fetchall()
+        get_cursor(db_path).execute('SELECT * FROM items WHERE id=?', (1, )).fetchall()
+    get_cursor(db_path).execute('SELECT * FROM items WHERE owner=?', ('c', )).fetchall()
+    assert recorder.queries['SELECT * FROM items WHERE owner=?']['count'] == 2
+
+    report = {entry['query']: entry for entry in advise(recorder.queries, db_path)}
+    assert report['SELECT * FROM items WHERE owner=?']['scans'] == ['SCAN items']
+    assert report['SELECT * FROM items WHERE id=?']['scans'] == []
+
+    with write_transaction(db_path) as cur:
+        cur.execute('CREATE INDEX idx_items_owner ON items (owner)')
+    report = advise(recorder.queries, db_path)
+    assert all(entry['scans'] == [] for entry in report)
+    close_connections(db_path)
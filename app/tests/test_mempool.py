@@ -1,10 +1,13 @@
+import json
+import os
 import time
 import sqlite3
 
 from ..codes import updater
 from ..codes.auth.auth import get_wallet
-from ..codes.fs.mempool_manager import get_mempool_transaction, remove_transaction_from_mempool
+from ..codes.fs.mempool_manager import Mempool, get_mempool_transaction, remove_transaction_from_mempool
 from ..codes.db_updater import update_wallet_token_balance
+from ..codes.pendingdebits import PendingDebitLedger
 from fastapi.testclient import TestClient
 
 from ..codes.fs.temp_manager import get_blocks_for_index_from_storage
@@ -104,4 +107,186 @@ def test_transaction_remove():
     remove_transaction_from_mempool(transaction['transaction']['trans_code'])
     mempool_transaction = get_mempool_transaction(transaction['transaction']['trans_code'])
     assert mempool_transaction is None
-    
\ No newline at end of file
+    
+
+def make_mempool_transaction(trans_code, timestamp, wallet, transaction_type=5):
+    return {
+        'transaction': {
+            'timestamp': timestamp,
+            'trans_code': trans_code,
+            'type': transaction_type,
+            'currency': 'NWRL',
+            'fee': 1000000,
+            'descr': '',
+            'valid': 1,
+            'specific_data': {}
+        },
+        'signatures': [{'wallet_address': wallet, 'msgsign': ''}]
+    }
+
+
+def test_mempool_indexes(tmp_path):
+    mempool = Mempool(f'{tmp_path}/')
+    assert mempool.add(make_mempool_transaction('c', 30, '0xa'))
+    assert mempool.add(make_mempool_transaction('a', 10, '0xa', transaction_type=1))
+    assert mempool.add(make_mempool_transaction('b', 20, '0xb'))
+    assert not mempool.add(make_mempool_transaction('b', 20, '0xb'))
+
+    assert len(mempool) == 3
+    assert mempool.exists('a')
+    assert mempool.get('b')['transaction']['timestamp'] == 20
+    assert mempool.get_transaction_codes() == ['a', 'b', 'c']
+    assert sorted(t['transaction']['trans_code'] for t in mempool.get_transactions_for_wallet('0xa')) == ['a', 'c']
+    assert [t['transaction']['trans_code'] for t in mempool.get_transactions_for_type(1)] == ['a']
+
+    assert mempool.remove('a')
+    assert not mempool.remove('a')
+    assert not mempool.exists('a')
+    assert mempool.get_transaction_codes() == ['b', 'c']
+    assert 1 not in mempool.by_type
+    assert mempool.timestamps == [20, 30]
+
+    # Transactions with the same timestamp keep their arrival order
+    assert mempool.add(make_mempool_transaction('e', 20, '0xb'))
+    assert mempool.add(make_mempool_transaction('d', 20, '0xb'))
+    assert mempool.get_transaction_codes() == ['b', 'e', 'd', 'c']
+    assert mempool.remove('b') and mempool.remove('e') and mempool.remove('d')
+    assert mempool.timestamps == [30]
+    assert [t['transaction']['trans_code'] for t in mempool.get_transactions()] == ['c']
+    assert [t['transaction']['trans_code'] for t in mempool.get_transactions_for_wallet('0xa')] == ['c']
+
+
+def test_mempool_reload(tmp_path):
+    mempool = Mempool(f'{tmp_path}/')
+    mempool.add(make_mempool_transaction('a', 10, '0xa'))
+    mempool.add(make_mempool_transaction('b', 20, '0xb'))
+    mempool.remove('a')
+
+    reloaded = Mempool(f'{tmp_path}/')
+    assert reloaded.get_transaction_codes() == ['b']
+
+
+def test_mempool_journal_compaction(tmp_path):
+    mempool = Mempool(f'{tmp_path}/')
+    for i in range(10):
+        mempool.add(make_mempool_transaction(f'code{i}', i, '0xa'))
+    for i in range(8):
+        mempool.remove(f'code{i}')
+    assert mempool.journal.needs_compaction(10)
+
+    mempool.compact()
+    mempool.flush()
+    with open(mempool.journal.path) as journal_file:
+        assert len(journal_file.readlines()) == 2
+    assert not mempool.journal.needs_compaction(1)
+
+    mempool.add(make_mempool_transaction('new', 20, '0xb'))
+    reloaded = Mempool(f'{tmp_path}/')
+    assert reloaded.get_transaction_codes() == ['code8', 'code9', 'new']
+
+
+def test_mempool_journal_cuts_torn_record(tmp_path):
+    mempool = Mempool(f'{tmp_path}/')
+    mempool.add(make_mempool_transaction('a', 10, '0xa'))
+    mempool.flush()
+    with open(mempool.journal.path, 'a') as journal_file:
+        journal_file.write('{"op": "a", "transac')
+
+    restarted = Mempool(f'{tmp_path}/')
+    restarted.add(make_mempool_transaction('b', 20, '0xb'))
+    restarted.flush()
+    assert Mempool(f'{tmp_path}/').get_transaction_codes() == ['a', 'b']
+
+
+def test_mempool_clear_cancels_compaction(tmp_path):
+    mempool = Mempool(f'{tmp_path}/')
+    for i in range(4):
+        mempool.add(make_mempool_transaction(f'code{i}', i, '0xa'))
+    mempool.journal.start_compaction()
+    mempool.journal.write_compacted(mempool.get_transactions())
+    mempool.remove('code0')
+    mempool.clear()
+    assert not mempool.journal.finish_compaction(0)
+    assert Mempool(f'{tmp_path}/').get_transaction_codes() == []
+
+    for i in range(4):
+        mempool.add(make_mempool_transaction(f'code{i}', i, '0xa'))
+    mempool.journal.start_compaction()
+    mempool.journal.write_compacted(mempool.get_transactions())
+    mempool.remove('code0')
+    assert mempool.journal.finish_compaction(len(mempool))
+    # The carried over removal and the add it cancels
+    assert mempool.journal.dead_records == 2
+
+
+def test_mempool_imports_transaction_files(tmp_path):
+    transaction = make_mempool_transaction('legacy', 10, '0xa')
+    with open(f'{tmp_path}/transaction-5-legacy.json', 'w') as transaction_file:
+        json.dump(transaction, transaction_file)
+
+    mempool = Mempool(f'{tmp_path}/')
+    assert mempool.exists('legacy')
+    assert not os.path.exists(f'{tmp_path}/transaction-5-legacy.json')
+    assert Mempool(f'{tmp_path}/').exists('legacy')
+
+
+def test_mempool_remove_expired(tmp_path):
+    mempool = Mempool(f'{tmp_path}/')
+    for i in range(5):
+        mempool.add(make_mempool_transaction(f'code{i}', i * 10, '0xa'))
+    mempool.remove('code1')
+
+    assert mempool.remove_expired(25) == ['code0', 'code2']
+    assert mempool.get_transaction_codes() == ['code3', 'code4']
+    assert mempool.remove_expired(25) == []
+    assert len(mempool.expiry_heap) == 2
+
+    mempool.add(make_mempool_transaction('late', 5, '0xb'))
+    assert mempool.remove_expired(100) == ['late', 'code3', 'code4']
+    assert len(mempool) == 0
+
+
+def test_mempool_expiry_heap_drops_removed_entries(tmp_path):
+    mempool = Mempool(f'{tmp_path}/')
+    for i in range(100):
+        mempool.add(make_mempool_transaction(f'code{i}', 1000 + i, '0xa'))
+    for i in range(90):
+        mempool.remove(f'code{i}')
+    assert len(mempool.expiry_heap) <= 2 * len(mempool)
+    assert mempool.remove_expired(1095) == [f'code{i}' for i in range(90, 95)]
+    assert mempool.get_transaction_codes() == [f'code{i}' for i in range(95, 100)]
+
+
+def test_pending_debit_ledger(tmp_path):
+    def make_transfer(trans_code, amount):
+        transaction = make_mempool_transaction(trans_code, 10, '0xa')
+        transaction['transaction']['specific_data'] = {
+            'wallet1': '0xa',
+            'wallet2': '0xb',
+            'asset1_code': 'NWRL',
+            'asset2_code': '',
+            'asset1_number': amount,
+            'asset2_number': 0,
+        }
+        return transaction
+
+    mempool = Mempool(f'{tmp_path}/')
+    mempool.add(make_transfer('first', 3000000))
+    ledger = PendingDebitLedger()
+    mempool.add_listener(ledger)
+    assert ledger.get_pending_debit('0xa', 'NWRL') == 4000000
+
+    mempool.add(make_transfer('second', 2000000))
+    assert ledger.get_pending_debit('0xa', 'NWRL') == 7000000
+    debits = {('0xa', 'NWRL'): 2000000}
+    assert ledger.get_overdrafts(debits, {('0xa', 'NWRL'): 9000000}) == []
+    assert ledger.get_overdrafts(debits, {('0xa', 'NWRL'): 8000000}) == [('0xa', 'NWRL')]
+
+    mempool.remove('first')
+    assert ledger.get_pending_debit('0xa', 'NWRL') == 3000000
+    mempool.remove('second')
+    assert ledger.debits == {}
+
+    mempool.add(make_transfer('third', 1))
+    mempool.clear()
+    assert ledger.get_pending_debit('0xa', 'NWRL') == 0
@@ -7,6 +7,10 @@ from ..codes import updater
 from ..codes.auth.auth import get_wallet
 from ..migrations.init import init_newrl
 from ..codes.minermanager import broadcast_miner_update
+from ..codes.fs.mempool_manager import mempool
+from ..codes.p2p.delivery_stats import PeerDeliveryStats
+from ..codes.p2p.packager import WIRE_FORMAT_MAGIC
+from ..codes.fs.temp_manager import remove_block_from_temp, store_block_to_temp
 
 from ..main import app
 
@@ -139,4 +143,81 @@ def test_block_reject():
     current_block_index = int(response.text)
     
     # Block index should not increase
-    assert current_block_index == previous_block_index
\ No newline at end of file
+    assert current_block_index == previous_block_index
+
+
+def test_announce_transactions_returns_missing_codes():
+    transaction = {
+        'transaction': {
+            'timestamp': 10,
+            'trans_code': 'announcedknown',
+            'type': 5,
+            'currency': 'NWRL',
+            'fee': 1000000,
+            'descr': '',
+            'valid': 1,
+            'specific_data': {}
+        },
+        'signatures': [{'wallet_address': '0xannounce', 'msgsign': ''}]
+    }
+    mempool.add(transaction)
+    try:
+        response = client.post('/announce-transactions', json={
+            'transaction_codes': ['announcedknown', 'announcedmissing']})
+        assert response.status_code == 200
+        assert response.json() == {'missing': ['announcedmissing']}
+    finally:
+        mempool.remove('announcedknown')
+
+
+def test_peer_delivery_stats():
+    stats = PeerDeliveryStats()
+    stats.record('http://10.0.0.1:8456/receive-block-binary', 200, 10, 100)
+    stats.record('http://10.0.0.1:8456/receive-receipt', 200, 20, 50)
+    stats.record('http://10.0.0.2:8456/receive-block-binary', None, 1000, 100)
+
+    peers = stats.get_stats()
+    assert list(peers.keys()) == ['10.0.0.2:8456', '10.0.0.1:8456']
+    assert peers['10.0.0.1:8456']['requests'] == 2
+    assert peers['10.0.0.1:8456']['failures'] == 0
+    assert peers['10.0.0.1:8456']['bytes_sent'] == 150
+    assert peers['10.0.0.1:8456']['last_latency_ms'] == 20
+    assert 10 < peers['10.0.0.1:8456']['average_latency_ms'] < 20
+    assert peers['10.0.0.2:8456']['failures'] == 1
+    assert peers['10.0.0.2:8456']['last_status'] is None
+
+
+def test_receive_block_binary_rejects_unknown_wire_version():
+    response = client.post('/receive-block-binary', data=WIRE_FORMAT_MAGIC + bytes([99]))
+    assert response.status_code == 415
+
+
+def test_get_block_transactions_from_block_proposal():
+    transaction = {
+        'transaction': {'trans_code': 'compact-block-test', 'type': 5},
+        'signatures': [],
+    }
+    block_payload = {
+        'index': 999999,
+        'hash': 'compact-block-test-hash',
+        'data': {'index': 999999, 'text': {'transactions': [transaction], 'previous_block_receipts': []}},
+        'receipts': [],
+    }
+    store_block_to_temp(block_payload)
+    try:
+        response = client.post('/get-block-transactions', json={
+            'block_index': 999999,
+            'block_hash': 'compact-block-test-hash',
+            'transaction_codes': ['compact-block-test', 'unknown'],
+        })
+        assert response.status_code == 200
+        assert response.json() == [transaction]
+
+        response = client.post('/get-block-transactions', json={
+            'block_index': 999999,
+            'block_hash': 'other-hash',
+            'transaction_codes': ['compact-block-test'],
+        })
+        assert response.json() == []
+    finally:
+        remove_block_from_temp(999999)
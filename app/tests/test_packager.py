@@ -1,6 +1,13 @@
+import base64
 import json
+import os
+
+import pytest
 import requests
-from app.codes.p2p.packager import compress_block_payload, decompress_block_payload
+from app.codes.crypto import calculate_hash
+from app.codes.p2p import packager
+from app.codes.p2p.packager import WIRE_FORMAT_MAGIC, build_compression_dictionary, compress_block_payload, compression_dictionaries, decode_wire_payload, decompress_block_payload, encode_wire_payload, from_compact_block, to_compact_block
+from app.constants import COMPRESSION_DICTIONARY_VERSION
 
 
 def test_pack_unpack_block():
@@ -1297,3 +1304,183 @@ def test_pack_unpack_block():
     compression_ratio = len(compressed_block) / len(original_block_string)
     print('Compression ration: ', compression_ratio)
     assert original_block == json.loads(json.dumps(decompressed_block))
+
+
+def _random_hex(length):
+    return os.urandom(length).hex()
+
+
+def _random_base64():
+    return base64.b64encode(os.urandom(64)).decode()
+
+
+def _get_block_payload(transaction_count=20):
+    transactions = []
+    for i in range(transaction_count):
+        wallet_address = '0x' + _random_hex(20)
+        transactions.append({
+            'transaction': {
+                'timestamp': 1661510640000 + i,
+                'trans_code': _random_hex(20),
+                'type': 5,
+                'currency': 'NWRL',
+                'fee': 0.0,
+                'descr': 'Transfer',
+                'valid': 1,
+                'specific_data': {'wallet1': wallet_address, 'asset1_code': 'NWRL', 'amount': i * 1000},
+            },
+            'signatures': [{'wallet_address': wallet_address, 'msgsign': _random_base64()}],
+        })
+    receipts = [{
+        'data': {
+            'block_index': 99,
+            'block_hash': _random_hex(32),
+            'vote': 1,
+            'timestamp': 1661510144000,
+            'wallet_address': '0x' + _random_hex(20),
+        },
+        'public_key': _random_base64(),
+        'signature': _random_base64(),
+    } for _ in range(10)]
+    block = {
+        'index': 100,
+        'timestamp': 1661510690000,
+        'proof': 0,
+        'status': 1,
+        'text': {'transactions': transactions, 'previous_block_receipts': receipts},
+        'creator_wallet': '0x' + _random_hex(20),
+        'expected_miner': '0x' + _random_hex(20),
+        'committee': ['0x' + _random_hex(20) for _ in range(10)],
+        'previous_hash': _random_hex(32),
+    }
+    return {
+        'index': 100,
+        'hash': calculate_hash(block),
+        'data': block,
+        'receipts': receipts[:1],
+        'software_version': '1.1.1',
+        'peers_already_broadcasted': ['10.0.0.1'],
+    }
+
+
+def test_wire_format_round_trip():
+    block_payload = _get_block_payload()
+    wire_payload = encode_wire_payload(block_payload)
+    assert wire_payload.startswith(WIRE_FORMAT_MAGIC)
+    assert len(wire_payload) < len(compress_block_payload(block_payload))
+
+    decoded = decode_wire_payload(wire_payload)
+    assert json.dumps(decoded) == json.dumps(block_payload)
+    assert calculate_hash(decoded['data']) == block_payload['hash']
+
+
+def test_wire_format_round_trips_values_it_cannot_pack():
+    payload = {
+        'uppercase_hex': 'ABCDEF0123456789ABCDEF0123456789',
+        'odd_hex': 'abcdef0123456789a',
+        'short_hex': 'abcd',
+        'non_canonical_base64': 'AAAAAAAAAAAAAAB=',
+        'unicode': 'नमस्ते ✓',
+        'empty': '',
+        'integers': [0, -1, 1, -2 ** 70, 2 ** 70],
+        'floats': [0.1, -2.5, 1e300],
+        'flags': [True, False, None],
+        'nested': {'z': {}, 'a': []},
+        'shuffled_receipt': {'signature': 'x', 'public_key': 'y', 'data': {}},
+    }
+    assert json.dumps(decode_wire_payload(encode_wire_payload(payload))) == json.dumps(payload)
+
+
+def test_decompress_block_payload_accepts_both_formats():
+    block_payload = _get_block_payload(transaction_count=2)
+    for packed in [compress_block_payload(block_payload), encode_wire_payload(block_payload)]:
+        assert json.dumps(decompress_block_payload(packed)) == json.dumps(block_payload)
+
+
+def test_wire_format_rejects_unknown_version():
+    with pytest.raises(ValueError):
+        encode_wire_payload({}, version=99)
+    with pytest.raises(ValueError):
+        decode_wire_payload(WIRE_FORMAT_MAGIC + bytes([99]))
+
+
+def test_malformed_payloads_raise_value_error(monkeypatch):
+    block_payload = _get_block_payload(transaction_count=2)
+    wire_payload = encode_wire_payload(block_payload)
+    body = packager._decompress(wire_payload[5:], wire_payload[4])
+    malformed = [
+        WIRE_FORMAT_MAGIC,
+        wire_payload[:len(wire_payload) // 2],
+        wire_payload[:5] + b'not zlib',
+        WIRE_FORMAT_MAGIC + bytes([2, 0]) + packager._compress(body[:len(body) // 2], 0),
+        WIRE_FORMAT_MAGIC + bytes([2, 0]) + packager._compress(bytes([packager._SHAPE, 0x80]), 0),
+        compress_block_payload(block_payload)[:20],
+    ]
+    for data in malformed:
+        with pytest.raises(ValueError):
+            decompress_block_payload(data)
+
+    monkeypatch.setattr(packager, 'MAX_DECOMPRESSED_PAYLOAD_BYTES', 100)
+    for data in [wire_payload, compress_block_payload(block_payload)]:
+        with pytest.raises(ValueError):
+            decompress_block_payload(data)
+
+
+def test_wire_format_versions_and_dictionaries():
+    assert COMPRESSION_DICTIONARY_VERSION in compression_dictionaries
+    block_payload = _get_block_payload(transaction_count=2)
+    transaction = block_payload['data']['text']['transactions'][0]
+    for payload in [block_payload, transaction]:
+        packed = [
+            encode_wire_payload(payload, version=1),
+            encode_wire_payload(payload, dictionary_version=0),
+            encode_wire_payload(payload, dictionary_version=COMPRESSION_DICTIONARY_VERSION),
+        ]
+        for wire_payload in packed:
+            assert json.dumps(decode_wire_payload(wire_payload)) == json.dumps(payload)
+    # Dictionaries a node does not have are not sent
+    assert encode_wire_payload(transaction, dictionary_version=200) == encode_wire_payload(transaction, dictionary_version=0)
+    with pytest.raises(ValueError):
+        decode_wire_payload(WIRE_FORMAT_MAGIC + bytes([2, 200]))
+
+
+def test_build_compression_dictionary():
+    common_address = '0x' + _random_hex(20)
+    payloads = [{'receipt': {'data': {'wallet_address': common_address}, 'public_key': _random_base64()}} for _ in range(10)]
+    payloads.append({'receipt': {'data': {'wallet_address': '0x' + _random_hex(20)}, 'public_key': 'unique'}})
+    dictionary = build_compression_dictionary(payloads, size=512)
+    assert len(dictionary) <= 512
+    assert bytes.fromhex(common_address[2:]) in dictionary
+
+    compression_dictionaries[255] = dictionary
+    try:
+        payload = payloads[0]
+        with_dictionary = encode_wire_payload(payload, dictionary_version=255)
+        assert len(with_dictionary) < len(encode_wire_payload(payload, dictionary_version=0))
+        assert decode_wire_payload(with_dictionary) == payload
+    finally:
+        del compression_dictionaries[255]
+
+
+def test_compact_block_round_trip():
+    block_payload = _get_block_payload()
+    transactions = {
+        t['transaction']['trans_code']: json.loads(json.dumps(t))
+        for t in block_payload['data']['text']['transactions']
+    }
+    compact_block = to_compact_block(block_payload)
+    assert compact_block['data']['text']['transactions'] == list(transactions.keys())
+    assert len(block_payload['data']['text']['transactions']) == 20
+    assert len(encode_wire_payload(compact_block)) < len(encode_wire_payload(block_payload))
+
+    first_code = compact_block['data']['text']['transactions'][0]
+    partial = dict(transactions)
+    del partial[first_code]
+    block, missing = from_compact_block(compact_block, partial)
+    assert block is None
+    assert missing == [first_code]
+
+    block, missing = from_compact_block(compact_block, transactions)
+    assert missing == []
+    assert json.dumps(block) == json.dumps(block_payload)
+    assert calculate_hash(block['data']) == block_payload['hash']
@@ -6,9 +6,10 @@ from app.codes.blockchain import get_last_block_index
 from app.codes.consensus.consensus import generate_block_receipt
 from app.codes.fs.temp_manager import check_receipt_exists_in_temp, remove_receipt_from_temp, store_receipt_to_temp
 from app.codes.p2p.sync_chain import accept_block
-from app.codes.receiptmanager import check_receipt_exists_in_db, get_receipt_in_temp_not_in_chain, get_receipts_included_in_block_from_db, update_receipts_in_state
+from app.codes.receiptmanager import RECEIPT_CHECK_SIGNATURE, VerifiedReceiptCache, check_receipt_exists_in_db, compact_receipt, expand_receipt, get_receipt_data, pack_receipts_for_block, validate_receipt, wallet_public_keys, get_receipt_in_temp_not_in_chain, get_receipts_included_in_block_from_db, update_receipts_in_state, verified_receipts, verify_receipt_signature
 from app.codes.updater import run_updater
-from app.constants import NEWRL_DB
+from app.constants import COMPACT_RECEIPTS_BLOCK_INDEX, NEWRL_DB
+from app.codes.statereader import get_public_key_from_wallet_address
 
 from ..migrations.init import init_newrl
 
@@ -88,4 +89,71 @@ def _add_receipts_to_chain(receipts):
         }
     })
     con.commit()
-    con.close()
\ No newline at end of file
+    con.close()
+
+
+def test_receipt_signature_checked_once():
+    receipt = generate_block_receipt({'index': 1000000})
+    hits = verified_receipts.hits
+    assert verify_receipt_signature(receipt)
+    assert verify_receipt_signature(receipt)
+    assert verified_receipts.hits == hits + 1
+
+    tampered = {**receipt, 'data': {**receipt['data'], 'vote': 0}}
+    assert not verify_receipt_signature(tampered)
+
+    verified_receipts.clear_committed(1000000)
+    assert verified_receipts.get(receipt, RECEIPT_CHECK_SIGNATURE) is None
+
+
+def test_verified_receipt_cache_keeps_uncommitted_blocks():
+    cache = VerifiedReceiptCache()
+    receipts = [generate_block_receipt({'index': index}) for index in [5, 6, 7]]
+    for receipt in receipts:
+        cache.set(receipt, RECEIPT_CHECK_SIGNATURE, True)
+    cache.clear_committed(6)
+    assert cache.get(receipts[1], RECEIPT_CHECK_SIGNATURE) is None
+    assert cache.get(receipts[2], RECEIPT_CHECK_SIGNATURE)
+    assert cache.get_stats()['blocks'] == 1
+
+
+def test_compact_receipts():
+    receipt = generate_block_receipt({'index': 100})
+    compact = compact_receipt(receipt)
+    assert len(compact) == 6
+    assert receipt['public_key'] not in compact
+    assert compact_receipt(compact) == compact
+    assert get_receipt_data(compact) == receipt['data']
+    assert expand_receipt(receipt) is receipt
+
+    expanded = expand_receipt(compact)
+    assert expanded['data'] == receipt['data']
+    assert expanded['signature'] == receipt['signature']
+    public_key_in_db = get_public_key_from_wallet_address(receipt['data']['wallet_address'])
+    assert expanded['public_key'] == public_key_in_db
+    assert validate_receipt(compact) == validate_receipt(receipt)
+    if public_key_in_db is not None:
+        assert expanded == receipt
+        assert wallet_public_keys.get(receipt['data']['wallet_address']) == public_key_in_db
+
+    assert pack_receipts_for_block([receipt], COMPACT_RECEIPTS_BLOCK_INDEX) == [compact]
+    if COMPACT_RECEIPTS_BLOCK_INDEX > 0:
+        assert pack_receipts_for_block([compact], COMPACT_RECEIPTS_BLOCK_INDEX - 1) == [expand_receipt(compact)]
+
+
+def test_update_receipts_in_state_reads_both_forms():
+    full = generate_block_receipt({'index': 100})
+    compact = compact_receipt(generate_block_receipt({'index': 101}))
+    con = sqlite3.connect(NEWRL_DB)
+    cur = con.cursor()
+    try:
+        update_receipts_in_state(cur, {'index': 102, 'text': {'previous_block_receipts': [full, compact]}})
+        for receipt_data in [full['data'], get_receipt_data(compact)]:
+            assert check_receipt_exists_in_db(
+                receipt_data['block_index'],
+                receipt_data['block_hash'],
+                receipt_data['wallet_address'],
+                cur)
+    finally:
+        con.rollback()
+        con.close()
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from ..codes.secp256k1 import CURVE_ORDER, EcdsaBackend, der_to_raw_signature, get_available_backends, normalize_signature, raw_to_der_signature
+
+
+# Receipts signed by nodes on the chain. The first signature has a high S value
+CHAIN_RECEIPTS = [
+    {
+        'data': {
+            'block_index': 8394,
+            'block_hash': '3bf716948c7bd307090db0151d0a4e619563a71bc40907fde70636d8fcb8cab9',
+            'vote': 9,
+            'timestamp': 1661510690000,
+            'wallet_address': '0x70a1bc5faa2c6d996ece06a5519ecdfa0a1ad77c'
+        },
+        'public_key': 'c120b62c62616d783e10d57946a38e810d594856654f8d3a5c88fc0e69c94e4822eaa198f070ead36fb8308b26e4c3f01a87ae3543ac63aefdeb0862071f5775',
+        'signature': 'a620df236f310ad126a5b176ea55ca031fa831a9b17893496e10a8df7fbd1c9eb2647d167cc3b08485aa1e0709d067017e6b5e86600afe274d932f0daee5b889'
+    },
+    {
+        'data': {
+            'block_index': 8378,
+            'block_hash': '688e173112ee890e923e6124789616720c12a556eda8eb6f114e17287a0a968d',
+            'vote': 9,
+            'timestamp': 1661510144000,
+            'wallet_address': '0x97694d38c5c8ca9c219bdaa3411c7955bbef7568'
+        },
+        'public_key': '17e818d033cf767953b756291eb76e64f9ac6b8998195d9ad74273ba694ee1e5c089d52aa9ab70ece8993c0267be518a5caa5dd097f6a61a37752edc60a93fba',
+        'signature': 'e77a7d2666f7fafa34a83f5e03f1a14149ce59b8b8e4734677e1640b25e49be0436e1d01b0adbdb516414ce3f621deffaf2a48a4fe11825cd3dac0c4b1e956c3'
+    },
+]
+
+PRIVATE_KEY = bytes.fromhex('a1' * 32)
+
+BACKENDS = get_available_backends()
+
+
+@pytest.mark.parametrize('backend', BACKENDS, ids=lambda b: b.name)
+def test_backend_verifies_chain_signatures(backend):
+    for receipt in CHAIN_RECEIPTS:
+        message = json.dumps(receipt['data']).encode()
+        public_key = bytes.fromhex(receipt['public_key'])
+        signature = bytes.fromhex(receipt['signature'])
+        assert backend.verify(public_key, signature, message)
+        assert backend.verify_loaded(
+            backend.precompute_public_key(backend.load_public_key(public_key)), signature, message)
+        assert not backend.verify(public_key, signature, message + b' ')
+        assert not backend.verify(public_key, signature[:-1], message)
+
+
+@pytest.mark.parametrize('backend', BACKENDS, ids=lambda b: b.name)
+def test_backends_agree_on_keys_and_signatures(backend):
+    message = b'{"vote": 1}'
+    public_key = backend.derive_public_key(PRIVATE_KEY)
+    assert public_key == EcdsaBackend().derive_public_key(PRIVATE_KEY)
+
+    signature = backend.sign(PRIVATE_KEY, message)
+    assert len(signature) == 64
+    for other in BACKENDS:
+        assert other.verify(public_key, signature, message)
+
+
+def test_signature_encoding():
+    signature = bytes.fromhex(CHAIN_RECEIPTS[0]['signature'])
+    assert der_to_raw_signature(raw_to_der_signature(signature)) == signature
+
+    normalized = normalize_signature(signature)
+    assert normalized[:32] == signature[:32]
+    assert int.from_bytes(normalized[32:], 'big') == CURVE_ORDER - int.from_bytes(signature[32:], 'big')
+    assert normalize_signature(normalized) == normalized
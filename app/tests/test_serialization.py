@@ -0,0 +1,73 @@
+import copy
+import hashlib
+import json
+import pickle
+
+from app.codes.crypto import calculate_hash
+from app.codes.serialization import TrackedDict, digest, encode, track
+
+
+def get_block():
+    return {
+        'index': 10,
+        'timestamp': 1660000000000,
+        'text': {
+            'transactions': [
+                {'transaction': {'trans_code': 'abc', 'fee': 1}, 'signatures': []},
+            ],
+            'previous_block_receipts': [],
+        },
+        'previous_hash': '00' * 32,
+    }
+
+
+def test_encoding_matches_json():
+    block = get_block()
+    tracked = track(get_block())
+    assert encode(tracked) == json.dumps(block).encode()
+    assert encode(tracked, sort_keys=True) == json.dumps(block, sort_keys=True).encode()
+    expected_hash = hashlib.sha256(json.dumps(block, sort_keys=True).encode()).hexdigest()
+    assert digest(tracked) == expected_hash
+    assert calculate_hash(block) == expected_hash
+    assert calculate_hash(tracked) == expected_hash
+
+
+def test_encoding_cached_until_nested_mutation():
+    block = track(get_block())
+    encoded = encode(block)
+    assert encode(block) is encoded
+    old_hash = digest(block)
+
+    block['text']['transactions'][0]['transaction']['fee'] = 2
+    assert encode(block) is not encoded
+    assert digest(block) != old_hash
+    assert digest(block) == calculate_hash(json.loads(encode(block)))
+
+    block['text']['transactions'].append({'transaction': {'trans_code': 'def'}})
+    assert json.loads(encode(block))['text']['transactions'][1]['transaction']['trans_code'] == 'def'
+    block['text']['transactions'][1]['transaction']['fee'] = 3
+    assert json.loads(encode(block))['text']['transactions'][1]['transaction']['fee'] == 3
+
+
+def test_copies_are_independent():
+    block = track(get_block())
+    old_hash = digest(block)
+    copied = copy.deepcopy(block)
+    assert copied == block
+    assert digest(copied) == old_hash
+    copied['text']['previous_block_receipts'].append({'data': {}})
+    assert digest(block) == old_hash
+    assert digest(copied) != old_hash
+
+    nested = track({'amounts': {1: (2, 3)}, 'items': [[1, 2]]})
+    copied = copy.deepcopy(nested)
+    assert copied == nested
+    assert copied['amounts'][1] == (2, 3)
+    copied['items'][0].append(3)
+    assert nested['items'] == [[1, 2]]
+    assert json.loads(encode(copied))['items'] == [[1, 2, 3]]
+
+    unpickled = pickle.loads(pickle.dumps(block))
+    assert type(unpickled) is dict
+    assert not isinstance(unpickled, TrackedDict)
+    assert unpickled == block
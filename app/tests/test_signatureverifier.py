@@ -0,0 +1,47 @@
+import json
+
+import ecdsa
+
+from ..codes.crypto import VerifyingKeyCache
+from ..codes.signatureverifier import get_signature_key, verify_signatures
+
+
+def make_task(signing_key, data, signed_data=None):
+    message = json.dumps(data).encode()
+    signature = signing_key.sign(json.dumps(signed_data or data).encode()).hex()
+    return (message, signing_key.get_verifying_key().to_string().hex(), signature)
+
+
+def test_verify_signatures_in_pool_and_in_process():
+    signing_key = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
+    tasks = [make_task(signing_key, {'trans_code': str(i)}) for i in range(8)]
+    tasks.append(make_task(signing_key, {'trans_code': 'tampered'}, signed_data={'trans_code': 'other'}))
+    tasks.append((b'{}', 'nothex', 'nothex'))
+
+    for max_workers in [1, 2]:
+        results = verify_signatures(tasks, max_workers=max_workers)
+        assert len(results) == 10
+        assert all(results[get_signature_key(*task)] for task in tasks[:8])
+        assert not results[get_signature_key(*tasks[8])]
+        assert not results[get_signature_key(*tasks[9])]
+
+
+def test_verifying_key_cache():
+    cache = VerifyingKeyCache(max_size=2, precompute_hits=2)
+    signing_keys = [ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1) for _ in range(3)]
+    public_keys = [k.get_verifying_key().to_string() for k in signing_keys]
+
+    first = cache.get(public_keys[0])
+    assert cache.get(public_keys[0]) is first
+    precomputed = cache.get(public_keys[0])
+    assert cache.backend.verify_loaded(precomputed, signing_keys[0].sign(b'message'), b'message')
+    cache.get(public_keys[1])
+    cache.get(public_keys[2])
+
+    stats = cache.get_stats()
+    assert stats['size'] == 2
+    assert stats['hits'] == 2
+    assert stats['misses'] == 3
+    assert stats['hit_rate'] == 0.4
+    assert stats['precomputed'] == 1
+    assert public_keys[0] not in cache.keys
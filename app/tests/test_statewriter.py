@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+from app.codes.statewriter import PRIORITY_CANDIDATE, PRIORITY_CONSENSUS, PRIORITY_SYNC, StateWriter
+from app.codes.storage import close_connections, write_transaction
+
+
+def block_writer(writer):
+    """Occupies the writer thread until the returned event is set"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def wait():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=writer.submit, args=('wait', wait))
+    thread.start()
+    started.wait(5)
+    return release, thread
+
+
+def submit_in_thread(writer, name, function, priority):
+    thread = threading.Thread(target=writer.submit, args=(name, function), kwargs={'priority': priority})
+    thread.start()
+    return thread
+
+
+def wait_for_queue_depth(writer, depth):
+    for _ in range(500):
+        if writer.queue.qsize() >= depth:
+            return
+        time.sleep(0.01)
+
+
+def test_state_writer_runs_by_priority():
+    writer = StateWriter()
+    release, blocking_thread = block_writer(writer)
+    order = []
+    commands = [
+        ('dry_run_candidate', lambda: order.append('candidate'), PRIORITY_CANDIDATE),
+        ('sync_block', lambda: order.append('sync 1'), PRIORITY_SYNC),
+        ('sync_block', lambda: order.append('sync 2'), PRIORITY_SYNC),
+        ('add_block', lambda: order.append('consensus'), PRIORITY_CONSENSUS),
+    ]
+    threads = []
+    for name, function, priority in commands:
+        threads.append(submit_in_thread(writer, name, function, priority))
+        wait_for_queue_depth(writer, len(threads))
+    release.set()
+    for thread in threads + [blocking_thread]:
+        thread.join(5)
+    assert order == ['consensus', 'sync 1', 'sync 2', 'candidate']
+
+    stats = writer.get_stats()
+    assert stats['max_queue_depth'] == len(threads)
+    assert stats['commands']['sync_block']['count'] == 2
+    assert stats['commands']['add_block']['max_wait_ms'] > 0
+
+
+def test_state_writer_returns_results_and_raises_errors():
+    writer = StateWriter()
+    assert writer.submit('add', lambda a, b: a + b, 1, 2) == 3
+
+    def fail():
+        raise ValueError('bad block')
+    with pytest.raises(ValueError):
+        writer.submit('add_block', fail)
+    assert writer.get_stats()['commands']['add_block']['failures'] == 1
+
+
+
+def test_state_writer_refuses_submits_which_would_wait_on_themselves(tmp_path):
+    writer = StateWriter()
+    with pytest.raises(RuntimeError):
+        writer.submit('outer', lambda: writer.submit('inner', lambda: 'done'))
+
+    db_path = f'{tmp_path}/test.db'
+    with write_transaction(db_path):
+        with pytest.raises(RuntimeError):
+            writer.submit('add_block', lambda: None)
+    assert writer.submit('add_block', lambda: 'done') == 'done'
+    close_connections(db_path)
+
+
+def test_state_writer_submit_times_out():
+    writer = StateWriter()
+    release, blocking_thread = block_writer(writer)
+    with pytest.raises(FutureTimeoutError):
+        writer.submit('add_block', lambda: None, timeout=0.1)
+    release.set()
+    blocking_thread.join(5)
+    assert writer.submit('add_block', lambda: 'done', timeout=5) == 'done'
+
+
+def test_state_writer_queue_is_bounded():
+    writer = StateWriter(max_queue_size=1, submit_timeout=0.1)
+    release, blocking_thread = block_writer(writer)
+    queued_thread = submit_in_thread(writer, 'sync_block', lambda: None, PRIORITY_SYNC)
+    wait_for_queue_depth(writer, 1)
+    with pytest.raises(queue.Full):
+        writer.submit('sync_block', lambda: None)
+    release.set()
+    queued_thread.join(5)
+    blocking_thread.join(5)
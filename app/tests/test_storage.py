@@ -0,0 +1,132 @@
+import os
+import queue
+import sqlite3
+import threading
+
+import pytest
+
+from app.codes.storage import close_connections, get_connection, get_cursor, get_file_id, read_snapshot, restore_database, write_transaction
+
+
+def create_db(db_path):
+    with write_transaction(db_path) as cur:
+        cur.execute('CREATE TABLE IF NOT EXISTS items (id integer PRIMARY KEY, name text)')
+
+
+def test_storage_profile_pragmas(tmp_path):
+    db_path = f'{tmp_path}/test.db'
+    create_db(db_path)
+    cur = get_cursor(db_path)
+    assert cur.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert cur.execute('PRAGMA temp_store').fetchone()[0] == 2
+    close_connections(db_path)
+
+
+def test_read_connection_reused_per_thread(tmp_path):
+    db_path = f'{tmp_path}/test.db'
+    create_db(db_path)
+    assert get_connection(db_path) is get_connection(db_path)
+
+    other_connections = []
+    thread = threading.Thread(target=lambda: other_connections.append(get_connection(db_path)))
+    thread.start()
+    thread.join()
+    assert other_connections[0] is not get_connection(db_path)
+    close_connections(db_path)
+
+
+def test_write_transaction_commits_and_rolls_back(tmp_path):
+    db_path = f'{tmp_path}/test.db'
+    create_db(db_path)
+    with write_transaction(db_path) as cur:
+        cur.execute("INSERT INTO items (id, name) VALUES (1, 'a')")
+        with write_transaction(db_path) as inner_cur:
+            inner_cur.execute("INSERT INTO items (id, name) VALUES (2, 'b')")
+        # The inner transaction does not commit on its own
+        assert get_cursor(db_path).execute('SELECT count(*) FROM items').fetchone()[0] == 0
+    assert get_cursor(db_path).execute('SELECT count(*) FROM items').fetchone()[0] == 2
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with write_transaction(db_path) as cur:
+            cur.execute("INSERT INTO items (id, name) VALUES (3, 'c')")
+            cur.execute("INSERT INTO items (id, name) VALUES (1, 'a')")
+    assert get_cursor(db_path).execute('SELECT count(*) FROM items').fetchone()[0] == 2
+    close_connections(db_path)
+
+
+def test_connections_reopen_when_file_replaced(tmp_path):
+    db_path = f'{tmp_path}/test.db'
+    create_db(db_path)
+    with write_transaction(db_path) as cur:
+        cur.execute("INSERT INTO items (id, name) VALUES (1, 'a')")
+    cur = get_cursor(db_path, row_factory=sqlite3.Row)
+    assert dict(cur.execute('SELECT * FROM items').fetchone()) == {'id': 1, 'name': 'a'}
+
+    replacement_path = f'{tmp_path}/replacement.db'
+    con = sqlite3.connect(replacement_path)
+    con.execute('CREATE TABLE items (id integer PRIMARY KEY, name text)')
+    con.execute("INSERT INTO items (id, name) VALUES (5, 'e')")
+    con.commit()
+    con.close()
+    close_connections(db_path)
+    os.replace(replacement_path, db_path)
+
+    assert get_cursor(db_path).execute('SELECT id FROM items').fetchall() == [(5, )]
+    with write_transaction(db_path) as cur:
+        cur.execute("INSERT INTO items (id, name) VALUES (6, 'f')")
+    assert get_cursor(db_path).execute('SELECT count(*) FROM items').fetchone()[0] == 2
+    close_connections(db_path)
+
+
+def test_read_snapshot_is_pinned_and_read_only(tmp_path):
+    db_path = f'{tmp_path}/test.db'
+    create_db(db_path)
+    with write_transaction(db_path) as cur:
+        cur.execute("INSERT INTO items (id, name) VALUES (1, 'a')")
+
+    with read_snapshot(db_path) as cur:
+        assert cur.execute('SELECT count(*) FROM items').fetchone()[0] == 1
+        with write_transaction(db_path) as write_cur:
+            write_cur.execute("INSERT INTO items (id, name) VALUES (2, 'b')")
+        assert cur.execute('SELECT count(*) FROM items').fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            cur.execute("INSERT INTO items (id, name) VALUES (3, 'c')")
+    with read_snapshot(db_path) as cur:
+        assert cur.execute('SELECT count(*) FROM items').fetchone()[0] == 2
+    close_connections(db_path)
+
+
+def test_restore_database_in_place(tmp_path):
+    db_path = f'{tmp_path}/test.db'
+    create_db(db_path)
+    with write_transaction(db_path) as cur:
+        cur.execute("INSERT INTO items (id, name) VALUES (1, 'a')")
+    source_path = f'{tmp_path}/source.db'
+    con = sqlite3.connect(source_path)
+    con.execute('CREATE TABLE items (id integer PRIMARY KEY, name text)')
+    con.execute("INSERT INTO items (id, name) VALUES (5, 'e')")
+    con.commit()
+    con.close()
+
+    # Another thread keeps its read connection across the restore
+    requests = queue.Queue()
+    results = queue.Queue()
+    def read_items():
+        while requests.get() == 'read':
+            results.put(get_cursor(db_path).execute('SELECT id FROM items').fetchall())
+    reader = threading.Thread(target=read_items)
+    reader.start()
+    file_id = get_file_id(db_path)
+
+    requests.put('read')
+    assert results.get(timeout=5) == [(1, )]
+    restore_database(source_path, db_path)
+    requests.put('read')
+    assert results.get(timeout=5) == [(5, )]
+    requests.put('stop')
+    reader.join(5)
+
+    assert get_file_id(db_path) == file_id
+    restore_database(None, db_path)
+    assert get_cursor(db_path).execute("SELECT count(*) FROM sqlite_master").fetchone()[0] == 0
+    close_connections(db_path)
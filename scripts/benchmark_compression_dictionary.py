@@ -0,0 +1,63 @@
+"""Compares bytes on the wire with and without a preset compression dictionary
+
+Usage: python scripts/benchmark_compression_dictionary.py [block.json ...]
+
+Reads the local block archive when no files are given. With more than one
+block a dictionary is trained on the older half and measured on the newer
+half, otherwise the shipped dictionary is used.
+"""
+import glob
+import json
+import os
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.codes.p2p import packager
+from app.constants import BLOCK_ARCHIVE_PATH, COMPRESSION_DICTIONARY_VERSION
+from scripts.build_compression_dictionary import get_payloads, load_blocks
+
+
+TRAINED_DICTIONARY_VERSION = 255
+
+
+def get_payload_kind(payload):
+    if 'receipt' in payload:
+        return 'receipt'
+    if 'transaction' in payload:
+        return 'transaction'
+    return 'block'
+
+
+def measure(payloads, dictionary_version):
+    totals = {}
+    for payload in payloads:
+        sizes = totals.setdefault(get_payload_kind(payload), [0, 0, 0, 0])
+        sizes[0] += 1
+        sizes[1] += len(zlib.compress(json.dumps(payload).encode()))
+        sizes[2] += len(packager.encode_wire_payload(payload, dictionary_version=0))
+        sizes[3] += len(packager.encode_wire_payload(payload, dictionary_version=dictionary_version))
+    return totals
+
+
+if __name__ == '__main__':
+    file_names = sys.argv[1:] or sorted(glob.glob(f'{BLOCK_ARCHIVE_PATH}block_*.json'))
+    blocks = load_blocks(file_names)
+    if len(blocks) == 0:
+        print('No blocks found')
+        sys.exit(1)
+    if len(blocks) > 1:
+        training_blocks = blocks[:len(blocks) // 2]
+        blocks = blocks[len(blocks) // 2:]
+        training_payloads = [p for block in training_blocks for p in get_payloads(block)]
+        packager.compression_dictionaries[TRAINED_DICTIONARY_VERSION] = \
+            packager.build_compression_dictionary(training_payloads)
+        dictionary_version = TRAINED_DICTIONARY_VERSION
+    else:
+        dictionary_version = COMPRESSION_DICTIONARY_VERSION
+
+    payloads = [p for block in blocks for p in get_payloads(block)]
+    print(f"{'payload':<12}{'count':>8}{'zlib-json':>12}{'wire':>12}{'wire+dict':>12}")
+    for kind, (count, json_bytes, wire_bytes, dictionary_bytes) in measure(payloads, dictionary_version).items():
+        print(f'{kind:<12}{count:>8}{json_bytes / count:>12.0f}{wire_bytes / count:>12.0f}{dictionary_bytes / count:>12.0f}')
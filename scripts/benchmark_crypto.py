@@ -0,0 +1,44 @@
+"""Compares sign, verify and derive throughput of the installed secp256k1 backends
+
+Usage: python scripts/benchmark_crypto.py [iterations]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.codes.secp256k1 import get_available_backends
+
+
+def measure(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed
+
+
+def benchmark(backend, iterations):
+    private_key = os.urandom(32)
+    public_key = backend.derive_public_key(private_key)
+    message = json.dumps({'block_index': 1, 'block_hash': '00' * 32, 'vote': 1}).encode()
+    signature = backend.sign(private_key, message)
+    loaded_key = backend.load_public_key(public_key)
+    precomputed_key = backend.precompute_public_key(backend.load_public_key(public_key))
+    return {
+        'derive': measure(lambda: backend.derive_public_key(private_key), iterations),
+        'sign': measure(lambda: backend.sign(private_key, message), iterations),
+        'verify': measure(lambda: backend.verify(public_key, signature, message), iterations),
+        'verify_loaded': measure(lambda: backend.verify_loaded(loaded_key, signature, message), iterations),
+        'verify_precomputed': measure(lambda: backend.verify_loaded(precomputed_key, signature, message), iterations),
+    }
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{'backend':<12}{'operation':<22}{'ops/s':>12}")
+    for backend in get_available_backends():
+        for operation, rate in benchmark(backend, iterations).items():
+            print(f'{backend.name:<12}{operation:<22}{rate:>12.0f}')
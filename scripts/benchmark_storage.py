@@ -0,0 +1,65 @@
+"""Compares a connection per query with the shared per-thread read connection
+
+Usage: python scripts/benchmark_storage.py [iterations]
+
+Runs the lookups API requests make most often against a scratch database.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.codes.storage import close_connections, get_cursor, write_transaction
+
+
+WALLET_COUNT = 10000
+
+QUERIES = {
+    'last block': ('SELECT block_index, hash, timestamp FROM blocks ORDER BY block_index DESC LIMIT 1', lambda i: ()),
+    'wallet key': ('SELECT wallet_public FROM wallets WHERE wallet_address=?', lambda i: (f'0x{i % WALLET_COUNT:040x}', )),
+}
+
+
+def create_db(db_path):
+    with write_transaction(db_path) as cur:
+        cur.execute('CREATE TABLE blocks (block_index integer PRIMARY KEY, hash text, timestamp integer)')
+        cur.execute('CREATE TABLE wallets (wallet_address text PRIMARY KEY, wallet_public text)')
+        cur.executemany('INSERT INTO blocks VALUES (?, ?, ?)', [
+            (i, os.urandom(32).hex(), 1661510690000 + i) for i in range(1, 1001)])
+        cur.executemany('INSERT INTO wallets VALUES (?, ?)', [
+            (f'0x{i:040x}', os.urandom(64).hex()) for i in range(WALLET_COUNT)])
+
+
+def query_with_new_connection(db_path, query, params):
+    con = sqlite3.connect(db_path)
+    cur = con.cursor()
+    result = cur.execute(query, params).fetchone()
+    con.close()
+    return result
+
+
+def query_with_shared_connection(db_path, query, params):
+    return get_cursor(db_path).execute(query, params).fetchone()
+
+
+def measure(function, db_path, query, get_params, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        function(db_path, query, get_params(i))
+    return (time.perf_counter() - start) / iterations * 1000000
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'newrl.db')
+        create_db(db_path)
+        print(f"{'query':<12}{'connect us':>14}{'shared us':>14}{'speedup':>10}")
+        for name, (query, get_params) in QUERIES.items():
+            connect_us = measure(query_with_new_connection, db_path, query, get_params, iterations)
+            shared_us = measure(query_with_shared_connection, db_path, query, get_params, iterations)
+            print(f'{name:<12}{connect_us:>14.1f}{shared_us:>14.1f}{connect_us / shared_us:>9.1f}x')
+        close_connections(db_path)
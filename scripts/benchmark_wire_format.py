@@ -0,0 +1,118 @@
+"""Compares size and encode/decode time of the compact wire format and zlib JSON
+
+Usage: python scripts/benchmark_wire_format.py [iterations]
+"""
+import base64
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.codes.p2p.packager import decode_wire_payload, encode_wire_payload
+
+
+def random_address():
+    return '0x' + os.urandom(20).hex()
+
+
+def random_signature():
+    return base64.b64encode(os.urandom(64)).decode()
+
+
+def get_receipt(block_index):
+    return {
+        'data': {
+            'block_index': block_index,
+            'block_hash': os.urandom(32).hex(),
+            'vote': 1,
+            'timestamp': 1661510144000,
+            'wallet_address': random_address(),
+        },
+        'public_key': random_signature(),
+        'signature': random_signature(),
+    }
+
+
+def get_transaction(i):
+    wallet_address = random_address()
+    return {
+        'transaction': {
+            'timestamp': 1661510640000 + i,
+            'trans_code': os.urandom(20).hex(),
+            'type': 5,
+            'currency': 'NWRL',
+            'fee': 0.0,
+            'descr': 'Transfer',
+            'valid': 1,
+            'specific_data': {
+                'wallet1': wallet_address,
+                'wallet2': random_address(),
+                'asset1_code': 'NWRL',
+                'asset2_code': '',
+                'asset1_number': i * 1000,
+                'asset2_number': 0,
+            },
+        },
+        'signatures': [{'wallet_address': wallet_address, 'msgsign': random_signature()}],
+    }
+
+
+def get_block_payload(transaction_count, receipt_count):
+    committee = [random_address() for _ in range(10)]
+    return {
+        'index': 100,
+        'hash': os.urandom(32).hex(),
+        'data': {
+            'index': 100,
+            'timestamp': 1661510690000,
+            'proof': 0,
+            'status': 1,
+            'text': {
+                'transactions': [get_transaction(i) for i in range(transaction_count)],
+                'previous_block_receipts': [get_receipt(99) for _ in range(receipt_count)],
+            },
+            'creator_wallet': committee[0],
+            'expected_miner': committee[0],
+            'committee': committee,
+            'previous_hash': os.urandom(32).hex(),
+        },
+        'receipts': [get_receipt(100)],
+        'software_version': '1.1.1',
+        'peers_already_broadcasted': [],
+    }
+
+
+def measure(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def benchmark(payload, iterations):
+    json_payload = zlib.compress(json.dumps(payload).encode())
+    wire_payload = encode_wire_payload(payload)
+    return {
+        'zlib-json': (
+            len(json_payload),
+            measure(lambda: zlib.compress(json.dumps(payload).encode()), iterations),
+            measure(lambda: json.loads(zlib.decompress(json_payload)), iterations),
+        ),
+        'wire': (
+            len(wire_payload),
+            measure(lambda: encode_wire_payload(payload), iterations),
+            measure(lambda: decode_wire_payload(wire_payload), iterations),
+        ),
+    }
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"{'transactions':>12}{'format':>12}{'bytes':>10}{'encode ms':>12}{'decode ms':>12}")
+    for transaction_count in [0, 100, 1000]:
+        payload = get_block_payload(transaction_count, receipt_count=10)
+        for name, (size, encode_ms, decode_ms) in benchmark(payload, iterations).items():
+            print(f'{transaction_count:>12}{name:>12}{size:>10}{encode_ms:>12.3f}{decode_ms:>12.3f}')
@@ -0,0 +1,58 @@
+"""Builds a new wire format compression dictionary from archived blocks
+
+Usage: python scripts/build_compression_dictionary.py [block.json ...]
+
+Reads the local block archive when no files are given. The dictionary is
+written as the next version in app/codes/p2p/dictionaries. Nodes decode
+every dictionary they ship, so set COMPRESSION_DICTIONARY_VERSION to the new
+version only once most peers run software that includes it.
+"""
+import glob
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.codes.p2p.packager import DICTIONARY_FILE_PATTERN, DICTIONARY_PATH, build_compression_dictionary, load_compression_dictionaries
+from app.constants import BLOCK_ARCHIVE_PATH
+
+
+def get_payloads(block):
+    """Splits a block into the payloads peers send each other"""
+    payloads = [block]
+    block_data = block['data'] if 'data' in block else block
+    text = block_data.get('text', {})
+    for transaction in text.get('transactions', []):
+        payloads.append(transaction)
+    for receipt in text.get('previous_block_receipts', []):
+        payloads.append({'receipt': receipt})
+    for receipt in block.get('receipts', []):
+        payloads.append({'receipt': receipt})
+    return payloads
+
+
+def load_blocks(file_names):
+    blocks = []
+    for file_name in file_names:
+        with open(file_name, 'r') as _file:
+            blocks.append(json.load(_file))
+    return blocks
+
+
+if __name__ == '__main__':
+    file_names = sys.argv[1:] or sorted(glob.glob(f'{BLOCK_ARCHIVE_PATH}block_*.json'))
+    if len(file_names) == 0:
+        print('No blocks found')
+        sys.exit(1)
+    payloads = []
+    for block in load_blocks(file_names):
+        payloads.extend(get_payloads(block))
+    dictionary = build_compression_dictionary(payloads)
+
+    version = max(load_compression_dictionaries().keys(), default=0) + 1
+    os.makedirs(DICTIONARY_PATH, exist_ok=True)
+    file_name = os.path.join(DICTIONARY_PATH, DICTIONARY_FILE_PATTERN.format(version))
+    with open(file_name, 'wb') as _file:
+        _file.write(dictionary)
+    print(f'Wrote {len(dictionary)} byte dictionary version {version} from {len(payloads)} payloads to {file_name}')
@@ -0,0 +1,59 @@
+"""Reports the queries of a read workload which scan whole tables
+
+Usage: python scripts/index_advisor.py [wallet count]
+
+Runs the block sync, committee and query API reads against the node
+database, then runs EXPLAIN QUERY PLAN on every statement they issued.
+Queries with scans are listed first. Add indexes for them as a numbered
+migration in app/migrations/migrations and the query to HOT_QUERIES.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.codes.blockchain import get_blocks_in_range, get_last_block_index
+from app.codes.chainscanner import get_block, get_wallet
+from app.codes.committeemanager import get_eligible_miners
+from app.codes.indexadvisor import HOT_QUERIES, QueryRecorder, advise
+from app.codes.scoremanager import get_incoming_trust_scores, get_outgoing_trust_scores
+from app.codes.storage import get_cursor
+
+
+def get_workload(wallet_count):
+    last_block_index = get_last_block_index()
+    wallets = [row[0] for row in get_cursor().execute(
+        'SELECT wallet_address FROM wallets LIMIT ?', (wallet_count, )).fetchall()]
+    workload = [
+        ('blocks in range', lambda: get_blocks_in_range(max(1, last_block_index - 100), last_block_index + 1)),
+        ('last block', lambda: get_block(last_block_index)),
+        ('eligible miners', get_eligible_miners),
+    ]
+    for wallet in wallets:
+        workload.append(('wallet', lambda wallet=wallet: get_wallet(wallet)))
+        workload.append(('incoming trust', lambda wallet=wallet: get_incoming_trust_scores(wallet)))
+        workload.append(('outgoing trust', lambda wallet=wallet: get_outgoing_trust_scores(wallet)))
+    for name, (query, params) in HOT_QUERIES.items():
+        workload.append((name, lambda query=query, params=params: get_cursor().execute(query, params).fetchall()))
+    return workload
+
+
+if __name__ == '__main__':
+    wallet_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    workload = get_workload(wallet_count)
+    with QueryRecorder() as recorder:
+        for name, run in workload:
+            try:
+                run()
+            except Exception as e:
+                print(f'{name} failed: {e}')
+    report = advise(recorder.queries)
+    for entry in report:
+        status = 'SCAN' if entry['scans'] else ('ERROR' if entry['error'] else 'ok')
+        print(f"{status:<6}{entry['count']:>6}  {entry['query'][:120]}")
+        for step in entry['scans']:
+            print(f'{"":>14}{step}')
+        if entry['error']:
+            print(f"{'':>14}{entry['error']}")
+    scans = sum(1 for entry in report if entry['scans'])
+    print(f'{len(report)} queries, {scans} with scans')